@@ -0,0 +1,73 @@
+"""Benchmark ClassificationResult encoding: a Class message per score vs response_codec.ClassificationEncoder
+
+The protobuf runtime in use matters most, see google.protobuf.internal.api_implementation.Type(); with the pure
+python runtime both are bound by message construction.
+"""
+from __future__ import print_function
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from google.protobuf.internal import api_implementation
+
+from mlfmodelserver.response_codec import ClassificationEncoder, score_matrix
+from tensorflow_serving.apis import classification_pb2 as tensorflow__serving_dot_apis_dot_classification__pb2
+
+
+def message_per_score(outputs, rows):
+    response = tensorflow__serving_dot_apis_dot_classification__pb2.ClassificationResponse()
+    classifications = []
+    for idx in range(rows):
+        classes = []
+        classification = tensorflow__serving_dot_apis_dot_classification__pb2.Classifications()
+        for k, v in outputs.items():
+            class_data = tensorflow__serving_dot_apis_dot_classification__pb2.Class()
+            class_data.label = "Class-" + k
+            class_data.score = v[idx]
+            classes.append(class_data)
+        classification.classes.extend(classes)
+        classifications.append(classification)
+    response.result.classifications.extend(classifications)
+    return response
+
+
+def bulk(encoder, outputs):
+    response = tensorflow__serving_dot_apis_dot_classification__pb2.ClassificationResponse()
+    encoder.encode(*score_matrix(outputs), response.result)
+    return response
+
+
+def time_call(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(args):
+    print("protobuf runtime: {}".format(api_implementation.Type()))
+    print("{:>8} {:>8} {:>16} {:>12} {:>12} {:>9}".format('rows', 'classes', 'per message ms', 'bulk ms',
+                                                          'top{} ms'.format(args.top_k), 'speedup'))
+    for rows in args.rows:
+        scores = np.random.rand(rows, args.classes)
+        outputs = {'label_{}'.format(index): pd.Series(scores[:, index]) for index in range(args.classes)}
+        encoder = ClassificationEncoder()
+        top_k_encoder = ClassificationEncoder(top_k=args.top_k)
+        baseline = time_call(lambda: message_per_score(outputs, rows), args.repeat)
+        encoded = time_call(lambda: bulk(encoder, outputs), args.repeat)
+        top_k = time_call(lambda: bulk(top_k_encoder, outputs), args.repeat)
+        print("{:>8} {:>8} {:>16.2f} {:>12.2f} {:>12.2f} {:>8.1f}x".format(rows, args.classes, baseline * 1e3,
+                                                                           encoded * 1e3, top_k * 1e3,
+                                                                           baseline / encoded))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', nargs='+', type=int, default=[1, 100, 10000])
+    parser.add_argument('--classes', type=int, default=20)
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    run(parser.parse_args())
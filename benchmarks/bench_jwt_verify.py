@@ -0,0 +1,81 @@
+"""Benchmark RS256 verification of a bearer token with the rsa and the cryptography verifier
+
+Reports verifications per second of JWTTokenManager._validate_token_against_public_key with parsed keys, on
+one thread and on several threads, where the rsa backend is limited by the GIL.
+"""
+from __future__ import print_function
+import argparse
+import base64
+import json
+import threading
+import time
+
+import rsa
+from pyasn1.codec.der import encoder
+from pyasn1.type import univ
+from rsa.asn1 import OpenSSLPubKey
+
+from mlpkitsecurity.token_utils import JWTTokenManager, cryptography_available, get_verifier, load_public_keys
+
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def public_key_pem(public_key):
+    """SubjectPublicKeyInfo PEM of an rsa.PublicKey, which rsa 3.x can read but not write"""
+    info = OpenSSLPubKey()
+    info['header']['oid'] = univ.ObjectIdentifier('1.2.840.113549.1.1.1')
+    info['header']['parameters'] = univ.Null('')
+    # the key is a BIT STRING read as an OCTET STRING, led by the count of unused bits
+    info['key'] = b'\x00' + public_key.save_pkcs1('DER')
+    return rsa.pem.save_pem(encoder.encode(info), 'PUBLIC KEY').decode('ascii')
+
+
+def make_token(key_bits):
+    public_key, private_key = rsa.newkeys(key_bits)
+    header = b64url(json.dumps({'alg': 'RS256', 'typ': 'JWT'}).encode('utf-8'))
+    payload = b64url(json.dumps({'zid': 'uaa', 'scope': ['bench'], 'exp': time.time() + 3600}).encode('utf-8'))
+    signature = rsa.sign((header + '.' + payload).encode('utf-8'), private_key, 'SHA-256')
+    return 'Bearer {}.{}.{}'.format(header, payload, b64url(signature)), public_key_pem(public_key)
+
+
+def measure(token_manager, token, keys, threads, duration):
+    counts = [0] * threads
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        while time.perf_counter() < deadline:
+            token_manager._validate_token_against_public_key(token, keys)
+            counts[index] += 1
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def run(args):
+    token, pem = make_token(args.key_bits)
+    backends = ['rsa', 'cryptography'] if cryptography_available() else ['rsa']
+    if not cryptography_available():
+        print("cryptography is not installed, only the rsa backend is measured")
+    print("{:>14} {:>8} {:>14} {:>12}".format('backend', 'threads', 'verify/s', 'us/verify'))
+    for name in backends:
+        verifier = get_verifier(name)
+        token_manager = JWTTokenManager(None, verifier=verifier)
+        keys = load_public_keys(pem, verifier=verifier)
+        for threads in args.threads:
+            rate = measure(token_manager, token, keys, threads, args.duration)
+            print("{:>14} {:>8} {:>14.0f} {:>12.1f}".format(name, threads, rate, 1e6 / rate))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--key-bits', type=int, default=2048)
+    parser.add_argument('--threads', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('--duration', type=float, default=2, help='seconds per measurement')
+    run(parser.parse_args())
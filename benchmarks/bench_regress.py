@@ -0,0 +1,78 @@
+"""Benchmark Servicer.Regress throughput at 1, 100 and 10k examples per request
+
+Runs the servicer in process with a linear model and token validation skipped, and reports the time spent
+decoding the examples, in the model and encoding the response, and the examples scored per second.
+"""
+from __future__ import print_function
+import argparse
+import time
+
+import numpy as np
+
+from mlfmodelserver import grpc_server, response_codec
+from mlfmodelserver.example_codec import ExampleDecoder
+from tensorflow_serving.apis import regression_pb2 as tensorflow__serving_dot_apis_dot_regression__pb2
+
+
+class LinearModel(object):
+    model_name = 'linear'
+
+    def __init__(self, features):
+        self.weights = np.random.rand(features).astype(np.float32)
+        self.names = ['f{}'.format(index) for index in range(features)]
+
+    def wrapper_regression_func(self, inputs):
+        return inputs[self.names].to_numpy() @ self.weights
+
+
+class BenchServicer(grpc_server.Servicer):
+    def _Validations(self, request, context):
+        return True
+
+
+def regression_request(examples, features):
+    request = tensorflow__serving_dot_apis_dot_regression__pb2.RegressionRequest()
+    request.model_spec.name = 'linear'
+    values = np.random.rand(examples, features).astype(np.float32).tolist()
+    for row in values:
+        feature_map = request.input.example_list.examples.add().features.feature
+        for index, value in enumerate(row):
+            feature_map['f{}'.format(index)].float_list.value.append(value)
+    return request
+
+
+def time_call(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(args):
+    model = LinearModel(args.features)
+    servicer = BenchServicer()
+    servicer.model = model
+    print("{:>9} {:>10} {:>10} {:>10} {:>10} {:>14}".format('examples', 'decode ms', 'model ms', 'encode ms',
+                                                           'total ms', 'examples/s'))
+    for examples in args.examples:
+        request = regression_request(examples, args.features)
+        decoder = ExampleDecoder()
+        frame = decoder.decode(request.input)
+        values = response_codec.regression_values(model.wrapper_regression_func(frame))
+        decode = time_call(lambda: decoder.decode(request.input), args.repeat)
+        predict = time_call(lambda: model.wrapper_regression_func(frame), args.repeat)
+        encode = time_call(lambda: response_codec.encode_regressions(
+            values, tensorflow__serving_dot_apis_dot_regression__pb2.RegressionResult()), args.repeat)
+        total = time_call(lambda: servicer.Regress(request, None), args.repeat)
+        print("{:>9} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f} {:>14.0f}".format(
+            examples, decode * 1e3, predict * 1e3, encode * 1e3, total * 1e3, examples / total))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--examples', nargs='+', type=int, default=[1, 100, 10000])
+    parser.add_argument('--features', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=3)
+    run(parser.parse_args())
@@ -0,0 +1,134 @@
+"""Benchmark the sync and the asyncio server at high connection counts
+
+Starts a python model server per mode with a model that sleeps to simulate slow calls, opens one channel per
+connection and keeps one Predict in flight on each. Reports throughput, latency percentiles, errors and the
+server's thread count and RSS under load.
+"""
+from __future__ import print_function
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import cloudpickle
+import grpc
+import numpy as np
+from grpc import aio
+
+from mlfmodelserver import runtime
+runtime.defer_tensorflow_import()
+from tensorflow_serving.apis import (
+    predict_pb2 as tensorflow__serving_dot_apis_dot_predict__pb2,
+    prediction_service_pb2_grpc as tensorflow__serving_dot_apis_dot_prediction_service__pb2__grpc
+)
+from mlfmodelserver.tensor_codec import encode_tensor
+
+MODEL_NAME = 'bench-model'
+
+
+def write_model(base_path, sleep_ms):
+    def predict(rows):
+        time.sleep(sleep_ms / 1000.0)
+        return [sum(row) for row in rows]
+
+    os.makedirs(os.path.join(base_path, '1'))
+    with open(os.path.join(base_path, '1', 'func.pkl'), 'wb') as func_file:
+        cloudpickle.dump(predict, func_file)
+    config_path = os.path.join(base_path, 'model_config.conf')
+    with open(config_path, 'w') as config_file:
+        config_file.write('model_config_list: {\n  config: {\n    name: "%s",\n    base_path: "%s",\n'
+                          '    model_platform: "python"\n  }\n}\n' % (MODEL_NAME, base_path))
+    return config_path
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def process_status(pid):
+    status = {}
+    with open('/proc/{}/status'.format(pid)) as status_file:
+        for line in status_file:
+            key, _, value = line.partition(':')
+            status[key] = value.strip()
+    return {'threads': int(status['Threads']), 'rss_mb': int(status['VmRSS'].split()[0]) / 1024.0}
+
+
+async def drive(port, connections, duration, pid):
+    request = tensorflow__serving_dot_apis_dot_predict__pb2.PredictRequest()
+    request.model_spec.name = MODEL_NAME
+    encode_tensor(np.ones((1, 8), dtype=np.float32), request.inputs['X'])
+    metadata = [('authorization', 'Bearer bench')]
+
+    channels = [aio.insecure_channel('127.0.0.1:{}'.format(port)) for _ in range(connections)]
+    latencies = []
+    errors = [0]
+    deadline = time.perf_counter() + duration
+
+    async def connection(channel):
+        stub = tensorflow__serving_dot_apis_dot_prediction_service__pb2__grpc.PredictionServiceStub(channel)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                await stub.Predict(request, metadata=metadata, timeout=60)
+                latencies.append(time.perf_counter() - start)
+            except grpc.RpcError:
+                errors[0] += 1
+
+    async def sample_status():
+        await asyncio.sleep(duration / 2)
+        return process_status(pid)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(sample_status(), *[connection(channel) for channel in channels])
+    elapsed = time.perf_counter() - start
+    for channel in channels:
+        await channel.close()
+
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    result = {
+        'requests_per_s': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'errors': errors[0]
+    }
+    result.update(results[0])
+    return result
+
+
+def run(args):
+    base_path = tempfile.mkdtemp(prefix='bench-server-modes-')
+    config_path = write_model(base_path, args.model_sleep_ms)
+    for mode in args.modes:
+        port = free_port()
+        env = dict(os.environ, MODELS_CONFIG_FILE_PATH=config_path, MODEL_CONTAINER_PORT=str(port),
+                   MODEL_CONTAINER_SERVER_MODE=mode, MLF_LITE_RUNTIME='true')
+        process = subprocess.Popen([sys.executable, '-m', 'mlfmodelserver.python_grpc_server'], env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            grpc.channel_ready_future(grpc.insecure_channel('127.0.0.1:{}'.format(port))).result(timeout=60)
+            for connections in args.connections:
+                result = asyncio.run(drive(port, connections, args.duration, process.pid))
+                result.update({'mode': mode, 'connections': connections})
+                print(json.dumps(result, sort_keys=True))
+        finally:
+            process.kill()
+            process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--modes', nargs='+', default=['sync', 'aio'])
+    parser.add_argument('--connections', nargs='+', type=int, default=[10, 100, 1000])
+    parser.add_argument('--duration', type=float, default=10, help='seconds per measurement')
+    parser.add_argument('--model-sleep-ms', type=float, default=5, help='simulated model latency')
+    run(parser.parse_args())
@@ -0,0 +1,88 @@
+"""Benchmark server cold start in the full and the lite runtime
+
+Reports the time and resident memory after importing the python model server, and, when a model config is
+given, the time until a freshly started server accepts connections and its idle RSS.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import grpc
+
+_IMPORT_PROBE = """
+import json, resource, time
+start = time.perf_counter()
+from mlfmodelserver import python_grpc_server
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+with open('/proc/self/status') as status:
+    for line in status:
+        if line.startswith('VmRSS:'):
+            rss_kb = int(line.split()[1])
+print(json.dumps({'import_s': elapsed, 'rss_mb': rss_kb / 1024.0}))
+"""
+
+
+def rss_mb(pid):
+    with open('/proc/{}/status'.format(pid)) as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024.0
+    return float('nan')
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def measure_import(env):
+    output = subprocess.check_output([sys.executable, '-c', _IMPORT_PROBE], env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def measure_server(env, model_config, timeout):
+    port = free_port()
+    env = dict(env, MODELS_CONFIG_FILE_PATH=model_config, MODEL_CONTAINER_PORT=str(port))
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'mlfmodelserver.python_grpc_server'], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        channel = grpc.insecure_channel('127.0.0.1:{}'.format(port))
+        grpc.channel_ready_future(channel).result(timeout=timeout)
+        ready = time.perf_counter() - start
+        # give the process a moment to settle before sampling the idle memory floor
+        time.sleep(1)
+        return {'ready_s': ready, 'idle_rss_mb': rss_mb(process.pid)}
+    finally:
+        process.kill()
+        process.wait()
+
+
+def run(args):
+    for mode in ('full', 'lite'):
+        env = dict(os.environ, MLF_LITE_RUNTIME='true' if mode == 'lite' else 'false')
+        imports = [measure_import(env) for _ in range(args.repeat)]
+        result = {
+            'import_s': min(sample['import_s'] for sample in imports),
+            'import_rss_mb': min(sample['rss_mb'] for sample in imports)
+        }
+        if args.model_config:
+            result.update(measure_server(env, args.model_config, args.timeout))
+        print(mode, json.dumps(result, sort_keys=True))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=3, help='import measurements per mode, the best is kept')
+    parser.add_argument('--model-config', help='model config file; also measures time until the server is ready')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds to wait for the server')
+    run(parser.parse_args())
@@ -0,0 +1,95 @@
+"""Benchmark requests per second on one connection: unary Predict vs StreamPredict
+
+Starts a python model server, then sends single row PredictRequests over one channel, first as unary calls
+one after the other, then as one stream; and for comparison as unary calls with several in flight.
+"""
+from __future__ import print_function
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent import futures
+
+import grpc
+import numpy as np
+
+from mlfmodelserver import runtime
+runtime.defer_tensorflow_import()
+from tensorflow_serving.apis import (
+    predict_pb2 as tensorflow__serving_dot_apis_dot_predict__pb2,
+    prediction_service_pb2_grpc as tensorflow__serving_dot_apis_dot_prediction_service__pb2__grpc
+)
+from mlfmodelserver.streaming import streaming_predict_pb2_grpc
+from mlfmodelserver.tensor_codec import encode_tensor
+from bench_server_modes import MODEL_NAME, free_port, write_model
+
+METADATA = [('authorization', 'Bearer bench')]
+
+
+def predict_request():
+    request = tensorflow__serving_dot_apis_dot_predict__pb2.PredictRequest()
+    request.model_spec.name = MODEL_NAME
+    encode_tensor(np.ones((1, 8), dtype=np.float32), request.inputs['X'])
+    return request
+
+
+def unary(channel, requests, in_flight):
+    stub = tensorflow__serving_dot_apis_dot_prediction_service__pb2__grpc.PredictionServiceStub(channel)
+    request = predict_request()
+    start = time.perf_counter()
+    if in_flight == 1:
+        for _ in range(requests):
+            stub.Predict(request, metadata=METADATA, timeout=60)
+    else:
+        with futures.ThreadPoolExecutor(max_workers=in_flight) as executor:
+            list(executor.map(lambda _: stub.Predict(request, metadata=METADATA, timeout=60), range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
+def streamed(channel, requests):
+    stub = streaming_predict_pb2_grpc.StreamingPredictionServiceStub(channel)
+    request = predict_request()
+    start = time.perf_counter()
+    received = 0
+    for response in stub.StreamPredict(iter([request] * requests), metadata=METADATA):
+        if response.error_code:
+            raise RuntimeError(response.error_message)
+        received += 1
+    assert received == requests
+    return requests / (time.perf_counter() - start)
+
+
+def run(args):
+    base_path = tempfile.mkdtemp(prefix='bench-streaming-')
+    config_path = write_model(base_path, 0)
+    port = free_port()
+    env = dict(os.environ, MODELS_CONFIG_FILE_PATH=config_path, MODEL_CONTAINER_PORT=str(port),
+               MODEL_CONTAINER_SERVER_MODE=args.mode, MLF_LITE_RUNTIME='true')
+    process = subprocess.Popen([sys.executable, '-m', 'mlfmodelserver.python_grpc_server'], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        channel = grpc.insecure_channel('127.0.0.1:{}'.format(port))
+        grpc.channel_ready_future(channel).result(timeout=60)
+        # warm up both paths
+        unary(channel, 100, 1)
+        streamed(channel, 100)
+        baseline = unary(channel, args.requests, 1)
+        concurrent = unary(channel, args.requests, args.in_flight)
+        stream = streamed(channel, args.requests)
+        print("{:>28} {:>12}".format('mode ({})'.format(args.mode), 'requests/s'))
+        print("{:>28} {:>12.0f}".format('unary, 1 in flight', baseline))
+        print("{:>28} {:>12.0f}".format('unary, {} in flight'.format(args.in_flight), concurrent))
+        print("{:>28} {:>12.0f}   {:.1f}x unary".format('stream', stream, stream / baseline))
+    finally:
+        process.kill()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mode', default='sync', choices=['sync', 'aio'])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--in-flight', type=int, default=8)
+    run(parser.parse_args())
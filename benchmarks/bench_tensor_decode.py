@@ -0,0 +1,46 @@
+"""Benchmark TensorProto decoding: tensor_codec.decode_tensor vs tensor_util.MakeNdarray"""
+from __future__ import print_function
+import argparse
+import timeit
+
+import numpy as np
+import tensorflow as tf
+# pylint: disable=E0611
+from tensorflow.python.framework import tensor_util
+
+from mlfmodelserver.tensor_codec import decode_tensor
+
+# payload sizes in bytes, 1 KB to 64 MB
+SIZES = [1 << 10, 16 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20, 64 << 20]
+# the typed *_val fields are only benchmarked up to this size, building larger repeated fields takes minutes
+MAX_TYPED_FIELD_SIZE = 1 << 20
+
+
+def time_call(func, tensor, min_time):
+    number, _ = timeit.Timer(lambda: func(tensor)).autorange()
+    number = max(number, int(number * min_time / 0.2))
+    return timeit.Timer(lambda: func(tensor)).timeit(number) / number
+
+
+def run(min_time):
+    print("{:>10} {:>14} {:>16} {:>16} {:>9}".format('size', 'encoding', 'MakeNdarray us', 'decode_tensor us',
+                                                      'speedup'))
+    for size in SIZES:
+        values = np.random.rand(size // 4).astype(np.float32)
+        tensors = [('tensor_content', tf.make_tensor_proto(values))]
+        if size <= MAX_TYPED_FIELD_SIZE:
+            typed = tf.make_tensor_proto(values.tolist(), dtype=tf.float32)
+            typed.ClearField('tensor_content')
+            typed.float_val.extend(values.tolist())
+            tensors.append(('float_val', typed))
+        for encoding, tensor in tensors:
+            baseline = time_call(tensor_util.MakeNdarray, tensor, min_time)
+            codec = time_call(decode_tensor, tensor, min_time)
+            print("{:>10} {:>14} {:>16.1f} {:>16.1f} {:>8.1f}x".format(size, encoding, baseline * 1e6,
+                                                                      codec * 1e6, baseline / codec))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds measured per case')
+    run(parser.parse_args().min_time)
@@ -0,0 +1,341 @@
+"""Load generator replaying recorded Predict payloads against a model server
+
+Starts the sum container of test/sum_grpc_container.py or a python ModelContainer of a model config, as a
+subprocess or in process, and drives it open loop (Poisson arrivals), at a constant rate or closed loop at a fixed
+concurrency. Sweeps the load, the rows per request and the server's batch size, prints one JSON line per
+measurement with throughput, latency percentiles and error rate, and compares them with a baseline file.
+
+Payloads are JSON lines with the inputs of a Predict request, such as the records logged with
+LOG_PAYLOAD_SAMPLE_RATE: {"model_name": "iris", "inputs": {"X": [[5.1, 3.5, 1.4, 0.2]]}}
+An input is a nested list, {"dtype": "float32", "value": ...} as in warmup_request.json, or the
+{"shape": [...], "dtype": ...} logged for large arrays, which is sent as zeros of that shape.
+"""
+from __future__ import print_function
+import argparse
+import asyncio
+import collections
+import contextlib
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import grpc
+import numpy as np
+from grpc import aio
+
+from mlfmodelserver import runtime
+runtime.defer_tensorflow_import()
+from tensorflow_serving.apis import predict_pb2 as tensorflow__serving_dot_apis_dot_predict__pb2
+from mlfmodelserver.tensor_codec import encode_tensor
+
+PREDICT_METHOD = '/tensorflow.serving.PredictionService/Predict'
+TARGET_SUM = 'sum'
+TARGET_CONTAINER = 'container'
+LOAD_OPEN = 'open'
+LOAD_CONSTANT = 'constant'
+LOAD_CLOSED = 'closed'
+SUM_MODEL_NAME = 'sum-model'
+SUM_CONTAINER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'test', 'sum_grpc_container.py')
+# measurements of a baseline are matched on these fields
+RESULT_KEY = ('target', 'in_process', 'load', 'level', 'rows', 'batch_size')
+# baselines saved before in_process was recorded measured a subprocess
+RESULT_KEY_DEFAULTS = {'in_process': False}
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def input_array(value, float_dtype):
+    if isinstance(value, dict) and 'shape' in value and 'value' not in value:
+        return np.zeros(value['shape'], dtype=value.get('dtype', float_dtype))
+    if isinstance(value, dict):
+        return np.asarray(value['value'], dtype=value.get('dtype'))
+    array = np.asarray(value)
+    # payload logs have no dtype, json floats would be sent as doubles
+    return array.astype(float_dtype) if array.dtype == np.float64 else array
+
+
+def read_payloads(path, float_dtype='float32'):
+    """
+    :return: list of (model name or None, signature name, dict of input name to ndarray) of the Predict payloads
+        of a JSON lines file; records of other methods are skipped
+    """
+    payloads = []
+    with open(path) as payload_file:
+        for line in payload_file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get('method', 'Predict') != 'Predict' or not isinstance(record.get('inputs'), dict):
+                continue
+            inputs = {name: input_array(value, float_dtype) for name, value in record['inputs'].items()}
+            payloads.append((record.get('model_name'), record.get('signature_name', ''), inputs))
+    if not payloads:
+        raise ValueError('No Predict payloads in {}'.format(path))
+    return payloads
+
+
+def default_payloads(target):
+    if target == TARGET_SUM:
+        return [(SUM_MODEL_NAME, '', {'X': np.array([1, 45, 3, 4], dtype=np.int32)})]
+    return [(None, '', {'X': np.ones((1, 8), dtype=np.float32)})]
+
+
+def with_rows(inputs, rows):
+    """:return: inputs with rows rows, the recorded rows repeated or cut"""
+    if rows is None:
+        return inputs
+    return {name: np.take(value, np.arange(rows) % len(value), axis=0) if value.ndim else value
+            for name, value in inputs.items()}
+
+
+def serialized_requests(payloads, rows, model_name):
+    """:return: the serialized PredictRequest of every payload, the load is sent without encoding on the way"""
+    requests = []
+    for payload_model_name, signature_name, inputs in payloads:
+        request = tensorflow__serving_dot_apis_dot_predict__pb2.PredictRequest()
+        request.model_spec.name = model_name or payload_model_name or ''
+        request.model_spec.signature_name = signature_name
+        for name, value in with_rows(inputs, rows).items():
+            encode_tensor(value, request.inputs[name])
+        requests.append(request.SerializeToString())
+    return requests
+
+
+def server_env(args, batch_size):
+    env = dict(variable.split('=', 1) for variable in args.server_env)
+    env['ENABLE_BATCHING'] = 'true' if batch_size else 'false'
+    if batch_size:
+        env['BATCH_MAX_BATCH_SIZE'] = str(batch_size)
+    if args.target == TARGET_CONTAINER:
+        env['MODELS_CONFIG_FILE_PATH'] = args.model_config
+    return env
+
+
+def load_model(args):
+    if args.target == TARGET_SUM:
+        sys.path.insert(0, os.path.dirname(SUM_CONTAINER))
+        from sum_grpc_container import SumContainer
+        return SumContainer({'model_name': SUM_MODEL_NAME, 'version': 1})
+    from mlfmodelserver import python_grpc_server
+    return python_grpc_server.load_models(args.model_config)
+
+
+@contextlib.contextmanager
+def model_server(args, batch_size):
+    """Serve the target with batch_size rows per model call, 0 without batching; yields its port"""
+    port = free_port()
+    env = server_env(args, batch_size)
+    if args.in_process:
+        from mlfmodelserver import grpc_server
+        # the server reads its settings from the environment, the next sweep must not inherit them
+        saved_env = dict(os.environ)
+        os.environ.update(env)
+        try:
+            server = grpc_server.GrpcServer().serve(load_model(args), port)
+            try:
+                yield port
+            finally:
+                server.stop(0).wait()
+        finally:
+            os.environ.clear()
+            os.environ.update(saved_env)
+        return
+
+    if args.target == TARGET_SUM:
+        command = [sys.executable, SUM_CONTAINER]
+    else:
+        command = [sys.executable, '-m', 'mlfmodelserver.python_grpc_server']
+    env = dict(os.environ, MODEL_CONTAINER_PORT=str(port), **env)
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with grpc.insecure_channel('127.0.0.1:{}'.format(port)) as channel:
+            grpc.channel_ready_future(channel).result(timeout=args.startup_timeout)
+        yield port
+    finally:
+        process.kill()
+        process.wait()
+
+
+def summarize(latencies, codes, elapsed, sent):
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    errors = {code: count for code, count in codes.items() if code != grpc.StatusCode.OK.name}
+    return {
+        'requests': sent,
+        'requests_per_s': codes[grpc.StatusCode.OK.name] / elapsed,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p90_ms': float(np.percentile(latencies_ms, 90)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'p999_ms': float(np.percentile(latencies_ms, 99.9)),
+        'error_rate': sum(errors.values()) / float(sent) if sent else 0.0,
+        'errors': errors
+    }
+
+
+async def drive(port, requests, load, level, duration, args):
+    """
+    Send the requests round robin for duration seconds
+
+    :param level: requests per second of the open and constant loads, requests in flight of the closed load
+    """
+    channels = [aio.insecure_channel('127.0.0.1:{}'.format(port)) for _ in range(args.channels)]
+    # no serializers: the requests are sent as they are and the responses are not parsed
+    predicts = [channel.unary_unary(PREDICT_METHOD) for channel in channels]
+    metadata = (('authorization', args.token),)
+    payloads = itertools.cycle(requests)
+    latencies = []
+    codes = collections.Counter()
+    sent = itertools.count()
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async def call(scheduled):
+        index = next(sent)
+        try:
+            await predicts[index % len(predicts)](next(payloads), metadata=metadata, timeout=args.timeout)
+        except grpc.RpcError as error:
+            codes[error.code().name] += 1
+            return
+        # from the scheduled send time, a server falling behind an open load shows in the latency
+        latencies.append(time.perf_counter() - scheduled)
+        codes[grpc.StatusCode.OK.name] += 1
+
+    async def closed_loop():
+        while time.perf_counter() < deadline:
+            await call(time.perf_counter())
+
+    async def open_loop():
+        pending = set()
+        scheduled = started
+        while scheduled < deadline:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.ensure_future(call(scheduled))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            scheduled += random.expovariate(level) if load == LOAD_OPEN else 1.0 / level
+        if pending:
+            await asyncio.wait(pending)
+
+    if load == LOAD_CLOSED:
+        await asyncio.gather(*[closed_loop() for _ in range(int(level))])
+    else:
+        await open_loop()
+    elapsed = time.perf_counter() - started
+    for channel in channels:
+        await channel.close()
+    return summarize(latencies, codes, elapsed, next(sent))
+
+
+def result_key(result):
+    return tuple(result.get(key, RESULT_KEY_DEFAULTS.get(key)) for key in RESULT_KEY)
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: a comparison per result with a baseline measurement, flagged as regression when the throughput
+        dropped or the p99 latency grew by more than tolerance, or the error rate grew by more than 1 %
+    """
+    baseline_results = {result_key(result): result for result in baseline}
+    comparisons = []
+    for result in results:
+        base = baseline_results.get(result_key(result))
+        if base is None:
+            continue
+        throughput_change = result['requests_per_s'] / base['requests_per_s'] - 1 if base['requests_per_s'] else 0.0
+        p99_change = result['p99_ms'] / base['p99_ms'] - 1 if base['p99_ms'] else 0.0
+        comparison = {key: result[key] for key in RESULT_KEY}
+        comparison.update({
+            'requests_per_s_change': throughput_change,
+            'p99_ms_change': p99_change,
+            'error_rate_change': result['error_rate'] - base['error_rate'],
+        })
+        comparison['regression'] = (throughput_change < -tolerance or p99_change > tolerance or
+                                    comparison['error_rate_change'] > 0.01)
+        comparisons.append(comparison)
+    return comparisons
+
+
+def run(args):
+    payloads = read_payloads(args.payloads, args.float_dtype) if args.payloads else default_payloads(args.target)
+    model_name = args.model_name
+    if model_name is None and args.target == TARGET_CONTAINER and args.model_config:
+        from mlfmodelserver import model_config
+        # payloads without a model name go to the first configured model
+        default_name = model_config.read_model_configs(args.model_config)[0].name
+        payloads = [(name or default_name, signature, inputs) for name, signature, inputs in payloads]
+    levels = args.concurrency if args.load == LOAD_CLOSED else args.rates
+
+    results = []
+    for batch_size in args.batch_sizes:
+        with model_server(args, batch_size) as port:
+            for rows, level in itertools.product(args.rows, levels):
+                requests = serialized_requests(payloads, rows, model_name)
+                if args.warmup > 0:
+                    asyncio.run(drive(port, requests, args.load, level, args.warmup, args))
+                result = {'target': args.target, 'in_process': args.in_process, 'load': args.load, 'level': level,
+                          'rows': rows, 'batch_size': batch_size}
+                result.update(asyncio.run(drive(port, requests, args.load, level, args.duration, args)))
+                print(json.dumps(result, sort_keys=True))
+                sys.stdout.flush()
+                results.append(result)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=1, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            comparisons = compare(results, json.load(baseline_file), args.tolerance)
+        for comparison in comparisons:
+            print(json.dumps(comparison, sort_keys=True))
+        if any(comparison['regression'] for comparison in comparisons):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=[TARGET_SUM, TARGET_CONTAINER], default=TARGET_SUM)
+    parser.add_argument('--model-config', help='model_config.conf of the container target')
+    parser.add_argument('--in-process', action='store_true',
+                        help='serve in this process instead of a subprocess; measurements are only compared with '
+                             'a baseline served the same way')
+    parser.add_argument('--server-env', nargs='*', default=[], metavar='NAME=VALUE',
+                        help='environment of the server, e.g. GRPC_MAX_WORKERS=20')
+    parser.add_argument('--payloads', help='JSON lines file of Predict payloads, default one synthetic payload')
+    parser.add_argument('--model-name', help='model name of every request, default the one of the payload')
+    parser.add_argument('--float-dtype', default='float32', help='dtype of float inputs logged without one')
+    parser.add_argument('--load', choices=[LOAD_OPEN, LOAD_CONSTANT, LOAD_CLOSED], default=LOAD_CLOSED,
+                        help='open: Poisson arrivals at --rates, constant: evenly spaced at --rates, '
+                             'closed: --concurrency requests in flight')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 10, 100])
+    parser.add_argument('--rates', nargs='+', type=float, default=[100, 500, 1000], help='requests per second')
+    parser.add_argument('--rows', nargs='+', type=int, default=[None],
+                        help='rows per request, the payload rows repeated or cut; default as recorded')
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[0],
+                        help='BATCH_MAX_BATCH_SIZE of the server, 0 without batching')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per measurement')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds of load before each measurement')
+    parser.add_argument('--channels', type=int, default=4, help='client channels the requests are spread on')
+    parser.add_argument('--timeout', type=float, default=10, help='deadline of a request in seconds')
+    parser.add_argument('--token', default='Bearer bench', help='authorization metadata')
+    parser.add_argument('--startup-timeout', type=float, default=60)
+    parser.add_argument('--save-baseline', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare with the results of this file, exit 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative throughput drop or p99 growth reported as regression')
+    arguments = parser.parse_args()
+    if arguments.target == TARGET_CONTAINER and not arguments.model_config:
+        parser.error('--model-config is required for the container target')
+    sys.exit(run(arguments))
@@ -0,0 +1,303 @@
+"""Admission control and load shedding
+
+Requests beyond the worker threads wait in the executor queue. The admission controller bounds that queue and
+rejects new requests with RESOURCE_EXHAUSTED as soon as they arrive when the queue is full or the estimated
+wait is above a limit, instead of queueing work that clients will have timed out on by the time it runs.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent import futures
+
+import grpc
+
+from mlfmodelserver import metrics, tracing
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+REASON_QUEUE_FULL = 'queue_full'
+REASON_QUEUE_WAIT = 'queue_wait'
+REASON_DEADLINE_EXPIRED = 'deadline_expired'
+REASON_STREAMS_FULL = 'streams_full'
+
+SHED_COUNTER = metrics.counter('mlf_mc_shed_requests_total', 'Requests rejected by admission control',
+                               label_names=('method', 'reason'))
+QUEUE_WAIT_HISTOGRAM = metrics.histogram('mlf_mc_queue_wait_ms',
+                                         'Time an admitted request waited for a worker thread')
+QUEUE_DEPTH_GAUGE = metrics.gauge('mlf_mc_queue_depth', 'Admitted requests waiting for a worker thread')
+OPEN_STREAMS_GAUGE = metrics.gauge('mlf_mc_open_streams', 'Streaming RPCs running on the stream threads')
+
+# where the executor runs the next task submitted by the gRPC polling thread
+_ROUTE_SHED = 'shed'
+_ROUTE_STREAM = 'stream'
+
+# weight of the latest model call in the moving average of the service time
+_SERVICE_TIME_WEIGHT = 0.1
+
+
+def _optional_int(value):
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+class AdmissionController:
+    """
+    Tracks the requests queued and running in the worker pool and decides whether a new request is admitted
+
+    max_workers: number of threads running requests
+    max_queue_size: maximum number of requests waiting for a thread, None for no limit
+    max_queue_wait_ms: maximum estimated wait of a new request, None for no limit
+    max_streams: number of threads running streaming RPCs, further streams are rejected
+
+    Streams run on their own threads and are left out of the queue and the service time, a stream open for
+    minutes would otherwise hold a worker thread and inflate the estimated wait of the unary requests.
+    """
+
+    def __init__(self, max_workers=10, max_queue_size=None, max_queue_wait_ms=None, max_streams=10):
+        if max_workers < 1 or (max_queue_size is not None and max_queue_size < 0) or \
+                (max_queue_wait_ms is not None and max_queue_wait_ms < 0) or max_streams < 1:
+            raise ValueError('Invalid admission settings: max_workers={}, max_queue_size={}, max_queue_wait_ms={}, '
+                             'max_streams={}'.format(max_workers, max_queue_size, max_queue_wait_ms, max_streams))
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.max_queue_wait_ms = max_queue_wait_ms
+        self.max_streams = max_streams
+        self._pending = 0
+        self._streams = 0
+        self._service_time_ms = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'AdmissionController(max_workers={}, max_queue_size={}, max_queue_wait_ms={}, max_streams={})'.format(
+            self.max_workers, self.max_queue_size, self.max_queue_wait_ms, self.max_streams)
+
+    @classmethod
+    def from_env(cls):
+        """
+        GRPC_MAX_WORKERS sets the worker threads (default 10), GRPC_MAX_QUEUE_SIZE and GRPC_MAX_QUEUE_WAIT_MS
+        bound the queue (no limit by default), GRPC_MAX_STREAMS the concurrent streams (default 10)
+        """
+        return cls(max_workers=int(os.environ.get('GRPC_MAX_WORKERS', 10)),
+                   max_queue_size=_optional_int(os.environ.get('GRPC_MAX_QUEUE_SIZE')),
+                   max_queue_wait_ms=_optional_int(os.environ.get('GRPC_MAX_QUEUE_WAIT_MS')),
+                   max_streams=int(os.environ.get('GRPC_MAX_STREAMS', 10)))
+
+    def pending(self):
+        """Requests queued or running"""
+        return self._pending
+
+    def streams(self):
+        """Streaming RPCs running"""
+        return self._streams
+
+    def queued(self):
+        """Requests waiting for a worker thread"""
+        return max(0, self._pending - self.max_workers)
+
+    def estimated_wait_ms(self):
+        """
+        Expected wait of a request arriving now, from the requests ahead of it and the average service time
+        """
+        if self._pending < self.max_workers or self._service_time_ms is None:
+            return 0.0
+        return (self.queued() + 1) * self._service_time_ms / self.max_workers
+
+    def check(self):
+        """
+        :return: None if a new request is admitted, else the reason for rejecting it
+        """
+        if self.max_queue_size is not None and self._pending - self.max_workers >= self.max_queue_size:
+            return REASON_QUEUE_FULL
+        if self.max_queue_wait_ms is not None and self.estimated_wait_ms() > self.max_queue_wait_ms:
+            return REASON_QUEUE_WAIT
+        return None
+
+    def check_stream(self):
+        """
+        :return: None if a new stream is admitted, else the reason for rejecting it
+        """
+        if self._streams >= self.max_streams:
+            return REASON_STREAMS_FULL
+        return None
+
+    def shed(self, method, reason):
+        SHED_COUNTER.inc(method=method, reason=reason)
+        LOG.debug("Rejected %s request: %s, %s queued", method, reason, self.queued())
+
+    def rejection_details(self, reason):
+        if reason == REASON_STREAMS_FULL:
+            return 'Server overloaded ({}): {} streams open'.format(reason, self._streams)
+        return 'Server overloaded ({}): {} requests queued, estimated wait {:.1f} ms'.format(
+            reason, self.queued(), self.estimated_wait_ms())
+
+    def rejection_handler(self, method, reason):
+        """
+        Behavior answering a rejected request with RESOURCE_EXHAUSTED
+        """
+        details = self.rejection_details(reason)
+
+        def reject(request_or_iterator, context):
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, details)
+        return reject
+
+    def deadline_guard(self, behavior, method):
+        """
+        Wrap a behavior to skip requests whose deadline expired while they were queued
+        """
+        def guarded(request, context):
+            time_remaining = context.time_remaining()
+            if time_remaining is not None and time_remaining <= 0:
+                self.shed(method, REASON_DEADLINE_EXPIRED)
+                context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, 'Deadline expired while the request was queued')
+            return behavior(request, context)
+        return guarded
+
+    def _submitted(self):
+        with self._lock:
+            self._pending += 1
+
+    def _stream_started(self):
+        with self._lock:
+            self._streams += 1
+
+    def _stream_finished(self):
+        with self._lock:
+            self._streams -= 1
+
+    def _finished(self, service_time_ms):
+        with self._lock:
+            self._pending -= 1
+            if service_time_ms is not None:
+                if self._service_time_ms is None:
+                    self._service_time_ms = service_time_ms
+                else:
+                    self._service_time_ms += _SERVICE_TIME_WEIGHT * (service_time_ms - self._service_time_ms)
+
+
+class AdmissionExecutor(futures.ThreadPoolExecutor):
+    """
+    Thread pool reporting its queue to an AdmissionController
+
+    A task flagged with shed_next() runs on a separate thread, so rejecting a request does not wait behind the
+    queue it is rejected from. A task flagged with stream_next() runs on one of max_streams stream threads and is
+    not counted as a pending request.
+    """
+
+    def __init__(self, controller, thread_name_prefix=''):
+        super().__init__(max_workers=controller.max_workers, thread_name_prefix=thread_name_prefix)
+        self.controller = controller
+        QUEUE_DEPTH_GAUGE.set_function(controller.queued)
+        OPEN_STREAMS_GAUGE.set_function(controller.streams)
+        self._shed_executor = futures.ThreadPoolExecutor(max_workers=1,
+                                                         thread_name_prefix=thread_name_prefix + 'shed')
+        self._stream_executor = futures.ThreadPoolExecutor(max_workers=controller.max_streams,
+                                                           thread_name_prefix=thread_name_prefix + 'stream')
+        self._route = threading.local()
+
+    def shed_next(self, shed=True):
+        """Flag the next task submitted by the calling thread as a rejection"""
+        self._route.value = _ROUTE_SHED if shed else None
+
+    def stream_next(self):
+        """Flag the next task submitted by the calling thread as a streaming RPC"""
+        self._route.value = _ROUTE_STREAM
+
+    def submit(self, fn, *args, **kwargs):
+        route = getattr(self._route, 'value', None)
+        if route == _ROUTE_SHED:
+            self._route.value = None
+            return self._shed_executor.submit(fn, *args, **kwargs)
+        if route == _ROUTE_STREAM:
+            self._route.value = None
+            return self._submit_stream(fn, *args, **kwargs)
+
+        controller = self.controller
+        submitted_at_ns = time.perf_counter_ns()
+
+        def run():
+            started_at_ns = time.perf_counter_ns()
+            QUEUE_WAIT_HISTOGRAM.observe((started_at_ns - submitted_at_ns) / 1e6)
+            service_time_ms = None
+            try:
+                with tracing.queued_since(submitted_at_ns):
+                    result = fn(*args, **kwargs)
+                service_time_ms = (time.perf_counter_ns() - started_at_ns) / 1e6
+                return result
+            finally:
+                controller._finished(service_time_ms)
+
+        controller._submitted()
+        try:
+            return super().submit(run)
+        except BaseException:
+            controller._finished(None)
+            raise
+
+    def _submit_stream(self, fn, *args, **kwargs):
+        controller = self.controller
+
+        def run():
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                controller._stream_finished()
+
+        controller._stream_started()
+        try:
+            return self._stream_executor.submit(run)
+        except BaseException:
+            controller._stream_finished()
+            raise
+
+    def shutdown(self, wait=True, **kwargs):
+        self._shed_executor.shutdown(wait=wait)
+        self._stream_executor.shutdown(wait=wait)
+        super().shutdown(wait=wait, **kwargs)
+
+
+class AdmissionInterceptor(grpc.ServerInterceptor):
+    """
+    Admission control of the RPCs of a synchronous grpc.server running on an AdmissionExecutor: unary RPCs by the
+    queue of the worker threads, streaming RPCs by the number of open streams
+
+    Interceptors run on the server's polling thread right before the RPC is submitted to the executor, which
+    is what lets the rejection be flagged for the shed thread.
+    """
+
+    def __init__(self, controller, executor):
+        self.controller = controller
+        self.executor = executor
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            self.executor.shed_next(False)
+            return handler
+        method = handler_call_details.method.rpartition('/')[2]
+        if handler.unary_unary is None:
+            return self._intercept_stream(handler, method)
+        reason = self.controller.check()
+        # always set the flag: gRPC may reject the call without submitting it, and a stale flag would send the
+        # next admitted request to the shed thread
+        self.executor.shed_next(reason is not None)
+        if reason is not None:
+            self.controller.shed(method, reason)
+            return handler._replace(unary_unary=self.controller.rejection_handler(method, reason))
+        return handler._replace(unary_unary=self.controller.deadline_guard(handler.unary_unary, method))
+
+    def _intercept_stream(self, handler, method):
+        reason = self.controller.check_stream()
+        if reason is None:
+            self.executor.stream_next()
+            return handler
+        self.executor.shed_next(True)
+        self.controller.shed(method, reason)
+        reject = self.controller.rejection_handler(method, reason)
+        behavior = 'stream_stream' if handler.stream_stream is not None else \
+            'unary_stream' if handler.unary_stream is not None else 'stream_unary'
+        return handler._replace(**{behavior: reject})
@@ -0,0 +1,229 @@
+"""asyncio gRPC server
+
+RPCs are served by a single event loop, so idle or slow HTTP/2 streams do not hold a thread. Model calls run
+in a size-bounded thread pool next to the loop.
+"""
+import asyncio
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+import grpc
+from grpc import aio
+
+from mlfmodelserver import admission, grpc_server, log_pipeline, metrics, profiler, stream_predict
+from mlfmodelserver.streaming import streaming_predict_pb2_grpc
+from tensorflow_serving.apis import (
+    prediction_service_pb2 as tensorflow__serving_dot_apis_dot_prediction_service__pb2,
+    prediction_service_pb2_grpc as tensorflow__serving_dot_apis_dot_prediction_service__pb2__grpc
+)
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+_END_OF_STREAM = object()
+
+
+class _ExecutorContext:
+    """
+    Servicer context handed to the synchronous Servicer methods running in the model executor.
+
+    Status code and details are recorded and applied to the asyncio context back on the event loop.
+    """
+
+    def __init__(self, context):
+        self._metadata = context.invocation_metadata()
+        time_remaining = context.time_remaining()
+        self._deadline = None if time_remaining is None else time.monotonic() + time_remaining
+        self.code = None
+        self.details = None
+
+    def invocation_metadata(self):
+        return self._metadata
+
+    def time_remaining(self):
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - time.monotonic())
+
+    def set_code(self, code):
+        self.code = code
+
+    def set_details(self, details):
+        self.details = details
+
+    def abort(self, code, details):
+        self.code = code
+        self.details = details
+        raise Exception(details)
+
+    def apply(self, context):
+        if self.code is not None:
+            context.set_code(self.code)
+        if self.details is not None:
+            context.set_details(self.details)
+
+
+class AioServicer(tensorflow__serving_dot_apis_dot_prediction_service__pb2.PredictionServiceServicer):
+    """
+    Async PredictionService and health check delegating to a synchronous Servicer
+    """
+
+    def __init__(self, servicer, executor, controller=None):
+        self.servicer = servicer
+        self.executor = executor
+        self.controller = controller
+
+    async def _call(self, method, request, context):
+        if self.controller is not None:
+            reason = self.controller.check()
+            if reason is not None:
+                self.controller.shed(method.__name__, reason)
+                await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, self.controller.rejection_details(reason))
+            method = self.controller.deadline_guard(method, method.__name__)
+        executor_context = _ExecutorContext(context)
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(self.executor, method, request, executor_context)
+        except Exception as ex:
+            if executor_context.code is not None and executor_context.code != grpc.StatusCode.OK:
+                await context.abort(executor_context.code, executor_context.details or str(ex))
+            raise
+        executor_context.apply(context)
+        return response
+
+    async def Classify(self, request, context):
+        return await self._call(self.servicer.Classify, request, context)
+
+    async def Regress(self, request, context):
+        return await self._call(self.servicer.Regress, request, context)
+
+    async def Predict(self, request, context):
+        return await self._call(self.servicer.Predict, request, context)
+
+    async def GetModelMetadata(self, request, context):
+        return await self._call(self.servicer.GetModelMetadata, request, context)
+
+
+class AioStreamingServicer(streaming_predict_pb2_grpc.StreamingPredictionServiceServicer):
+    """
+    Async StreamPredict: requests are read on the event loop, authorization and the scoring of each batch run
+    in the model executor through a StreamingServicer
+    """
+
+    def __init__(self, streaming_servicer, executor):
+        self.streaming_servicer = streaming_servicer
+        self.executor = executor
+
+    async def StreamPredict(self, request_iterator, context):
+        streaming = self.streaming_servicer
+        requests = asyncio.Queue(maxsize=streaming.read_ahead)
+
+        async def read():
+            try:
+                async for request in request_iterator:
+                    await requests.put(request)
+            except asyncio.CancelledError:
+                # the handler is gone and takes nothing from the queue any more, waiting on a full one would leak
+                raise
+            except Exception as ex:
+                # the client cancelled or the stream broke, the handler finishes the requests read so far
+                LOG.info("Stream closed: %s", ex)
+            await requests.put(_END_OF_STREAM)
+
+        reader = asyncio.ensure_future(read())
+        loop = asyncio.get_running_loop()
+        try:
+            pending = await requests.get()
+            if pending is _END_OF_STREAM:
+                return
+            executor_context = _ExecutorContext(context)
+            try:
+                await loop.run_in_executor(self.executor, streaming.authorize, pending, executor_context)
+            except Exception as ex:
+                await context.abort(executor_context.code or grpc.StatusCode.UNAUTHENTICATED,
+                                    executor_context.details or str(ex))
+            while pending is not _END_OF_STREAM:
+                batch = [pending]
+                pending = None
+                while len(batch) < streaming.max_batch_size:
+                    try:
+                        request = requests.get_nowait()
+                    except asyncio.QueueEmpty:
+                        break
+                    if request is _END_OF_STREAM:
+                        pending = _END_OF_STREAM
+                        break
+                    batch.append(request)
+                for response in await loop.run_in_executor(self.executor, streaming.predict_batch, batch):
+                    yield response
+                if pending is None:
+                    pending = await requests.get()
+        finally:
+            reader.cancel()
+
+
+class AioGrpcServer(grpc_server.GrpcServer):
+    """
+    gRPC server on grpc.aio
+
+    MODEL_EXECUTOR_MAX_WORKERS bounds the threads running model calls (default GRPC_MAX_WORKERS). Admission
+    control applies to the model executor queue as in the synchronous server.
+    """
+
+    def start(self, model, port):
+        log_pipeline.install()
+        LOG.info("Starting asyncio gRPC Server")
+        servicer = self.create_servicer(model)
+        profiler.install_from_env()
+        metrics.serve_from_env()
+        controller = admission.AdmissionController.from_env()
+        controller.max_workers = int(os.environ.get('MODEL_EXECUTOR_MAX_WORKERS', controller.max_workers))
+        executor = admission.AdmissionExecutor(controller, thread_name_prefix='model-executor')
+        LOG.info("Admission control of the model executor: %s", controller)
+
+        if self.pod_health_status_path:
+            healthexporter = grpc_server.AsyncWrite(servicer.model_env, self.get_model_health_status(),
+                                                    self.pod_health_status_path)
+            healthexporter.daemon = True
+            healthexporter.start()
+
+        try:
+            streaming_servicer = stream_predict.StreamingServicer.from_env(servicer)
+            LOG.info("Streaming Predict: %s", streaming_servicer)
+            asyncio.run(self._serve(AioServicer(servicer, executor, controller), port,
+                                    AioStreamingServicer(streaming_servicer, executor)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown(wait=False)
+
+    async def _serve(self, aio_servicer, port, streaming_servicer=None):
+        server = aio.server(options=grpc_server.SERVER_OPTIONS)
+        server.add_generic_rpc_handlers((grpc_server.metadata_rpc_handler(aio_servicer.GetModelMetadata),))
+        tensorflow__serving_dot_apis_dot_prediction_service__pb2__grpc. \
+            add_PredictionServiceServicer_to_server(aio_servicer, server)
+        if streaming_servicer is not None:
+            streaming_predict_pb2_grpc.add_StreamingPredictionServiceServicer_to_server(streaming_servicer, server)
+        server.add_insecure_port("[::]:%s" % port)
+        await server.start()
+        LOG.info('Server started successfully on port: %s ...', str(port))
+        stopping = []
+
+        def on_sigterm():
+            LOG.info("Received SIGTERM, stopping the server within %s s", self.stop_grace_seconds)
+            stopping.append(asyncio.ensure_future(server.stop(self.stop_grace_seconds)))
+
+        if threading.current_thread() is threading.main_thread():
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, on_sigterm)
+        try:
+            await server.wait_for_termination()
+        finally:
+            if stopping:
+                await stopping[0]
+            else:
+                await server.stop(0)
@@ -0,0 +1,295 @@
+"""Adaptive micro-batching of concurrent Predict requests"""
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+from mlfmodelserver import metrics, profiler, tracing
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+BATCH_SIZE_HISTOGRAM = metrics.histogram('mlf_mc_batch_size', 'Rows per model call issued by the batch scheduler',
+                                         label_names=('model_name',), buckets=metrics.DEFAULT_SIZE_BUCKETS)
+BATCH_QUEUE_WAIT_HISTOGRAM = metrics.histogram('mlf_mc_batch_queue_wait_ms',
+                                               'Time a request waited in the batch queue',
+                                               label_names=('model_name',))
+BATCH_QUEUE_DEPTH_GAUGE = metrics.gauge('mlf_mc_batch_queue_depth', 'Requests waiting in the batch queue',
+                                        label_names=('model_name',))
+
+_STOP = object()
+
+
+class BatchingParameters:
+    """
+    Batching settings of one model
+
+    max_batch_size: maximum number of rows handed to the model in one call
+    batch_timeout_micros: maximum time the oldest request waits for more rows
+    num_batch_threads: number of threads calling the model concurrently
+    """
+
+    def __init__(self, max_batch_size=32, batch_timeout_micros=1000, num_batch_threads=1):
+        if max_batch_size < 1 or batch_timeout_micros < 0 or num_batch_threads < 1:
+            raise ValueError('Invalid batching parameters: max_batch_size={}, batch_timeout_micros={}, '
+                             'num_batch_threads={}'.format(max_batch_size, batch_timeout_micros, num_batch_threads))
+        self.max_batch_size = int(max_batch_size)
+        self.batch_timeout_micros = int(batch_timeout_micros)
+        self.num_batch_threads = int(num_batch_threads)
+
+    def __repr__(self):
+        return 'BatchingParameters(max_batch_size={}, batch_timeout_micros={}, num_batch_threads={})'.format(
+            self.max_batch_size, self.batch_timeout_micros, self.num_batch_threads)
+
+    @classmethod
+    def from_env(cls, model_name):
+        """
+        Read the batching settings of a model.
+
+        BATCH_MAX_BATCH_SIZE, BATCH_TIMEOUT_MICROS and BATCH_NUM_THREADS give the defaults; a json file
+        referenced by BATCHING_PARAMETERS_FILE may override them per model name, e.g.
+        {"my-model": {"max_batch_size": 64, "batch_timeout_micros": 2000, "num_batch_threads": 2}}
+        """
+        settings = {
+            'max_batch_size': int(os.environ.get('BATCH_MAX_BATCH_SIZE', 32)),
+            'batch_timeout_micros': int(os.environ.get('BATCH_TIMEOUT_MICROS', 1000)),
+            'num_batch_threads': int(os.environ.get('BATCH_NUM_THREADS', 1))
+        }
+        parameters_file = os.environ.get('BATCHING_PARAMETERS_FILE')
+        if parameters_file:
+            with open(parameters_file) as json_file:
+                settings.update(json.load(json_file).get(model_name, {}))
+        return cls(**settings)
+
+
+def batching_enabled():
+    return os.environ.get('ENABLE_BATCHING', 'false').lower() == 'true'
+
+
+def input_signature(inputs):
+    """
+    :param inputs: dict of input name to ndarray
+    :return: (rows, signature) where requests with equal signatures can be concatenated along axis 0,
+             or (None, None) if the inputs cannot be batched
+    """
+    rows = None
+    signature = []
+    for k in sorted(inputs):
+        v = inputs[k]
+        if not isinstance(v, np.ndarray) or v.ndim == 0:
+            return None, None
+        if rows is None:
+            rows = v.shape[0]
+        elif rows != v.shape[0]:
+            return None, None
+        # string arrays of different widths still concatenate, so only the dtype kind matters for them
+        dtype = v.dtype.kind if v.dtype.kind in 'OSU' else v.dtype.str
+        signature.append((k, dtype, v.shape[1:]))
+    return rows, tuple(signature)
+
+
+def output_rows(outputs):
+    """Number of rows in a model output, or None if it has no common leading dimension"""
+    if isinstance(outputs, dict):
+        lengths = set(output_rows(v) for v in outputs.values())
+        return lengths.pop() if len(lengths) == 1 else None
+    try:
+        return len(outputs)
+    except TypeError:
+        return None
+
+
+def slice_outputs(outputs, start, end):
+    """Rows [start, end) of a model output"""
+    if isinstance(outputs, dict):
+        return {k: slice_outputs(v, start, end) for k, v in outputs.items()}
+    if hasattr(outputs, 'iloc'):
+        return outputs.iloc[start:end].reset_index(drop=True)
+    return outputs[start:end]
+
+
+class _BatchTask:
+    __slots__ = ('inputs', 'rows', 'signature', 'enqueued_at', 'dispatched_at', 'batch_rows', 'done', 'outputs',
+                 'error')
+
+    def __init__(self, inputs, rows, signature):
+        self.inputs = inputs
+        self.rows = rows
+        self.signature = signature
+        self.enqueued_at = time.monotonic()
+        self.dispatched_at = None
+        self.batch_rows = None
+        self.done = threading.Event()
+        self.outputs = None
+        self.error = None
+
+
+class BatchScheduler:
+    """
+    Gathers concurrent requests for up to max_batch_size rows or batch_timeout_micros, calls the
+    predict function once on the inputs concatenated along axis 0 and splits the output rows back to the
+    waiting callers.
+
+    The timeout is adaptive: a batch is dispatched early when, judging by the recent inter-arrival time,
+    the next request is not expected before the timeout expires.
+    """
+
+    def __init__(self, predict_func, parameters, model_name=''):
+        self.predict_func = predict_func
+        self.parameters = parameters
+        self.model_name = model_name
+        self._timeout = parameters.batch_timeout_micros / 1e6
+        self._queue = queue.Queue()
+        self._queue_depth = self._queue.qsize
+        BATCH_QUEUE_DEPTH_GAUGE.set_function(self._queue_depth, model_name=model_name)
+        self._last_arrival = None
+        self._interarrival = None
+        self._arrival_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._stopped = False
+        self._threads = []
+        for idx in range(parameters.num_batch_threads):
+            thread = threading.Thread(target=self._run, name='batch-{}-{}'.format(model_name, idx))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, inputs):
+        """
+        Run the predict function on inputs as part of a batch, blocking until the result is available
+        """
+        rows, signature = input_signature(inputs)
+        if rows is None or rows > self.parameters.max_batch_size:
+            return self.predict_func(inputs)
+
+        task = _BatchTask(inputs, rows, signature)
+        self._record_arrival(task.enqueued_at)
+        with tracing.span('batch') as batch_span:
+            with self._state_lock:
+                stopped = self._stopped
+                if not stopped:
+                    self._queue.put(task)
+            # a model unloaded while requests still hold it answers them without batching
+            if stopped:
+                return self.predict_func(inputs)
+            task.done.wait()
+            if task.dispatched_at is not None:
+                batch_span.set_attribute('queue_wait_ms', (task.dispatched_at - task.enqueued_at) * 1000)
+                batch_span.set_attribute('batch_rows', task.batch_rows)
+        if task.error is not None:
+            raise task.error
+        return task.outputs
+
+    def stop(self):
+        """Score the queued requests, then stop the batch threads"""
+        with self._state_lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            for _ in self._threads:
+                self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        BATCH_QUEUE_DEPTH_GAUGE.remove(self._queue_depth, model_name=self.model_name)
+
+    def _record_arrival(self, now):
+        with self._arrival_lock:
+            if self._last_arrival is not None:
+                gap = now - self._last_arrival
+                self._interarrival = gap if self._interarrival is None else 0.8 * self._interarrival + 0.2 * gap
+            self._last_arrival = now
+
+    def _run(self):
+        pending = None
+        while True:
+            task = pending if pending is not None else self._queue.get()
+            pending = None
+            if task is _STOP:
+                return
+
+            batch = [task]
+            rows = task.rows
+            deadline = task.enqueued_at + self._timeout
+            while rows < self.parameters.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0 and (self._interarrival is None or self._interarrival < remaining):
+                        next_task = self._queue.get(timeout=remaining)
+                    else:
+                        next_task = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_task is _STOP or next_task.signature != task.signature \
+                        or rows + next_task.rows > self.parameters.max_batch_size:
+                    pending = next_task
+                    break
+                batch.append(next_task)
+                rows += next_task.rows
+
+            with profiler.tagged('batch', self.model_name):
+                self._process(batch, rows)
+
+    def _process(self, batch, rows):
+        dispatched_at = time.monotonic()
+        for task in batch:
+            task.dispatched_at = dispatched_at
+            task.batch_rows = rows
+            BATCH_QUEUE_WAIT_HISTOGRAM.observe((dispatched_at - task.enqueued_at) * 1000, model_name=self.model_name)
+        BATCH_SIZE_HISTOGRAM.observe(rows, model_name=self.model_name)
+
+        if len(batch) == 1:
+            self._call(batch)
+            return
+
+        merged = {k: np.concatenate([task.inputs[k] for task in batch]) for k in batch[0].inputs}
+        try:
+            outputs = self.predict_func(merged)
+        except Exception as ex:
+            for task in batch:
+                task.error = ex
+                task.done.set()
+            return
+
+        if output_rows(outputs) != rows:
+            LOG.warning("Model output of batch does not have one row per input row, running requests one by one")
+            self._call(batch)
+            return
+
+        start = 0
+        for task in batch:
+            task.outputs = slice_outputs(outputs, start, start + task.rows)
+            start += task.rows
+            task.done.set()
+
+    def _call(self, batch):
+        for task in batch:
+            try:
+                task.outputs = self.predict_func(task.inputs)
+            except Exception as ex:
+                task.error = ex
+            task.done.set()
+
+
+class BatchingModel:
+    """
+    Model container proxy whose wrapper_predict_func goes through a BatchScheduler
+    """
+
+    def __init__(self, model, parameters):
+        self.model = model
+        self.scheduler = BatchScheduler(model.wrapper_predict_func, parameters, model.model_name)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def wrapper_predict_func(self, inputs):
+        return self.scheduler.submit(inputs)
+
+    def close(self):
+        self.scheduler.stop()
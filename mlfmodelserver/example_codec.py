@@ -0,0 +1,185 @@
+"""tf.Example list -> pandas DataFrame conversion for Classify and Regress"""
+import collections
+import logging
+import sys
+
+import numpy as np
+
+from mlfmodelserver import runtime
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+# value dtype of each Feature kind, float_list holds 32 bit floats on the wire
+_KIND_DTYPES = {
+    'int64_list': np.dtype(np.int64),
+    'float_list': np.dtype(np.float32),
+    'bytes_list': np.dtype(object),
+}
+
+ColumnLayout = collections.namedtuple('ColumnLayout', ['signature', 'names', 'kinds'])
+
+
+class ExampleCodecError(ValueError):
+    pass
+
+
+def _example_lists(model_input):
+    """
+    :return: the examples and the context Example of a tensorflow_serving.Input, the context is None for an
+        example_list
+    """
+    kind = model_input.WhichOneof('kind')
+    if kind == 'example_list':
+        return model_input.example_list.examples, None
+    if kind == 'example_list_with_context':
+        return model_input.example_list_with_context.examples, model_input.example_list_with_context.context
+    raise ExampleCodecError('Input has no examples')
+
+
+def _signature(example):
+    return {name: feature.WhichOneof('kind') for name, feature in example.features.feature.items()}
+
+
+def _column(values, kind):
+    if kind == 'bytes_list':
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+    return np.asarray(values, dtype=_KIND_DTYPES[kind])
+
+
+def _ragged_column(values, lengths, kind):
+    """object column holding the array of values of each row"""
+    flat = _column(values, kind)
+    column = np.empty(len(lengths), dtype=object)
+    for row, row_values in enumerate(np.split(flat, np.cumsum(lengths)[:-1])):
+        column[row] = row_values
+    return column
+
+
+class ExampleDecoder:
+    """
+    Converts the examples of a ClassificationRequest or RegressionRequest into a DataFrame
+
+    Several examples are one row each. Features are gathered column by column in a single pass over the
+    examples into numpy arrays: int64_list as int64, float_list as float32 and bytes_list as bytes objects; a
+    feature with more than one value per example becomes an object column of per-row arrays. A single
+    example keeps the columnar layout of earlier releases, where each feature holds a column of values.
+    Context features of an example_list_with_context are repeated on every row.
+
+    The column order is taken from the first request and cached, it is only recomputed when the features or
+    their kinds change: a request with as many features as the cached layout is decoded with it directly, and a
+    feature missing from it or of another kind makes the decoder recompute the layout. The servicer keeps a
+    decoder per model version.
+    """
+
+    def __init__(self):
+        self._layout = None
+
+    def layout(self, example):
+        """
+        :return: ColumnLayout of the features of the example; features without values are left out
+        """
+        signature = _signature(example)
+        layout = self._layout
+        if layout is None or layout.signature != signature:
+            names = tuple(name for name, kind in signature.items() if kind is not None)
+            layout = ColumnLayout(signature, names, tuple(signature[name] for name in names))
+            self._layout = layout
+            LOG.info("Example columns: %s", list(layout.names))
+        return layout
+
+    def decode(self, model_input):
+        """
+        :param model_input: tensorflow_serving.Input of the request
+        :return: pandas DataFrame with a column per feature
+        :raises ExampleCodecError: the examples are empty or their features do not line up
+        """
+        examples, context = _example_lists(model_input)
+        if len(examples) == 0:
+            raise ExampleCodecError('Input has no examples')
+        layout = self._layout
+        if layout is None or len(examples[0].features.feature) != len(layout.signature):
+            layout = self.layout(examples[0])
+        try:
+            columns = self._decode_examples(examples, layout)
+        except ExampleCodecError:
+            # the cached layout may be stale, e.g. a feature changed its kind; an unchanged one means bad examples
+            current = self.layout(examples[0])
+            if current is layout:
+                raise
+            layout = current
+            columns = self._decode_examples(examples, layout)
+        rows = len(next(iter(columns.values()))) if columns else len(examples)
+        names = [name for name in layout.names if name in columns]
+        if context is not None:
+            for name, feature in context.features.feature.items():
+                kind = feature.WhichOneof('kind')
+                if kind is None or name in columns:
+                    continue
+                columns[name] = self._broadcast(getattr(feature, kind).value, kind, rows)
+                names.append(name)
+        return runtime.pandas().DataFrame(columns, columns=names, copy=False)
+
+    def _decode_examples(self, examples, layout):
+        if len(examples) == 1:
+            return self._decode_columnar(examples[0], layout)
+        return self._decode_rows(examples, layout)
+
+    @staticmethod
+    def _decode_columnar(example, layout):
+        feature_map = example.features.feature
+        columns = {}
+        rows = None
+        for name, kind in zip(layout.names, layout.kinds):
+            feature = feature_map.get(name)
+            if feature is None:
+                raise ExampleCodecError('Example has no feature {}'.format(name))
+            column = _column(getattr(feature, kind).value, kind)
+            if len(column) == 0 and feature.WhichOneof('kind') not in (kind, None):
+                raise ExampleCodecError('Feature {} is a {}, expected a {}'.format(name, feature.WhichOneof('kind'),
+                                                                                   kind))
+            if len(column) == 0:
+                LOG.info("Input param %s empty, ignoring it", name)
+                continue
+            if rows is not None and len(column) != rows:
+                raise ExampleCodecError('Feature {} has {} values, expected {}'.format(name, len(column), rows))
+            rows = len(column)
+            columns[name] = column
+        return columns
+
+    @staticmethod
+    def _decode_rows(examples, layout):
+        gathered = [(name, kind, [], []) for name, kind in zip(layout.names, layout.kinds)]
+        for row, example in enumerate(examples):
+            feature_map = example.features.feature
+            for name, kind, values, lengths in gathered:
+                feature = feature_map.get(name)
+                if feature is None:
+                    raise ExampleCodecError('Example {} has no feature {}'.format(row, name))
+                row_values = getattr(feature, kind).value
+                if not row_values and feature.WhichOneof('kind') not in (kind, None):
+                    raise ExampleCodecError('Feature {} of example {} is a {}, expected a {}'.format(
+                        name, row, feature.WhichOneof('kind'), kind))
+                values.extend(row_values)
+                lengths.append(len(row_values))
+
+        columns = {}
+        for name, kind, values, lengths in gathered:
+            if len(values) == len(lengths) and min(lengths) == 1:
+                columns[name] = _column(values, kind)
+            else:
+                columns[name] = _ragged_column(values, lengths, kind)
+        return columns
+
+    @staticmethod
+    def _broadcast(values, kind, rows):
+        if len(values) == 1:
+            return np.repeat(_column(values, kind), rows)
+        column = np.empty(rows, dtype=object)
+        value = _column(values, kind)
+        for row in range(rows):
+            column[row] = value
+        return column
@@ -1,33 +1,34 @@
 """grpc server"""
 from concurrent import futures
-from datetime import datetime
+import functools
 import os
+import signal
 import sys
 import time
 import errno
 import logging
 import threading
 import json
+import weakref
 import grpc
-import tensorflow as tf
-import pandas as pd
 
 LOG=logging.getLogger(__name__)
 LOG.setLevel(logging.INFO)
 LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
-# Disabling this pylint error after checking that this line adheres to
-# tensorflow documentation
-# pylint: disable=E0611
-from tensorflow.python.framework import (
-    tensor_util,
-    dtypes
-)
 from mlpkitsecurity import SecurityError
+from mlfmodelserver import runtime
+# must run before the generated protos import tensorflow.core
+runtime.defer_tensorflow_import()
 from tensorflow_serving.apis import (
+    get_model_metadata_pb2 as tensorflow__serving_dot_apis_dot_get__model__metadata__pb2,
     predict_pb2 as tensorflow__serving_dot_apis_dot_predict__pb2,
     prediction_service_pb2 as tensorflow__serving_dot_apis_dot_prediction_service__pb2,
-    classification_pb2 as tensorflow__serving_dot_apis_dot_classification__pb2
+    classification_pb2 as tensorflow__serving_dot_apis_dot_classification__pb2,
+    regression_pb2 as tensorflow__serving_dot_apis_dot_regression__pb2
 )
+from mlfmodelserver import admission, batching, example_codec, metrics, model_metadata, model_registry, \
+    log_pipeline, prediction_cache, profiler, response_codec, stream_predict, tensor_codec, tracing
+from mlfmodelserver.streaming import streaming_predict_pb2_grpc
 from mlfmodelserver.token_validator import TokenValidator
 from mlfmodelserver.healthcheck import healthcheck_pb2 as healthcheck_dot_healthcheck__pb2, \
     healthcheck_pb2_grpc as healthcheck_dot_healthcheck__pb2__grpc
@@ -38,44 +39,175 @@ INPUT_TYPE_FLOATS = 2
 INPUT_TYPE_DOUBLES = 3
 INPUT_TYPE_STRINGS = 4
 _ONE_DAY_IN_SECONDS = 60 * 60 * 24
+SERVER_MODE_SYNC = 'sync'
+SERVER_MODE_AIO = 'aio'
+# lets several worker processes bind the same port, see mlfmodelserver.prefork
+SERVER_OPTIONS = [('grpc.so_reuseport', 1)]
+
+PREDICT_STAGE_HISTOGRAM = metrics.histogram('mlf_mc_predict_stage_ms',
+                                            'Time spent per stage of a Predict request; auth overlaps decode '
+                                            'when pipelined and auth_wait is the part of it that was not hidden',
+                                            label_names=('model_name', 'stage'))
+REQUEST_COUNTER = metrics.counter('mlf_mc_requests_total', 'Requests served, by gRPC status code',
+                                  label_names=('model_name', 'method', 'code'))
+REQUEST_DURATION_HISTOGRAM = metrics.histogram('mlf_mc_request_duration_ms', 'Time to serve a request',
+                                               label_names=('model_name', 'method'))
+
+
+class _StatusRecorder:
+    """
+    Servicer context remembering the status code the servicer set
+    """
 
+    def __init__(self, context):
+        self._context = context
+        self.code = None
 
-class Metric:
-    """
-    Metric class for abstracting all future metric reporting e.g Prometheus
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+    def set_code(self, code):
+        self.code = code
+        self._context.set_code(code)
+
+    def abort(self, code, details):
+        self.code = code
+        return self._context.abort(code, details)
+
+
+def _observed(method):
     """
+    Count the requests of a Servicer method by status code, record their duration and trace them
 
-    def __init__(self, name, model_metrics):
-        self.name = name
-        self.metrics = model_metrics
+    A request answered without a response failed token validation. Requests for models that are not served are
+    recorded without their model name, so callers cannot add label values. The span of the RPC is the current
+    span while the method runs, and profiler samples of the thread are tagged with the method and model.
+    """
+    method_name = method.__name__
+    span_name = 'tensorflow.serving.PredictionService/' + method_name
+
+    @functools.wraps(method)
+    def observed(self, request, context):
+        started = time.perf_counter()
+        recorder = _StatusRecorder(context)
+        code = grpc.StatusCode.UNKNOWN
+        model_name = request.model_spec.name if self.serves(request.model_spec.name) else ''
+        with self.tracer.start_rpc(span_name, context.invocation_metadata()) as rpc_span:
+            try:
+                with profiler.tagged(method_name, model_name):
+                    response = method(self, request, recorder)
+                code = grpc.StatusCode.OK if response is not None else grpc.StatusCode.UNAUTHENTICATED
+                return response
+            except Exception:
+                if recorder.code not in (None, grpc.StatusCode.OK):
+                    code = recorder.code
+                raise
+            finally:
+                REQUEST_COUNTER.inc(model_name=model_name, method=method_name, code=code.name)
+                REQUEST_DURATION_HISTOGRAM.observe((time.perf_counter() - started) * 1000, model_name=model_name,
+                                                   method=method_name)
+                rpc_span.set_attribute('model_name', request.model_spec.name)
+                rpc_span.set_attribute('rpc.grpc.status_code', code.value[0])
+                if code != grpc.StatusCode.OK:
+                    rpc_span.set_status(tracing.STATUS_ERROR, code.name)
+    return observed
+
+
+class _ModelCodecs:
+    """
+    Example decoder and classification encoder of one model version, each caching the layout of that model
+    """
+    __slots__ = ('example_decoder', 'classification_encoder')
 
-    def report(self):
-        """
-        Log metrics
-        """
-        LOG.info(self.metrics)
+    def __init__(self, classify_top_k):
+        self.example_decoder = example_codec.ExampleDecoder()
+        self.classification_encoder = response_codec.ClassificationEncoder(top_k=classify_top_k)
 
 
 class Servicer(tensorflow__serving_dot_apis_dot_prediction_service__pb2.PredictionServiceServicer):
     """
     class Servicer
     """
+    prediction_cache = None
+    auth_executor = None
+    # CLASSIFY_TOP_K of the classification encoders
+    classify_top_k = 0
+    model = None
+    metadata_cache = None
+    registry = None
+    payload_logger = None
+    # ENABLE_TOKEN_VALIDATION, without it the auth stage accepts every request
+    validate_tokens = False
+    # times the stages of every request, exports nothing until create_servicer configures it
+    tracer = tracing.Tracer()
+    _codecs = None
+    _codecs_lock = threading.Lock()
+
+    def model_for(self, request, context=None):
+        """
+        Model container serving the model_spec of a request, from the registry when the server serves several
+        models or versions
+        """
+        if self.registry is not None:
+            try:
+                return self.registry.model(request.model_spec)
+            except model_registry.ModelNotFoundError:
+                if context is not None:
+                    context.set_code(grpc.StatusCode.NOT_FOUND)
+                raise
+        if request.model_spec.name != self.model.model_name:
+            LOG.error("Model spec name and model env name does not match")
+            if context is not None:
+                context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+            raise NotImplementedError('Model spec name and model env does not match' +
+                                      str('Model spec name' + request.model_spec.name))
+        return self.model
+
+    def model_codecs(self, model):
+        """
+        :param model: model container serving a request
+        :return: _ModelCodecs of the model version, created on its first request and dropped with the version, so
+            requests alternating between models keep the column layout and label table of each
+        """
+        codecs = self._codecs
+        if codecs is None:
+            with self._codecs_lock:
+                if self._codecs is None:
+                    self._codecs = weakref.WeakKeyDictionary()
+                codecs = self._codecs
+        model_codecs = codecs.get(model)
+        if model_codecs is None:
+            with self._codecs_lock:
+                model_codecs = codecs.setdefault(model, _ModelCodecs(self.classify_top_k))
+        return model_codecs
+
+    def serves(self, model_name):
+        if self.registry is not None:
+            return self.registry.serves(model_name)
+        return self.model is not None and model_name == self.model.model_name
+
+    def version_retired(self, model_name, model_version):
+        """Drop what is cached for a model version the registry replaced"""
+        if self.metadata_cache is not None:
+            self.metadata_cache.discard(model_name, model_version)
+        if self.prediction_cache is not None:
+            self.prediction_cache.invalidate(model_name, model_version)
 
     def _Validations(self, request, context):
         try:
             metadata = context.invocation_metadata()
 
-            token_validator = TokenValidator(context, metadata)
-            LOG.info("Model Name %s", request.model_spec.name)
-            LOG.info("Start of validating token")
-            token_result = True#token_validator.validate_token()
+            LOG.debug("Model Name %s", request.model_spec.name)
+            token_result = True
+            if self.validate_tokens:
+                LOG.debug("Start of validating token")
+                try:
+                    token_result, _ = TokenValidator(context, metadata).validate_token()
+                except Exception as ex:
+                    context.set_code(grpc.StatusCode.UNAUTHENTICATED)
+                    raise SecurityError('Token not validated: {}'.format(getattr(ex, 'message', str(ex)))) from ex
 
-            if request.model_spec.name != self.model.model_name:
-                LOG.error("Model spec name and model env name does not match")
-                context.set_code(grpc.StatusCode.UNIMPLEMENTED)
-                raise NotImplementedError('Model spec name and model env does not match' +
-                                          str('Model spec name' + request.model_spec.name))
-                return False
+            model = self.model_for(request, context)
             if request.model_spec.name is None:
                 LOG.error("Model spec name and model env name does not match")
                 context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -84,9 +216,9 @@ class Servicer(tensorflow__serving_dot_apis_dot_prediction_service__pb2.Predicti
                 return False
 
             if token_result is True:
-                LOG.info('token validated successfully')
+                LOG.debug('token validated successfully')
                 context.set_code(grpc.StatusCode.OK)
-                context.set_details(self.model.model_name)
+                context.set_details(model.model_name)
                 return True
 
             return False
@@ -97,68 +229,37 @@ class Servicer(tensorflow__serving_dot_apis_dot_prediction_service__pb2.Predicti
 
 
 
+    @_observed
     def Classify(self, request, context):
         try:
-            example = request.input.example_list.examples[0]
-
-            start_time_millis = self.getCurrentTimeinMillis()
-            time_1 = datetime.now()
-            if self._Validations(request, context) is True:
-                time_2 = datetime.now()
-
-                example = request.input.example_list.examples[0]
-
-                idx = 0
-                final_input = []
-                final_labels = []
-                for k in example.features.feature.keys():
-                    v = example.features.feature[k]
-                    int_list_value = list(v.int64_list.value)
-                    float_list_value = list(v.float_list.value)
-                    byte_list_value = list(v.bytes_list.value)
-
-                    if len(int_list_value) > 0:
-                        final_input.append(int_list_value)
-                        final_labels.append(k)
-                    elif len(float_list_value) > 0:
-                        final_input.append(float_list_value)
-                        final_labels.append(k)
-                    elif len(byte_list_value) > 0:
-                        final_input.append(byte_list_value)
-                        final_labels.append(k)
-                    else:
-                        LOG.info("Input param empty, ignoring it")
-                    idx = idx + 1
-
-                classification_request = pd.DataFrame.from_records(list(zip(*final_input)), columns=final_labels)
+            rpc_span = tracing.current_span()
+            if self._traced_validations(request, context, rpc_span) is True:
+                model = self.model_for(request, context)
+                codecs = self.model_codecs(model)
+                with rpc_span.child('decode'):
+                    classification_request = codecs.example_decoder.decode(request.input)
 
                 try:
-                    classification_outputs = self.model.wrapper_classification_func(classification_request)
-                    LOG.info("the output from the model's classification function %s", classification_outputs)
+                    with rpc_span.child('model'):
+                        classification_outputs = model.wrapper_classification_func(classification_request)
+                    if self.payload_logger is not None:
+                        self.payload_logger.log(model.model_name, 'Classify', classification_request,
+                                                classification_outputs)
                     response = tensorflow__serving_dot_apis_dot_classification__pb2.ClassificationResponse()
 
                 except grpc.RpcError as grpc_error:
-                    end_time_millis = self.getCurrentTimeinMillis()
                     LOG.error("Error while doing Classification")
-                    requestDurationInMillis = str(end_time_millis - start_time_millis)
-                    self.logRequests(self.model.model_name, requestDurationInMillis, str(0))
                     LOG.error("grpc error : %s", str(grpc_error))
                     s = getattr(grpc_error, 'message', str(grpc_error))
                     raise grpc.RpcError(grpc_error)
                     return None
 
-                classifications = []
-                for idx in range(0, classification_request.shape[0]):
-                    classes = []
-                    classification = tensorflow__serving_dot_apis_dot_classification__pb2.Classifications()
-                    for k, v in classification_outputs.items():
-                        class_data = tensorflow__serving_dot_apis_dot_classification__pb2.Class()
-                        class_data.label = "Class-" + k
-                        class_data.score = v[idx]
-                        classes.append(class_data)
-                    classification.classes.extend(classes)
-                    classifications.append(classification)
-                response.result.classifications.extend(classifications)
+                class_names, scores = response_codec.score_matrix(classification_outputs)
+                if scores.shape[0] != classification_request.shape[0]:
+                    raise ValueError("Classification function returned {} rows for {} examples".format(
+                        scores.shape[0], classification_request.shape[0]))
+                with rpc_span.child('encode'):
+                    codecs.classification_encoder.encode(class_names, scores, response.result)
 
                 return response
             else:
@@ -169,84 +270,154 @@ class Servicer(tensorflow__serving_dot_apis_dot_prediction_service__pb2.Predicti
             return None
 
 
-    def Predict(self, request, context):
+    @_observed
+    def Regress(self, request, context):
         try:
-            start_time_millis = self.getCurrentTimeinMillis()
-            time_1 = datetime.now()
-            if self._Validations(request, context):
-                time_2 = datetime.now()
-                predict_request = {}
+            rpc_span = tracing.current_span()
+            if self._traced_validations(request, context, rpc_span) is not True:
+                return None
+            model = self.model_for(request, context)
+            if not hasattr(model, 'wrapper_regression_func'):
+                message = 'Model {} has no regression function'.format(model.model_name)
+                context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+                context.set_details(message)
+                raise NotImplementedError(message)
 
-                for k, v in request.inputs.items():
-                    predict_request[k] = tensor_util.MakeNdarray(request.inputs[k])
-                    if v.dtype == dtypes.string:
-                        predict_request[k] = predict_request[k].astype(str)
+            with rpc_span.child('decode'):
+                regression_request = self.model_codecs(model).example_decoder.decode(request.input)
 
-                time_3 = datetime.now()
+            try:
+                # a single call scores every example of the request
+                with rpc_span.child('model'):
+                    regression_outputs = model.wrapper_regression_func(regression_request)
+            except grpc.RpcError as grpc_error:
+                LOG.error("Error while doing Regression")
+                LOG.error("grpc error : %s", str(grpc_error))
+                raise grpc.RpcError(grpc_error)
+
+            values = response_codec.regression_values(regression_outputs)
+            if len(values) != regression_request.shape[0]:
+                raise ValueError("Regression function returned {} values for {} examples".format(
+                    len(values), regression_request.shape[0]))
+            response = tensorflow__serving_dot_apis_dot_regression__pb2.RegressionResponse()
+            with rpc_span.child('encode'):
+                response_codec.encode_regressions(values, response.result)
+            return response
+        except Exception as ex:
+            s = getattr(ex, 'message', str(ex))
+            raise Exception(s)
 
-                for k, v in predict_request.items():
-                    LOG.info("the key  :%s", k)
-                    LOG.info("the value :%s", v)
-                # Add the more specific try catch request for predict request
+    @_observed
+    def GetModelMetadata(self, request, context):
+        """Answered with the serialized response cached when the version loaded, see metadata_rpc_handler"""
+        try:
+            if self._Validations(request, context) is not True:
+                return None
+            model = self.model_for(request, context)
+            unsupported = [field for field in request.metadata_field
+                           if field != model_metadata.SIGNATURE_DEF_FIELD]
+            if unsupported:
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                raise ValueError('Unsupported metadata fields {}, only {} is available'.format(
+                    unsupported, model_metadata.SIGNATURE_DEF_FIELD))
+
+            if self.metadata_cache is None:
+                self.metadata_cache = model_metadata.ModelMetadataCache()
+            response = self.metadata_cache.response(model)
+            if response is None:
+                context.set_code(grpc.StatusCode.NOT_FOUND)
+                raise ValueError('Model {} declares no signature'.format(model.model_name))
+            return response
+        except Exception as ex:
+            s = getattr(ex, 'message', str(ex))
+            raise Exception(s)
 
-                try:
-                    predict_outputs = self.model.wrapper_predict_func(predict_request)
-                    LOG.info("the output from the model's predict function %s", predict_outputs)
-                    response = tensorflow__serving_dot_apis_dot_predict__pb2.PredictResponse()
-                except grpc.RpcError as grpc_error:
-                    end_time_millis = self.getCurrentTimeinMillis()
-                    LOG.error("Error while doing Prediction")
-                    requestDurationInMillis = str(end_time_millis - start_time_millis)
-                    self.logRequests(self.model.model_name, requestDurationInMillis, str(0))
-                    LOG.error("grpc error : %s", str(grpc_error))
-                    s = getattr(grpc_error, 'message', str(grpc_error))
-                    raise grpc.RpcError(grpc_error)
-                    return None
+    def _traced_validations(self, request, context, rpc_span):
+        with rpc_span.child('auth'):
+            return self._Validations(request, context)
 
-                for k, v in predict_outputs.items():
-                    # Disabling this pylint error after checking that this line adheres to
-                    # tensorflow documentation
-                    # pylint: disable=E1101
-                    response.outputs[k].CopyFrom(tf.contrib.util.make_tensor_proto(v))
-                ''' here print the response time taken to serve the request '''
-
-                time_4 = datetime.now()
-                end_time_millis = self.getCurrentTimeinMillis()
-
-                validation_time_ms = (time_2 - time_1).microseconds
-                parse_time = (time_3 - time_2).microseconds
-                handle_time = (time_4 - time_3).microseconds
-                model_metrics = {"mlf_mc_model_name": self.model.model_name,
-                                 "mlf_mc_token_validation_time_ms": validation_time_ms / 1000,
-                                 "mlf_mc_parse_time_ms": parse_time / 1000,
-                                 "mlf_mc_handle_time_ms": handle_time / 1000
-                                 }
-                self.collect_metrics(self.model.model_name, model_metrics)
-                requestDurationInMillis = str(end_time_millis - start_time_millis)
-                self.logRequests(self.model.model_name, requestDurationInMillis, str(1))
-                return response
-            else:
-                requestDurationInMillis = self.getCurrentTimeinMillis()
-                LOG.error("Error while validating JWT token, token not validated successfully")
-                self.logRequests(self.model.model_name, requestDurationInMillis, str(0))
+    def _pipelined_validations(self, request, context, rpc_span):
+        model_name = request.model_spec.name if self.serves(request.model_spec.name) else ''
+        with profiler.tagged('Predict', model_name):
+            return self._traced_validations(request, context, rpc_span)
+
+    def _await_authorization(self, authorization, rpc_span):
+        with rpc_span.child('auth_wait'):
+            return authorization.result()
+
+    def _record_stages(self, model_name, rpc_span):
+        for stage in rpc_span.children:
+            PREDICT_STAGE_HISTOGRAM.observe(stage.duration_ms(), model_name=model_name, stage=stage.name)
+        PREDICT_STAGE_HISTOGRAM.observe(rpc_span.duration_ms(), model_name=model_name, stage='total')
+
+    @_observed
+    def Predict(self, request, context):
+        try:
+            rpc_span = tracing.current_span()
+            authorization = None
+            if self.auth_executor is not None:
+                # the token is validated while the inputs are hashed and decoded, the model only runs once
+                # authorization passed
+                authorization = self.auth_executor.submit(self._pipelined_validations, request, context, rpc_span)
+            elif not self._traced_validations(request, context, rpc_span):
+                return self._unauthorized_predict()
+
+            try:
+                model = self.model_for(request, context)
+            except Exception:
+                if authorization is not None:
+                    self._await_authorization(authorization, rpc_span)
+                raise
+            cache_key = None
+            if self.prediction_cache is not None and \
+                    not prediction_cache.bypass_requested(context.invocation_metadata()):
+                model_version = getattr(model, 'model_version', '')
+                cache_key = prediction_cache.request_key(request, model_version)
+                response = self.prediction_cache.get(cache_key, model.model_name, model_version)
+                if response is not None:
+                    if authorization is not None and not self._await_authorization(authorization, rpc_span):
+                        return self._unauthorized_predict()
+                    return response
+
+            try:
+                with rpc_span.child('decode'):
+                    predict_request = tensor_codec.decode_inputs(request.inputs)
+            except Exception:
+                # an unauthorized caller gets the authorization error, not the one about its inputs
+                if authorization is not None:
+                    self._await_authorization(authorization, rpc_span)
+                raise
+            if authorization is not None and not self._await_authorization(authorization, rpc_span):
+                return self._unauthorized_predict()
+
+            try:
+                with rpc_span.child('model'):
+                    predict_outputs = model.wrapper_predict_func(predict_request)
+                if self.payload_logger is not None:
+                    self.payload_logger.log(model.model_name, 'Predict', predict_request, predict_outputs)
+                response = tensorflow__serving_dot_apis_dot_predict__pb2.PredictResponse()
+            except grpc.RpcError as grpc_error:
+                LOG.error("Error while doing Prediction")
+                LOG.error("grpc error : %s", str(grpc_error))
+                s = getattr(grpc_error, 'message', str(grpc_error))
+                raise grpc.RpcError(grpc_error)
                 return None
 
+            with rpc_span.child('encode'):
+                tensor_codec.encode_outputs(predict_outputs, response.outputs)
+            if cache_key is not None:
+                self.prediction_cache.put(cache_key, model.model_name, model_version, response)
+            self._record_stages(model.model_name, rpc_span)
+            return response
+
         except Exception as ex:
             s = getattr(ex, 'message', str(ex))
             raise Exception(s)
             return None
 
-    def logRequests(self, model_name, requestDurationInMillis, success):
-        current_time = datetime.now().isoformat()
-        LOG.info(current_time + " :" + " ModelName: [" + str(model_name) + "] Success: [" + success + "]" +
-                 " RequestDurationMillis: [" + str(requestDurationInMillis) + "]")
-
-    def collect_metrics(self, model_name, model_metrics):
-        metrics = Metric(model_name, model_metrics)
-        metrics.report()
-
-    def getCurrentTimeinMillis(self):
-        return int(round(time.time() * 1000))
+    def _unauthorized_predict(self):
+        LOG.error("Error while validating JWT token, token not validated successfully")
+        return None
 
     def Check(self, request, context):
         # Disabling this pylint error as the healthcheck
@@ -341,20 +512,76 @@ class GrpcServer:
         self.model_health_status = None
         self.pod_health_status_path = None
         self.model_env = self.read_env()
+        # SIGTERM stops taking new RPCs and lets the ones in flight finish for that long
+        self.stop_grace_seconds = float(os.environ.get('GRPC_STOP_GRACE_SECONDS', 15))
         self.createhealthstatuslog()
 
-    def start(self, model, port):
-        LOG.info("Starting gRPC Server")
-        model_env = self.read_env()
+    def create_servicer(self, model):
+        """
+        :param model: model container, or a ModelRegistry serving several models or versions
+        """
         servicer = Servicer()
-        servicer.model = model
+        servicer.metadata_cache = model_metadata.ModelMetadataCache()
+
+        def loaded(model_container):
+            servicer.metadata_cache.add(model_container)
+            return serving_model(model_container)
+
+        if isinstance(model, model_registry.ModelRegistry):
+            model.use_wrapper(loaded)
+            model.on_retire(servicer.version_retired)
+            servicer.registry = model
+            servicer.model = None
+        else:
+            servicer.model = loaded(model)
+        servicer.classify_top_k = response_codec.ClassificationEncoder.from_env().top_k
+        servicer.tracer = tracing.Tracer.from_env()
+        servicer.payload_logger = log_pipeline.PayloadLogger.from_env()
+        if servicer.payload_logger is not None:
+            LOG.info("Payload logging: %s", servicer.payload_logger)
+        if servicer.tracer.exporter is not None:
+            LOG.info("Tracing: %s", servicer.tracer)
+        servicer.validate_tokens = os.environ.get('ENABLE_TOKEN_VALIDATION', 'false').lower() == 'true'
+        if not servicer.validate_tokens:
+            LOG.warning("Token validation disabled, set ENABLE_TOKEN_VALIDATION=true to validate bearer tokens")
+        auth_workers = int(os.environ.get('PREDICT_AUTH_WORKERS', 0))
+        if auth_workers > 0:
+            LOG.info("Pipelined Predict: token validation on %s threads", auth_workers)
+            servicer.auth_executor = futures.ThreadPoolExecutor(max_workers=auth_workers,
+                                                                thread_name_prefix='predict-auth')
+        if prediction_cache.cache_enabled():
+            servicer.prediction_cache = prediction_cache.PredictionCache.from_env()
+            LOG.info("Prediction cache enabled: %s", servicer.prediction_cache)
 #        servicer.pod_health_status_path = self.pod_health_status_path
-        servicer.model_env = model_env
+        servicer.model_env = self.read_env()
+        if servicer.registry is not None:
+            servicer.registry.start_watcher()
+        return servicer
 
-        server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    def serve(self, model, port):
+        """
+        Serve the model on port without blocking
 
+        :return: the started grpc server, stop it with server.stop(grace)
+        """
+        log_pipeline.install()
+        LOG.info("Starting gRPC Server")
+        servicer = self.create_servicer(model)
+        profiler.install_from_env()
+        metrics.serve_from_env()
+
+        controller = admission.AdmissionController.from_env()
+        LOG.info("Admission control: %s", controller)
+        executor = admission.AdmissionExecutor(controller)
+        server = grpc.server(executor, interceptors=[admission.AdmissionInterceptor(controller, executor)],
+                             options=SERVER_OPTIONS)
+
+        server.add_generic_rpc_handlers((metadata_rpc_handler(servicer.GetModelMetadata),))
         tensorflow__serving_dot_apis_dot_prediction_service__pb2. \
             add_PredictionServiceServicer_to_server(servicer, server)
+        streaming_servicer = stream_predict.StreamingServicer.from_env(servicer)
+        LOG.info("Streaming Predict: %s", streaming_servicer)
+        streaming_predict_pb2_grpc.add_StreamingPredictionServiceServicer_to_server(streaming_servicer, server)
 
 #        healthcheck_dot_healthcheck__pb2__grpc. \
 #            add_HealthServicer_to_server(servicer, server)
@@ -368,15 +595,60 @@ class GrpcServer:
         server.start()
         LOG.info('Server started successfully on port: %s ...', str(port))
         LOG.info('Enjoy!')
+        return server
+
+    def start(self, model, port):
+        server = self.serve(model, port)
 
         if self.pod_health_status_path:
-            healthexporter = AsyncWrite(model_env, self.get_model_health_status(),
+            healthexporter = AsyncWrite(self.model_env, self.get_model_health_status(),
                                         self.pod_health_status_path)
             healthexporter.start()
             healthexporter.join()
 
+        terminated = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: terminated.set())
         try:
-            while True:
-                time.sleep(_ONE_DAY_IN_SECONDS)
+            while not terminated.wait(_ONE_DAY_IN_SECONDS):
+                pass
         except KeyboardInterrupt:
             server.stop(0)
+            return
+        LOG.info("Received SIGTERM, stopping the server within %s s", self.stop_grace_seconds)
+        server.stop(self.stop_grace_seconds).wait()
+
+
+def metadata_rpc_handler(behavior):
+    """
+    GetModelMetadata sending the serialized response returned by behavior as it is; registered ahead of the
+    generated PredictionService handlers, which would serialize a response message
+    """
+    return grpc.method_handlers_generic_handler('tensorflow.serving.PredictionService', {
+        'GetModelMetadata': grpc.unary_unary_rpc_method_handler(
+            behavior,
+            request_deserializer=tensorflow__serving_dot_apis_dot_get__model__metadata__pb2.
+            GetModelMetadataRequest.FromString)
+    })
+
+
+def serving_model(model):
+    """Model container as served, behind a batch scheduler when batching is enabled"""
+    if batching.batching_enabled():
+        parameters = batching.BatchingParameters.from_env(model.model_name)
+        LOG.info("Batching enabled for model %s: %s", model.model_name, parameters)
+        return batching.BatchingModel(model, parameters)
+    return model
+
+
+def create_server(server_mode=SERVER_MODE_SYNC):
+    """
+    :param server_mode: 'sync' for a thread per RPC, 'aio' for the asyncio server
+    :return: server whose start(model, port) serves the model
+    """
+    if server_mode == SERVER_MODE_AIO:
+        from mlfmodelserver.aio_server import AioGrpcServer
+        return AioGrpcServer()
+    if server_mode != SERVER_MODE_SYNC:
+        raise ValueError('Unknown server mode: {}'.format(server_mode))
+    return GrpcServer()
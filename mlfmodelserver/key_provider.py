@@ -0,0 +1,119 @@
+"""JWT validation keys parsed once and reloaded when they change"""
+import collections
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+
+from mlpkitsecurity import SecurityError
+from mlpkitsecurity.token_utils import load_public_keys
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+_BEGIN_STATEMENT = "-----BEGIN PUBLIC KEY-----"
+_END_STATEMENT = "-----END PUBLIC KEY-----"
+
+ValidationKeys = collections.namedtuple('ValidationKeys', ['public_keys', 'fingerprint'])
+
+
+def format_public_key(key):
+    """
+    PEM of the keys given either as PEM, possibly on a single line, or as the bare base64 body of one key
+    """
+    if _BEGIN_STATEMENT in key and _END_STATEMENT in key:
+        return key
+    return _BEGIN_STATEMENT + "\n" + key.strip() + "\n" + _END_STATEMENT
+
+
+def parse_validation_keys(key):
+    """
+    :param key: PEM with one or more public keys, or the base64 body of a single key
+    :return: ValidationKeys with the parsed public keys and a fingerprint identifying them. The key type is the
+        one of the verifier backend chosen by mlpkitsecurity get_verifier(): a cryptography RSAPublicKey, or an
+        rsa.PublicKey without the cryptography package or with MLP_JWT_VERIFIER=rsa
+    """
+    pem = format_public_key(key)
+    public_keys = load_public_keys(pem)
+    fingerprint = hashlib.sha256(''.join(pem.split()).encode('utf-8')).digest()
+    return ValidationKeys(public_keys, fingerprint)
+
+
+class KeyProvider:
+    """
+    Serves the parsed JWT validation keys from memory
+
+    Keys are read from the file named by JWT_VALIDATION_KEY_FILE, e.g. a mounted secret, or else from the
+    JWT_VALIDATION_KEY environment variable. The file is checked for changes at most every
+    check_interval_seconds and re-parsed when its modification time or size changed; if the new content does
+    not parse, the previous keys stay in use.
+    """
+
+    def __init__(self, key_file=None, check_interval_seconds=10):
+        self.key_file = key_file
+        self.check_interval_seconds = check_interval_seconds
+        self._keys = None
+        self._source = None
+        self._next_check = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(key_file=os.environ.get('JWT_VALIDATION_KEY_FILE'),
+                   check_interval_seconds=float(os.environ.get('JWT_VALIDATION_KEY_CHECK_SECONDS', 10)))
+
+    def keys(self):
+        """
+        :return: ValidationKeys currently in use
+        :raises SecurityError: no key is configured
+        """
+        if self.key_file:
+            if self._keys is None or time.monotonic() >= self._next_check:
+                self._reload_file()
+        elif self._keys is None or os.environ.get('JWT_VALIDATION_KEY') != self._source:
+            self._reload_env()
+        if self._keys is None:
+            raise SecurityError('No JWT validation key configured', code=500)
+        return self._keys
+
+    def _reload_env(self):
+        key = os.environ.get('JWT_VALIDATION_KEY')
+        with self._lock:
+            if key is None:
+                self._keys = self._source = None
+                return
+            if self._source == key and self._keys is not None:
+                return
+            self._keys = parse_validation_keys(key)
+            self._source = key
+            LOG.info('Loaded %s JWT validation keys from JWT_VALIDATION_KEY', len(self._keys.public_keys))
+
+    def _reload_file(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._keys is not None and now < self._next_check:
+                return
+            self._next_check = now + self.check_interval_seconds
+            try:
+                stat = os.stat(self.key_file)
+            except OSError as ex:
+                LOG.error('Cannot read JWT validation key file %s: %s', self.key_file, ex)
+                return
+            source = (stat.st_mtime_ns, stat.st_size)
+            if source == self._source:
+                return
+            try:
+                with open(self.key_file) as key_file:
+                    keys = parse_validation_keys(key_file.read())
+            except Exception as ex:
+                if self._keys is None:
+                    raise SecurityError('Invalid JWT validation key file {}: {}'.format(self.key_file, ex),
+                                        root_cause=ex, code=500)
+                LOG.error('Keeping the previous JWT validation keys, %s does not parse: %s', self.key_file, ex)
+                return
+            self._keys = keys
+            self._source = source
+            LOG.info('Loaded %s JWT validation keys from %s', len(keys.public_keys), self.key_file)
@@ -0,0 +1,258 @@
+"""Logging off the request path: records are queued to a writer thread and written in batches as JSON lines"""
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from mlfmodelserver import metrics
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+PAYLOAD_LOG = logging.getLogger('mlfmodelserver.payload')
+
+FORMAT_JSON = 'json'
+FORMAT_TEXT = 'text'
+DROP_QUEUE_FULL = 'queue_full'
+DROP_RATE_LIMITED = 'rate_limited'
+
+# attributes every LogRecord has, the others were passed in extra and are logged as fields
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+_STOP = object()
+_MAX_RATE_LIMITED_MESSAGES = 10000
+
+DROPPED_RECORD_COUNTER = metrics.counter('mlf_mc_log_records_dropped_total',
+                                         'Log records not written: queue full or rate limited',
+                                         label_names=('reason',))
+
+
+def _json_default(value, max_items=1000):
+    shape = getattr(value, 'shape', None)
+    if shape is not None and hasattr(value, 'dtype'):
+        size = getattr(value, 'size', 0)
+        if size > max_items:
+            return {'shape': list(shape), 'dtype': str(value.dtype)}
+        return value.tolist()
+    if hasattr(value, 'to_dict') and hasattr(value, 'shape'):
+        if value.size > max_items:
+            return {'shape': list(value.shape), 'columns': [str(column) for column in value.columns]}
+        return value.to_dict('list')
+    return str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record: time, level, logger, message and the fields passed in extra
+
+    Arrays and frames of more than max_items values are written as their shape.
+    """
+
+    def __init__(self, max_items=1000):
+        super().__init__()
+        self.max_items = max_items
+
+    def _default(self, value):
+        return _json_default(value, self.max_items)
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(
+                timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=self._default, separators=(',', ':'))
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through up to burst warnings and errors of the same logger and message template, refilled at
+    rate_per_second; lower levels pass. The next record let through after some were dropped carries their count
+    in its suppressed field.
+    """
+
+    def __init__(self, rate_per_second=10.0, burst=20):
+        super().__init__()
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) >= _MAX_RATE_LIMITED_MESSAGES and key not in self._buckets:
+                self._buckets.clear()
+            tokens, updated_at, suppressed = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate_per_second)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+                DROPPED_RECORD_COUNTER.inc(reason=DROP_RATE_LIMITED)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class AsyncHandler(logging.Handler):
+    """
+    Queues records without blocking the logging thread; a daemon thread formats them and writes each batch with
+    a single write and flush. Records beyond max_queue_size are dropped.
+
+    The arguments of a record are formatted on the writer thread, after the logging call returned.
+    """
+
+    def __init__(self, stream=None, max_queue_size=10000, max_batch_size=512):
+        super().__init__()
+        self.stream = sys.stdout if stream is None else stream
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue(max_queue_size)
+        self._thread = threading.Thread(target=self._run, name='log-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __repr__(self):
+        return 'AsyncHandler(queue={}, formatter={})'.format(self._queue.maxsize, type(self.formatter).__name__)
+
+    def handle(self, record):
+        # no handler lock: the queue is thread safe
+        passed = self.filter(record)
+        if passed:
+            self.emit(record)
+        return passed
+
+    def emit(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            DROPPED_RECORD_COUNTER.inc(reason=DROP_QUEUE_FULL)
+
+    def flush(self):
+        """Wait until the queued records are written"""
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Write the queued records, then stop the writer thread"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        super().close()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not _STOP]
+            if records:
+                self._write(records)
+            for _ in batch:
+                self._queue.task_done()
+            if len(records) < len(batch):
+                return
+
+    def _write(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        try:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+        except Exception:
+            self.handleError(records[-1])
+
+
+class PayloadLogger:
+    """
+    Logs the inputs and outputs of a sample of the requests on the mlfmodelserver.payload logger
+    """
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+
+    def __repr__(self):
+        return 'PayloadLogger(sample_rate={})'.format(self.sample_rate)
+
+    @classmethod
+    def from_env(cls):
+        """
+        :return: PayloadLogger for LOG_PAYLOAD_SAMPLE_RATE, None when it is 0, the default
+        """
+        sample_rate = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', 0))
+        if sample_rate <= 0:
+            return None
+        return cls(sample_rate)
+
+    def log(self, model_name, method, inputs, outputs):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        PAYLOAD_LOG.info('%s payload of model %s', method, model_name,
+                         extra={'model_name': model_name, 'method': method, 'inputs': inputs, 'outputs': outputs})
+
+
+_INSTALLED = []
+
+
+def _replaceable(handler):
+    return type(handler) is logging.StreamHandler and handler.stream in (sys.stdout, sys.stderr)
+
+
+def install(log_format=None, stream=None):
+    """
+    Route the mlfmodelserver loggers and the __main__ logger through one AsyncHandler, in place of the stdout
+    handler each module attaches; loggers of modules imported later keep their own handler
+
+    LOG_FORMAT is 'json' (default) or 'text', LOG_QUEUE_SIZE bounds the queue (default 10000), LOG_ERROR_RATE and
+    LOG_ERROR_BURST rate limit repeated warnings and errors (default 10 per second after a burst of 20).
+
+    :return: the AsyncHandler, the same one on every call
+    """
+    if _INSTALLED:
+        return _INSTALLED[0]
+    log_format = (log_format or os.environ.get('LOG_FORMAT', FORMAT_JSON)).lower()
+    if log_format not in (FORMAT_JSON, FORMAT_TEXT):
+        raise ValueError('Unknown LOG_FORMAT: {}'.format(log_format))
+    handler = AsyncHandler(stream, max_queue_size=int(os.environ.get('LOG_QUEUE_SIZE', 10000)))
+    handler.setFormatter(JsonFormatter() if log_format == FORMAT_JSON else logging.Formatter())
+    handler.addFilter(RateLimitFilter(float(os.environ.get('LOG_ERROR_RATE', 10)),
+                                      int(os.environ.get('LOG_ERROR_BURST', 20))))
+    names = [name for name in list(logging.Logger.manager.loggerDict)
+             if name in ('__main__', 'mlfmodelserver') or name.startswith('mlfmodelserver.')]
+    for name in names:
+        logger = logging.getLogger(name)
+        replaced = [existing for existing in logger.handlers if _replaceable(existing)]
+        for existing in replaced:
+            logger.removeHandler(existing)
+        if replaced:
+            logger.addHandler(handler)
+    PAYLOAD_LOG.addHandler(handler)
+    PAYLOAD_LOG.setLevel(logging.INFO)
+    PAYLOAD_LOG.propagate = False
+    _INSTALLED.append(handler)
+    LOG.info("Logging through %s", handler)
+    return handler
@@ -0,0 +1,361 @@
+"""Model server metrics, served in the Prometheus text format"""
+import bisect
+import logging
+import math
+import os
+import sys
+import threading
+import urllib.parse
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+# Upper bounds of the default histogram buckets, in milliseconds
+DEFAULT_LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+DEFAULT_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Shards:
+    """
+    One dict of values per thread, so recording a value takes no lock; the dicts are merged when collected
+
+    The values of threads that ended are folded into one retired dict on the next collection.
+    """
+
+    def __init__(self, merge):
+        self._merge = merge
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def local(self):
+        """dict of values of the calling thread"""
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), values))
+            return values
+
+    def snapshot(self):
+        """
+        :return: list of dicts of values to merge, not to be modified
+        """
+        with self._lock:
+            live = []
+            for thread_ref, values in self._shards:
+                thread = thread_ref()
+                if thread is None or not thread.is_alive():
+                    self._retired = self._merge([self._retired, values])
+                else:
+                    live.append((thread_ref, values))
+            self._shards = live
+            return [self._retired] + [values.copy() for _, values in live]
+
+
+def _add_counts(dicts):
+    merged = {}
+    for values in dicts:
+        for key, value in values.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _add_states(dicts):
+    merged = {}
+    for values in dicts:
+        for key, state in values.items():
+            total = merged.get(key)
+            if total is None:
+                merged[key] = list(state)
+            else:
+                for index, value in enumerate(state):
+                    total[index] += value
+    return merged
+
+
+class Counter:
+    """
+    Monotonically increasing counter, optionally split by label values
+    """
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._shards = _Shards(_add_counts)
+
+    def inc(self, amount=1, **labels):
+        """
+        Increment the counter for the given label values
+        """
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        values = self._shards.local()
+        values[key] = values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        return sum(values.get(key, 0) for values in self._shards.snapshot())
+
+    def collect(self):
+        """
+        :return: list of (label values, value) tuples
+        """
+        return list(_add_counts(self._shards.snapshot()).items())
+
+    def samples(self):
+        for key, value in self.collect():
+            yield self.name, self.label_names, key, value
+
+
+class Gauge:
+    """
+    Current value, optionally split by label values, set directly or read from a function when collected
+    """
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._functions = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function, **labels):
+        """
+        :param function: called without arguments on each collection, returns the value for the label values
+        """
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            self._functions[key] = function
+
+    def remove(self, function=None, **labels):
+        """Drop the label values, or only their function if it is still the given one"""
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            if function is None or self._functions.get(key) is function:
+                self._functions.pop(key, None)
+                self._values.pop(key, None)
+
+    def value(self, **labels):
+        return dict(self.collect()).get(tuple(labels.get(name, '') for name in self.label_names))
+
+    def collect(self):
+        """
+        :return: list of (label values, value) tuples
+        """
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                values[key] = function()
+            except Exception as ex:
+                LOG.warning("Gauge %s%s not collected: %s", self.name, key, ex)
+        return list(values.items())
+
+    def samples(self):
+        for key, value in self.collect():
+            yield self.name, self.label_names, key, value
+
+
+class Histogram:
+    """
+    Cumulative bucket histogram, optionally split by label values
+    """
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS_MS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _Shards(_add_states)
+
+    def observe(self, value, **labels):
+        """
+        Record one observation for the given label values
+        """
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        values = self._shards.local()
+        state = values.get(key)
+        if state is None:
+            # one slot per bucket plus the +Inf bucket, followed by the sum; the count is the sum of the slots
+            state = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def collect(self):
+        """
+        :return: list of (label values, cumulative bucket counts, sum, count) tuples
+        """
+        result = []
+        for key, state in _add_states(self._shards.snapshot()).items():
+            cumulative = []
+            total = 0
+            for count in state[:-1]:
+                total += count
+                cumulative.append(total)
+            result.append((key, cumulative, state[-1], total))
+        return result
+
+    def samples(self):
+        bounds = [_format_value(bound) for bound in self.buckets] + ['+Inf']
+        bucket_labels = self.label_names + ('le',)
+        for key, cumulative, total, count in self.collect():
+            for bound, bucket_count in zip(bounds, cumulative):
+                yield self.name + '_bucket', bucket_labels, key + (bound,), bucket_count
+            yield self.name + '_sum', self.label_names, key, total
+            yield self.name + '_count', self.label_names, key, count
+
+
+_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _get_or_create(metric_class, name, documentation, **kwargs):
+    with _REGISTRY_LOCK:
+        metric = _REGISTRY.get(name)
+        if metric is None:
+            metric = _REGISTRY[name] = metric_class(name, documentation, **kwargs)
+        elif not isinstance(metric, metric_class):
+            raise ValueError('Metric {} is already registered as {}'.format(name, type(metric).__name__))
+        return metric
+
+
+def counter(name, documentation, label_names=()):
+    """Get or register a counter"""
+    return _get_or_create(Counter, name, documentation, label_names=label_names)
+
+
+def gauge(name, documentation, label_names=()):
+    """Get or register a gauge"""
+    return _get_or_create(Gauge, name, documentation, label_names=label_names)
+
+
+def histogram(name, documentation, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS_MS):
+    """Get or register a histogram"""
+    return _get_or_create(Histogram, name, documentation, label_names=label_names, buckets=buckets)
+
+
+def registered_metrics():
+    """All registered metrics, sorted by name"""
+    with _REGISTRY_LOCK:
+        return [_REGISTRY[name] for name in sorted(_REGISTRY)]
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if value.is_integer():
+            return str(int(value)) if abs(value) < 1e15 else repr(value)
+        return repr(value)
+    return str(value)
+
+
+def _escape(value, quote=True):
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quote else value
+
+
+def exposition():
+    """
+    :return: all registered metrics in the Prometheus text format
+    """
+    lines = []
+    for metric in registered_metrics():
+        lines.append('# HELP {} {}'.format(metric.name, _escape(metric.documentation, quote=False)))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.type_name))
+        for name, label_names, label_values, value in metric.samples():
+            if label_names:
+                labels = ','.join('{}="{}"'.format(label, _escape(label_value))
+                                  for label, label_value in zip(label_names, label_values))
+                lines.append('{}{{{}}} {}'.format(name, labels, _format_value(value)))
+            else:
+                lines.append('{} {}'.format(name, _format_value(value)))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+_ENDPOINTS = {}
+
+
+def add_endpoint(path, function):
+    """
+    Serve function on path of the metrics port, e.g. an admin endpoint
+
+    :param function: called with the dict of query parameters, returns (content type, body str); a ValueError
+        answers 400
+    """
+    _ENDPOINTS[path] = function
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path in ('/', '/metrics'):
+            content_type, body = CONTENT_TYPE, exposition()
+        elif url.path in _ENDPOINTS:
+            query = dict(urllib.parse.parse_qsl(url.query))
+            try:
+                content_type, body = _ENDPOINTS[url.path](query)
+            except ValueError as ex:
+                self.send_error(400, str(ex))
+                return
+        else:
+            self.send_error(404)
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='0.0.0.0'):
+    """
+    Serve the registered metrics on http://host:port/metrics from a daemon thread
+
+    :return: the HTTPServer, shutdown() stops it
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http')
+    thread.daemon = True
+    thread.start()
+    LOG.info("Metrics served on port %s", server.server_address[1])
+    return server
+
+
+def serve_from_env():
+    """
+    Start the metrics endpoint on METRICS_PORT, if set; worker process n of a prefork server uses
+    METRICS_PORT + n
+
+    :return: the HTTPServer, None if METRICS_PORT is not set
+    """
+    port = int(os.environ.get('METRICS_PORT', 0))
+    if port <= 0:
+        return None
+    return start_http_server(port + int(os.environ.get('MODEL_CONTAINER_WORKER_ID', 0)),
+                             host=os.environ.get('METRICS_HOST', '0.0.0.0'))
@@ -0,0 +1,289 @@
+"""Model server config file: the entries of its model_config_list and their version policies, cached per file"""
+import ast
+import logging
+import os
+import re
+import sys
+import threading
+from collections import namedtuple
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+POLICY_LATEST = 'latest'
+POLICY_ALL = 'all'
+POLICY_SPECIFIC = 'specific'
+
+_TOKEN = re.compile(r'\s+|#[^\n]*|(?P<string>"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\')'
+                    r'|(?P<symbol>[{}<>\[\]:,;])|(?P<word>[^\s{}<>\[\]:,;"\'#]+)')
+_INTEGER = re.compile(r'-?\d+$')
+_CLOSING = {'{': '}', '<': '>'}
+
+
+class ModelConfigError(ValueError):
+    pass
+
+
+class VersionPolicy(namedtuple('VersionPolicy', ['kind', 'num_versions', 'versions'])):
+    """
+    model_version_policy of a model: the latest num_versions versions, all versions or the specific versions
+    """
+
+    def select(self, available):
+        """
+        :param available: version numbers found in the base path of the model
+        :return: sorted list of the versions to serve
+        """
+        available = sorted(set(available))
+        if self.kind == POLICY_ALL:
+            return available
+        if self.kind == POLICY_SPECIFIC:
+            return [version for version in available if version in self.versions]
+        return available[-self.num_versions:]
+
+
+DEFAULT_VERSION_POLICY = VersionPolicy(POLICY_LATEST, 1, ())
+
+ModelConfig = namedtuple('ModelConfig', ['name', 'base_path', 'model_platform', 'version_policy'])
+
+
+def _tokens(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None:
+            raise ModelConfigError('Unterminated string in model config at {!r}'.format(text[pos:pos + 20]))
+        if match.lastgroup is not None:
+            tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        pos = match.end()
+    return tokens
+
+
+def _scalar(kind, value):
+    if kind == 'string':
+        return ast.literal_eval(value)
+    if _INTEGER.match(value):
+        return int(value)
+    return value
+
+
+def _parse_message(tokens, pos, closing):
+    """
+    :return: dict of field name to the list of its values and the position after the message
+    """
+    fields = {}
+    while pos < len(tokens):
+        kind, value = tokens[pos]
+        if kind == 'symbol' and value == closing:
+            return fields, pos + 1
+        if kind == 'symbol' and value in ',;':
+            pos += 1
+            continue
+        if kind != 'word':
+            raise ModelConfigError('Expected a field name in model config, got {!r}'.format(value))
+        name = value
+        pos += 1
+        if pos < len(tokens) and tokens[pos] == ('symbol', ':'):
+            pos += 1
+        if pos >= len(tokens):
+            raise ModelConfigError('Missing value of field {} in model config'.format(name))
+        kind, value = tokens[pos]
+        values = fields.setdefault(name, [])
+        if kind == 'symbol' and value == '[':
+            pos += 1
+            while pos < len(tokens) and tokens[pos] != ('symbol', ']'):
+                kind, value = tokens[pos]
+                if kind == 'symbol' and value in _CLOSING:
+                    message, pos = _parse_message(tokens, pos + 1, _CLOSING[value])
+                    values.append(message)
+                elif kind == 'symbol' and value == ',':
+                    pos += 1
+                elif kind == 'symbol':
+                    raise ModelConfigError('Unexpected {!r} in list {} of model config'.format(value, name))
+                else:
+                    values.append(_scalar(kind, value))
+                    pos += 1
+            pos += 1
+        elif kind == 'symbol' and value in _CLOSING:
+            message, pos = _parse_message(tokens, pos + 1, _CLOSING[value])
+            values.append(message)
+        elif kind == 'symbol':
+            raise ModelConfigError('Unexpected {!r} after field {} in model config'.format(value, name))
+        else:
+            values.append(_scalar(kind, value))
+            pos += 1
+    if closing is not None:
+        # deployed config files exist without the last closing brace, they were accepted before
+        LOG.warning("Model config ends before the closing %r", closing)
+    return fields, pos
+
+
+def parse_text_proto(text):
+    """
+    Parse the text format of a protobuf message without its descriptor
+
+    :return: dict of field name to the list of its values, a value is a str, an int or a nested dict
+    """
+    fields, _ = _parse_message(_tokens(text), 0, None)
+    return fields
+
+
+def _field(message, name, default=None):
+    values = message.get(name)
+    if not values:
+        return default
+    return values[-1]
+
+
+def version_policy(message):
+    """
+    :param message: parsed model_version_policy, e.g. {'latest': [{'num_versions': [2]}]}
+    :return: VersionPolicy
+    """
+    if message is None:
+        return DEFAULT_VERSION_POLICY
+    if POLICY_ALL in message:
+        return VersionPolicy(POLICY_ALL, None, ())
+    if POLICY_SPECIFIC in message:
+        versions = _field(message, POLICY_SPECIFIC).get('versions', [])
+        if not versions or not all(isinstance(version, int) for version in versions):
+            raise ModelConfigError('Specific version policy needs integer versions: {}'.format(versions))
+        return VersionPolicy(POLICY_SPECIFIC, None, tuple(sorted(set(versions))))
+    if POLICY_LATEST in message:
+        num_versions = _field(_field(message, POLICY_LATEST), 'num_versions', 1)
+        if not isinstance(num_versions, int) or num_versions < 1:
+            raise ModelConfigError('Latest version policy needs a positive num_versions: {}'.format(num_versions))
+        return VersionPolicy(POLICY_LATEST, num_versions, ())
+    raise ModelConfigError('Unknown model_version_policy: {}'.format(sorted(message)))
+
+
+def model_configs(text):
+    """
+    :param text: ModelServerConfig in text format
+    :return: list of ModelConfig, one per entry of the model_config_list
+    """
+    configs = []
+    for config_list in parse_text_proto(text).get('model_config_list', []):
+        for config in config_list.get('config', []):
+            name = _field(config, 'name')
+            base_path = _field(config, 'base_path')
+            if not name or not base_path:
+                raise ModelConfigError('Model config without name or base_path: {}'.format(config))
+            configs.append(ModelConfig(str(name), str(base_path), _field(config, 'model_platform', ''),
+                                       version_policy(_field(config, 'model_version_policy'))))
+    if not configs:
+        raise ModelConfigError('No model in model_config_list')
+    names = [config.name for config in configs]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise ModelConfigError('Models configured more than once: {}'.format(duplicates))
+    return configs
+
+
+def read_model_configs(config_file_path):
+    """
+    :return: list of ModelConfig of the model config file
+    """
+    with open(config_file_path) as config_file:
+        return model_configs(config_file.read())
+
+
+class ModelServerConfig:
+    """
+    Models of a config file in file order, indexed by name
+    """
+
+    def __init__(self, configs):
+        self.configs = tuple(configs)
+        self.by_name = {config.name: config for config in self.configs}
+
+    def __repr__(self):
+        return 'ModelServerConfig({})'.format([config.name for config in self.configs])
+
+    def model(self, name):
+        """
+        :return: ModelConfig of the model, None if it is not configured
+        """
+        return self.by_name.get(name)
+
+
+class ConfigFile:
+    """
+    Model config file, parsed on the first load and again only when its modification time or size changed
+
+    A changed file that does not parse is logged and the config read before stays.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._stat = None
+        self._config = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'ConfigFile({})'.format(self.path)
+
+    def load(self):
+        """
+        :return: ModelServerConfig, the same object as long as the file did not change
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            raise FileNotFoundError("File Not Found")
+        key = (stat.st_mtime_ns, stat.st_size)
+        config = self._config
+        if config is not None and self._stat == key:
+            return config
+        with self._lock:
+            if self._config is not None and self._stat == key:
+                return self._config
+            try:
+                config = ModelServerConfig(read_model_configs(self.path))
+            except ModelConfigError as ex:
+                if self._config is None:
+                    raise
+                LOG.error("Changed model config %s not applied: %s", self.path, ex)
+                config = self._config
+            else:
+                if self._config is not None:
+                    LOG.info("Model config %s changed: %s", self.path, config)
+            self._config = config
+            self._stat = key
+            return config
+
+
+_CONFIG_FILES = {}
+_CONFIG_FILES_LOCK = threading.Lock()
+
+
+def config_file(config_file_path):
+    """
+    :return: the ConfigFile of a path, shared by its callers
+    """
+    path = os.path.abspath(config_file_path)
+    with _CONFIG_FILES_LOCK:
+        cached = _CONFIG_FILES.get(path)
+        if cached is None:
+            cached = _CONFIG_FILES[path] = ConfigFile(path)
+        return cached
+
+
+def get_model_spec(config_file_path, delimiter=':'):
+    """
+    :param config_file_path: model config file
+    :param delimiter: separator of field names and values; the text format only has ':', with any other
+        delimiter no field is found
+    :return: model spec as key value pair, the name and base_path of the first configured model
+    """
+    config = config_file(config_file_path).load().configs[0]
+    if delimiter != ':':
+        return {}
+    return {'name': config.name, 'base_path': config.base_path}
+
+
+def serves_several_versions_or_models(configs):
+    """True if the config needs a model registry instead of a single model container"""
+    return len(configs) > 1 or configs[0].version_policy != DEFAULT_VERSION_POLICY
@@ -0,0 +1,188 @@
+"""Model signatures for GetModelMetadata, built once when a model version is loaded"""
+import json
+import logging
+import os
+import sys
+import threading
+
+import numpy as np
+
+from mlfmodelserver import runtime
+# must run before the generated protos import tensorflow.core
+runtime.defer_tensorflow_import()
+from tensorflow.core.protobuf import meta_graph_pb2
+from tensorflow_serving.apis import get_model_metadata_pb2 as tensorflow__serving_dot_apis_dot_get__model__metadata__pb2
+from mlfmodelserver import tensor_codec
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+SIGNATURE_FILE = 'signature.json'
+WARMUP_REQUEST_FILE = 'warmup_request.json'
+SIGNATURE_DEF_FIELD = 'signature_def'
+DEFAULT_SIGNATURE = 'serving_default'
+PREDICT_METHOD_NAME = 'tensorflow/serving/predict'
+
+
+class ModelMetadataError(ValueError):
+    pass
+
+
+def tensor_info(name, data_type, shape):
+    """
+    :param shape: list of dimension sizes, -1 for an unknown size; None for an unknown rank
+    :return: TensorInfo
+    """
+    info = meta_graph_pb2.TensorInfo(name=name, dtype=data_type)
+    if shape is None:
+        info.tensor_shape.unknown_rank = True
+    else:
+        for size in shape:
+            info.tensor_shape.dim.add().size = int(size)
+    return info
+
+
+def _tensor_infos(tensors, tensor_map):
+    for name, spec in tensors.items():
+        try:
+            data_type = tensor_codec.data_type(spec['dtype'])
+        except (KeyError, TypeError, tensor_codec.TensorCodecError) as ex:
+            raise ModelMetadataError('Invalid dtype of tensor {}: {}'.format(name, ex))
+        tensor_map[name].CopyFrom(tensor_info(name, data_type, spec.get('shape')))
+
+
+def signature_def_map(signatures):
+    """
+    :param signatures: dict of signature name to a dict with the method_name and the inputs and outputs, each a
+        dict of tensor name to {"dtype": numpy dtype name or "string", "shape": [-1, 3]}; a dict with inputs and
+        outputs alone is the serving_default signature
+    :return: SignatureDefMap
+    """
+    if 'inputs' in signatures or 'outputs' in signatures:
+        signatures = {DEFAULT_SIGNATURE: signatures}
+    signature_map = tensorflow__serving_dot_apis_dot_get__model__metadata__pb2.SignatureDefMap()
+    for name, signature in signatures.items():
+        signature_def = signature_map.signature_def[name]
+        signature_def.method_name = signature.get('method_name', PREDICT_METHOD_NAME)
+        _tensor_infos(signature.get('inputs', {}), signature_def.inputs)
+        _tensor_infos(signature.get('outputs', {}), signature_def.outputs)
+    return signature_map
+
+
+def _batch_shape(shape):
+    """shape with the batch dimension unknown"""
+    return [-1] + list(shape[1:]) if shape else []
+
+
+def probe_signature_def_map(predict_func, inputs):
+    """
+    Run a warmup request through the model and describe its inputs and outputs
+
+    :param predict_func: wrapper_predict_func of the model
+    :param inputs: dict of input name to ndarray
+    :return: SignatureDefMap with the serving_default signature, the batch dimension is left unknown
+    """
+    outputs = predict_func(inputs)
+    signature_map = tensorflow__serving_dot_apis_dot_get__model__metadata__pb2.SignatureDefMap()
+    signature_def = signature_map.signature_def[DEFAULT_SIGNATURE]
+    signature_def.method_name = PREDICT_METHOD_NAME
+    for name, values in inputs.items():
+        data_type, shape = tensor_codec.output_spec(values)
+        signature_def.inputs[name].CopyFrom(tensor_info(name, data_type, _batch_shape(shape)))
+    for name, values in outputs.items():
+        data_type, shape = tensor_codec.output_spec(values)
+        signature_def.outputs[name].CopyFrom(tensor_info(name, data_type, _batch_shape(shape)))
+    return signature_map
+
+
+def read_warmup_inputs(path):
+    """
+    :param path: JSON file with a value per input, either a nested list or {"dtype": "float32", "value": ...}
+    :return: dict of input name to ndarray
+    """
+    with open(path) as warmup_file:
+        request = json.load(warmup_file)
+    inputs = {}
+    for name, value in request.items():
+        if isinstance(value, dict):
+            inputs[name] = np.asarray(value['value'], dtype=value.get('dtype'))
+        else:
+            inputs[name] = np.asarray(value)
+    return inputs
+
+
+def load_signature_def_map(model_base_path, predict_func=None):
+    """
+    SignatureDefMap of a model version, declared in its signature.json or else probed with the inputs of its
+    warmup_request.json
+
+    :param model_base_path: directory of the model version
+    :param predict_func: wrapper_predict_func of the model, used for the warmup probe
+    :return: SignatureDefMap, None if the model declares no signature or the probe failed
+    """
+    signature_path = os.path.join(model_base_path, SIGNATURE_FILE)
+    if os.path.isfile(signature_path):
+        with open(signature_path) as signature_file:
+            signature_map = signature_def_map(json.load(signature_file))
+        LOG.info("Model signatures read from %s", signature_path)
+        return signature_map
+    warmup_path = os.path.join(model_base_path, WARMUP_REQUEST_FILE)
+    if predict_func is not None and os.path.isfile(warmup_path):
+        try:
+            signature_map = probe_signature_def_map(predict_func, read_warmup_inputs(warmup_path))
+        except Exception as ex:
+            LOG.error("Warmup request %s failed, model metadata not available: %s", warmup_path, ex)
+            return None
+        LOG.info("Model signature probed with %s", warmup_path)
+        return signature_map
+    LOG.info("No %s or %s in %s, model metadata not available", SIGNATURE_FILE, WARMUP_REQUEST_FILE,
+             model_base_path)
+    return None
+
+
+def metadata_response(model_name, model_version, signature_map):
+    response = tensorflow__serving_dot_apis_dot_get__model__metadata__pb2.GetModelMetadataResponse()
+    response.model_spec.name = model_name
+    if str(model_version).isdigit():
+        response.model_spec.version.value = int(model_version)
+    response.metadata[SIGNATURE_DEF_FIELD].Pack(signature_map)
+    return response
+
+
+class ModelMetadataCache:
+    """
+    Serialized GetModelMetadataResponse per served model name and version, built when the version is loaded
+    """
+
+    def __init__(self):
+        self._responses = {}
+        self._lock = threading.Lock()
+
+    def add(self, model):
+        """
+        Serialize the GetModelMetadataResponse of a loaded model version
+
+        :return: the serialized response, None if the model has no signature_def_map
+        """
+        key = (model.model_name, getattr(model, 'model_version', ''))
+        signature_map = getattr(model, 'signature_def_map', None)
+        serialized = None if signature_map is None else \
+            metadata_response(key[0], key[1], signature_map).SerializeToString()
+        with self._lock:
+            self._responses[key] = serialized
+        return serialized
+
+    def response(self, model):
+        """
+        :return: serialized GetModelMetadataResponse, None if the model has no signature_def_map; a model that
+            was not added when it loaded is added on its first request
+        """
+        try:
+            return self._responses[(model.model_name, getattr(model, 'model_version', ''))]
+        except KeyError:
+            return self.add(model)
+
+    def discard(self, model_name, model_version):
+        with self._lock:
+            self._responses.pop((model_name, model_version), None)
@@ -0,0 +1,429 @@
+"""Models and model versions served by one process, routed by model spec and unloaded under a memory budget"""
+import gc
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import weakref
+
+from mlfmodelserver import metrics
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+MODEL_LOAD_COUNTER = metrics.counter('mlf_mc_model_loads_total', 'Model versions loaded', label_names=('model_name',))
+MODEL_UNLOAD_COUNTER = metrics.counter('mlf_mc_model_unloads_total', 'Model versions unloaded, to stay in the '
+                                       'memory budget or because a newer version replaced them',
+                                       label_names=('model_name', 'reason'))
+MODEL_LOAD_FAILURE_COUNTER = metrics.counter('mlf_mc_model_load_failures_total', 'New model versions that failed to '
+                                             'load or warm up', label_names=('model_name',))
+MODEL_LOAD_HISTOGRAM = metrics.histogram('mlf_mc_model_load_ms', 'Time to load a model version',
+                                         label_names=('model_name',))
+
+_PAGE_SIZE = resource.getpagesize()
+
+UNLOAD_MEMORY = 'memory'
+UNLOAD_RETIRED = 'retired'
+
+
+class ModelNotFoundError(LookupError):
+    pass
+
+
+def resident_memory():
+    """Resident set size of this process in bytes, 0 where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def version_polling_enabled():
+    return float(os.environ.get('MODEL_VERSION_POLL_SECONDS', 0)) > 0
+
+
+def version_policy_enabled():
+    """
+    The model_version_policy of a config listing a single model is applied only with
+    MODEL_VERSION_POLICY_ENABLED=true, the generated configs all carry one
+    """
+    return os.environ.get('MODEL_VERSION_POLICY_ENABLED', 'false').lower() == 'true'
+
+
+def available_versions(base_path):
+    """Version numbers of the directories named with a number in the base path of a model"""
+    return [int(entry) for entry in os.listdir(base_path)
+            if entry.isdigit() and os.path.isdir(os.path.join(base_path, entry))]
+
+
+def find_model_version(base_path):
+    """
+    :return: name of the version directory with the highest number in the base path of a model
+    """
+    versions = available_versions(base_path)
+    if not versions:
+        message = "No directory named with number in the model base path to denote the version"
+        LOG.error(message)
+        raise ValueError(message)
+    return str(max(versions))
+
+
+class _Slot:
+    __slots__ = ('config', 'version', 'model', 'served', 'size_bytes', 'last_used', 'retired')
+
+    def __init__(self, config, version):
+        self.config = config
+        self.version = version
+        self.model = None
+        self.served = None
+        self.size_bytes = 0
+        self.last_used = 0.0
+        self.retired = False
+
+
+class ModelRegistry:
+    """
+    Versions of the configured models, each loaded at startup or on its first request
+
+    Requests are routed on (model_spec.name, model_spec.version) with one dict lookup, a request without a version
+    goes to the newest served version of the model. The memory of a model version is the growth of the resident
+    set while it first loaded; once the loaded versions exceed memory_budget_bytes the least recently used ones are
+    unloaded and loaded again on their next request. A budget of 0 keeps every version loaded.
+
+    The size of a version is measured once and kept: memory freed on unload mostly stays with the process, so a
+    version loaded again would measure next to nothing.
+
+    refresh() picks up version directories added or removed since: new versions are loaded and warmed up while
+    the current ones keep serving, then swapped in at once. Replaced versions stop taking requests and are freed
+    when the calls still running on them return.
+    """
+
+    def __init__(self, load_func, memory_budget_bytes=0, memory_usage=resident_memory, poll_seconds=0):
+        """
+        :param load_func: function (ModelConfig, version string) returning a model container
+        :param poll_seconds: interval of the version directory checks of start_watcher, 0 to not check
+        """
+        self.load_func = load_func
+        self.memory_budget_bytes = int(memory_budget_bytes)
+        self.memory_usage = memory_usage
+        self.poll_seconds = poll_seconds
+        self._configs = []
+        self._config_file = None
+        self._server_config = None
+        self._slots = {}
+        self._latest = {}
+        # bytes of each (name, version) measured on its first load
+        self._sizes = {}
+        # (slot, served model, reason) taken out under the load lock, closed once it is released
+        self._unloaded = []
+        self._wrap = None
+        self._retire_callbacks = []
+        self._load_lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._watcher = None
+
+    @classmethod
+    def from_env(cls, load_func):
+        """
+        MODEL_MEMORY_BUDGET_MB is the memory budget of the loaded model versions (default 0, no budget) and
+        MODEL_VERSION_POLL_SECONDS the interval of the checks for new version directories (default 0, none)
+        """
+        return cls(load_func, memory_budget_bytes=float(os.environ.get('MODEL_MEMORY_BUDGET_MB', 0)) * 1024 * 1024,
+                   poll_seconds=float(os.environ.get('MODEL_VERSION_POLL_SECONDS', 0)))
+
+    def __repr__(self):
+        return 'ModelRegistry(models={}, memory_budget_bytes={})'.format(
+            ['{}:{}'.format(name, version) for name, version in sorted(self._slots)], self.memory_budget_bytes)
+
+    def add(self, model_config):
+        """
+        Register the versions of a model selected by its version policy
+        """
+        versions = model_config.version_policy.select(available_versions(model_config.base_path))
+        if not versions:
+            raise ValueError('No version of model {} in {} matches {}'.format(
+                model_config.name, model_config.base_path, model_config.version_policy))
+        with self._load_lock:
+            self._configs.append(model_config)
+            for version in versions:
+                self._slots[(model_config.name, version)] = _Slot(model_config, version)
+            self._latest[model_config.name] = self._slots[(model_config.name, versions[-1])]
+        LOG.info("Model %s versions %s registered", model_config.name, versions)
+
+    def use_config_file(self, config_file):
+        """
+        Register the models of a ConfigFile; refresh() then also adds the models added to the file and retires
+        the ones removed from it
+        """
+        self._server_config = config_file.load()
+        self._config_file = config_file
+        for config in self._server_config.configs:
+            self.add(config)
+
+    def on_retire(self, callback):
+        """
+        :param callback: function (model name, version string) called after a version was replaced
+        """
+        self._retire_callbacks.append(callback)
+
+    def served_versions(self, model_name):
+        return sorted(version for name, version in self._slots if name == model_name)
+
+    def serves(self, model_name):
+        return model_name in self._latest
+
+    def refresh(self):
+        """
+        Load the versions added to the base paths that the version policies select and retire the versions they
+        no longer select. A version that fails to load or warm up is left out until its directory changes; if
+        no version is left, the served ones stay.
+        """
+        with self._refresh_lock:
+            try:
+                if self._config_file is not None:
+                    try:
+                        self._apply_config(self._config_file.load())
+                    except OSError as ex:
+                        LOG.error("Model config %s not read: %s", self._config_file.path, ex)
+                for config in list(self._configs):
+                    try:
+                        self._refresh_model(config)
+                    except OSError as ex:
+                        LOG.error("Versions of model %s not checked: %s", config.name, ex)
+            finally:
+                self._release_unloaded()
+
+    def _apply_config(self, server_config):
+        if server_config is self._server_config:
+            return
+        self._server_config = server_config
+        removed = [config for config in self._configs if server_config.model(config.name) is None]
+        with self._load_lock:
+            self._configs = list(server_config.configs)
+            for config in self._configs:
+                for (name, _), slot in self._slots.items():
+                    if name == config.name:
+                        slot.config = config
+            for config in removed:
+                LOG.info("Model %s removed from the config", config.name)
+                self._latest.pop(config.name, None)
+                self._retire([self._slots.pop(key) for key in list(self._slots) if key[0] == config.name])
+
+    def _retire(self, slots):
+        for slot in slots:
+            slot.retired = True
+            if slot.model is not None:
+                self._unload(slot, UNLOAD_RETIRED)
+            LOG.info("Model %s version %s retired", slot.config.name, slot.version)
+            for callback in self._retire_callbacks:
+                callback(slot.config.name, str(slot.version))
+
+    def _refresh_model(self, config):
+        available = available_versions(config.base_path)
+        served = set(self.served_versions(config.name))
+        loaded = {}
+        for version in config.version_policy.select(available):
+            if version not in served:
+                new_slot = self._load_new_version(config, version)
+                if new_slot is not None:
+                    loaded[version] = new_slot
+        # a newer version that failed does not push out one that still serves
+        selected = config.version_policy.select([version for version in available
+                                                 if version in served or version in loaded])
+        if not selected:
+            if served:
+                LOG.warning("No version of model %s left in %s, serving versions %s", config.name, config.base_path,
+                            sorted(served))
+            else:
+                LOG.error("No version of model %s in %s can be served", config.name, config.base_path)
+            return
+        with self._load_lock:
+            for version in selected:
+                if version in loaded:
+                    self._slots[(config.name, version)] = loaded[version]
+                    LOG.info("Model %s version %s serving", config.name, version)
+            self._latest[config.name] = self._slots[(config.name, selected[-1])]
+            self._retire([self._slots.pop((config.name, version)) for version in sorted(served - set(selected))])
+            for slot in loaded.values():
+                if slot.version in selected:
+                    self._unload_least_recently_used(keep=slot)
+                else:
+                    self._unload(slot, UNLOAD_RETIRED)
+
+    def _load_new_version(self, config, version):
+        slot = _Slot(config, version)
+        try:
+            model, size_bytes, duration_ms = self._load_model(slot)
+            warmup = getattr(model, 'warmup', None)
+            if warmup is not None:
+                warmup()
+        except Exception as ex:
+            MODEL_LOAD_FAILURE_COUNTER.inc(model_name=config.name)
+            LOG.error("Model %s version %s failed to load, not serving it: %s", config.name, version, ex)
+            return None
+        with self._load_lock:
+            self._install(slot, model, size_bytes, duration_ms)
+        return slot
+
+    def start_watcher(self):
+        """Check for new versions every poll_seconds on a background thread, once per process"""
+        if self.poll_seconds <= 0 or self._watcher is not None:
+            return
+        self._watcher = VersionWatcher(self, self.poll_seconds)
+        self._watcher.start()
+        LOG.info("Checking for new model versions every %s s", self.poll_seconds)
+
+    def stop_watcher(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def load_all(self):
+        """
+        Load the registered versions, newest first, until the memory budget is used up
+        """
+        for slot in sorted(self._slots.values(), key=lambda slot: -slot.version):
+            if self.memory_budget_bytes and self.loaded_bytes() >= self.memory_budget_bytes:
+                LOG.info("Memory budget used up, %s:%s and older versions load on their first request",
+                         slot.config.name, slot.version)
+                break
+            self._load(slot)
+
+    def use_wrapper(self, wrap):
+        """
+        :param wrap: function applied to a model container when it is loaded, e.g. to put it behind a batch
+            scheduler; called in the serving process, after a prefork
+        """
+        with self._load_lock:
+            self._wrap = wrap
+            for slot in self._slots.values():
+                if slot.model is not None:
+                    slot.served = wrap(slot.model)
+
+    def loaded_bytes(self):
+        return sum(slot.size_bytes for slot in self._slots.values() if slot.model is not None)
+
+    def model(self, model_spec):
+        """
+        :param model_spec: ModelSpec of a request
+        :return: model container serving it, loaded if it is not
+        :raises ModelNotFoundError: if the model or version is not served
+        """
+        if model_spec.HasField('version'):
+            slot = self._slots.get((model_spec.name, model_spec.version.value))
+        else:
+            slot = self._latest.get(model_spec.name)
+        if slot is None:
+            raise ModelNotFoundError('Model {} version {} is not served'.format(
+                model_spec.name, model_spec.version.value if model_spec.HasField('version') else 'latest'))
+        slot.last_used = time.monotonic()
+        served = slot.served
+        if served is None:
+            served = self._load(slot)
+        return served
+
+    def _load(self, slot):
+        try:
+            with self._load_lock:
+                if slot.served is not None:
+                    return slot.served
+                if slot.retired:
+                    raise ModelNotFoundError('Model {} version {} was replaced'.format(slot.config.name,
+                                                                                       slot.version))
+                self._install(slot, *self._load_model(slot))
+                self._unload_least_recently_used(keep=slot)
+                return slot.served
+        finally:
+            self._release_unloaded()
+
+    def _load_model(self, slot):
+        started = time.perf_counter()
+        memory_before = self.memory_usage()
+        model = self.load_func(slot.config, str(slot.version))
+        size_bytes = self._sizes.setdefault((slot.config.name, slot.version),
+                                            max(self.memory_usage() - memory_before, 0))
+        return model, size_bytes, (time.perf_counter() - started) * 1000
+
+    def _install(self, slot, model, size_bytes, duration_ms):
+        slot.size_bytes = size_bytes
+        slot.model = model
+        slot.served = model if self._wrap is None else self._wrap(model)
+        slot.last_used = time.monotonic()
+        MODEL_LOAD_COUNTER.inc(model_name=slot.config.name)
+        MODEL_LOAD_HISTOGRAM.observe(duration_ms, model_name=slot.config.name)
+        LOG.info("Model %s version %s loaded in %.0f ms, %s bytes", slot.config.name, slot.version, duration_ms,
+                 size_bytes)
+
+    def _unload_least_recently_used(self, keep):
+        if not self.memory_budget_bytes:
+            return
+        loaded = sorted((slot for slot in self._slots.values() if slot.model is not None and slot is not keep),
+                        key=lambda slot: slot.last_used)
+        total = self.loaded_bytes()
+        for slot in loaded:
+            if total <= self.memory_budget_bytes:
+                return
+            total -= slot.size_bytes
+            self._unload(slot, UNLOAD_MEMORY)
+        if total > self.memory_budget_bytes:
+            LOG.warning("Model %s version %s alone exceeds the memory budget of %s bytes", keep.config.name,
+                        keep.version, self.memory_budget_bytes)
+
+    def _unload(self, slot, reason):
+        """Stop routing requests to a version, called under the load lock; _release_unloaded closes it"""
+        self._unloaded.append((slot, slot.served, reason))
+        slot.served = None
+        slot.model = None
+
+    def _release_unloaded(self):
+        """
+        Close the versions unloaded since the last call, outside the load lock: closing a batch scheduler scores
+        its queued requests first, which must not hold up the loads and lookups of other requests
+        """
+        with self._load_lock:
+            unloaded, self._unloaded = self._unloaded, []
+        for slot, served, reason in unloaded:
+            # requests holding the model finish with it, it is freed after the last one
+            try:
+                released = weakref.finalize(served, LOG.info, "Model %s version %s released", slot.config.name,
+                                            slot.version)
+                released.atexit = False
+            except TypeError:
+                pass
+            close = getattr(served, 'close', None)
+            if close is not None:
+                close()
+            MODEL_UNLOAD_COUNTER.inc(model_name=slot.config.name, reason=reason)
+            LOG.info("Model %s version %s unloaded", slot.config.name, slot.version)
+        if unloaded:
+            # the last references held here, the models go with the calls still running on them
+            del unloaded, slot, served
+            gc.collect()
+
+
+class VersionWatcher(threading.Thread):
+    """
+    Daemon thread calling ModelRegistry.refresh every poll_seconds
+    """
+
+    def __init__(self, registry, poll_seconds):
+        threading.Thread.__init__(self, name='model-version-watcher')
+        self.daemon = True
+        self.registry = registry
+        self.poll_seconds = poll_seconds
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.poll_seconds):
+            try:
+                self.registry.refresh()
+            except Exception as ex:
+                LOG.error("Checking for new model versions failed: %s", ex)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
@@ -0,0 +1,155 @@
+"""In-process cache of Predict responses keyed on the request content and the model version"""
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from mlfmodelserver import metrics
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+# request metadata key skipping the cache for one request
+BYPASS_HEADER = 'x-mlf-cache-bypass'
+
+EVICTION_SIZE = 'size'
+EVICTION_EXPIRED = 'expired'
+EVICTION_VERSION = 'version'
+
+HIT_COUNTER = metrics.counter('mlf_mc_prediction_cache_hits_total', 'Predict requests served from the cache',
+                              label_names=('model_name',))
+MISS_COUNTER = metrics.counter('mlf_mc_prediction_cache_misses_total', 'Predict requests not found in the cache',
+                               label_names=('model_name',))
+EVICTION_COUNTER = metrics.counter('mlf_mc_prediction_cache_evictions_total', 'Entries removed from the cache',
+                                   label_names=('model_name', 'reason'))
+
+# bookkeeping per entry on top of the serialized response, roughly the size of the entry tuple and dict slot
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def cache_enabled():
+    return os.environ.get('ENABLE_PREDICTION_CACHE', 'false').lower() == 'true'
+
+
+def bypass_requested(metadata):
+    """
+    :param metadata: invocation metadata of the request
+    :return: True if the caller asked to skip the cache
+    """
+    for key, value in metadata or ():
+        if key == BYPASS_HEADER:
+            return str(value).lower() in ('1', 'true', 'yes')
+    return False
+
+
+def request_key(request, model_version):
+    """
+    Hash of the input tensors, the model name, version and signature of a PredictRequest
+
+    Inputs are hashed in name order from their deterministic serialization, so equal requests map to the same
+    key whatever order the client filled the map in.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (request.model_spec.name, str(model_version), request.model_spec.signature_name):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    for name in sorted(request.inputs):
+        digest.update(name.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(request.inputs[name].SerializeToString(deterministic=True))
+    for name in sorted(request.output_filter):
+        digest.update(name.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.digest()
+
+
+class PredictionCache:
+    """
+    LRU cache of PredictResponse messages under a byte budget
+
+    Entries expire after the TTL of their model. Keys include the model version, so versions served side by side
+    have their own entries; the entries of a version are dropped with invalidate when it is retired. Cached
+    responses are shared between requests and must not be modified.
+    """
+
+    def __init__(self, max_bytes, ttl_seconds=300, model_ttl_seconds=None):
+        if max_bytes <= 0 or ttl_seconds <= 0:
+            raise ValueError('Invalid prediction cache settings: max_bytes={}, ttl_seconds={}'.format(
+                max_bytes, ttl_seconds))
+        self.max_bytes = int(max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self.model_ttl_seconds = dict(model_ttl_seconds or {})
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'PredictionCache(max_bytes={}, ttl_seconds={}, model_ttl_seconds={})'.format(
+            self.max_bytes, self.ttl_seconds, self.model_ttl_seconds)
+
+    @classmethod
+    def from_env(cls):
+        """
+        PREDICTION_CACHE_MAX_BYTES is the byte budget (default 64 MiB) and PREDICTION_CACHE_TTL_SECONDS the
+        default TTL (default 300); a json file referenced by PREDICTION_CACHE_TTL_FILE may set the TTL per model
+        name, e.g. {"my-model": 60}
+        """
+        model_ttl_seconds = None
+        ttl_file = os.environ.get('PREDICTION_CACHE_TTL_FILE')
+        if ttl_file:
+            with open(ttl_file) as json_file:
+                model_ttl_seconds = json.load(json_file)
+        return cls(max_bytes=int(os.environ.get('PREDICTION_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+                   ttl_seconds=float(os.environ.get('PREDICTION_CACHE_TTL_SECONDS', 300)),
+                   model_ttl_seconds=model_ttl_seconds)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, model_name, model_version):
+        """
+        :return: cached response, None on a miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= now:
+                self._remove(key, EVICTION_EXPIRED)
+                entry = None
+            if entry is None:
+                MISS_COUNTER.inc(model_name=model_name)
+                return None
+            self._entries.move_to_end(key)
+        HIT_COUNTER.inc(model_name=model_name)
+        return entry[0]
+
+    def put(self, key, model_name, model_version, response):
+        size = response.ByteSize() + len(key) + _ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.model_ttl_seconds.get(model_name, self.ttl_seconds)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key, None)
+            self._entries[key] = (response, size, expires_at, model_name, model_version)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)), EVICTION_SIZE)
+
+    def invalidate(self, model_name, model_version=None, reason=EVICTION_VERSION):
+        """Drop the entries of a model version, of all versions of the model when model_version is None"""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items()
+                        if entry[3] == model_name and (model_version is None or entry[4] == model_version)]:
+                self._remove(key, reason)
+
+    def _remove(self, key, reason):
+        response, size, expires_at, model_name, model_version = self._entries.pop(key)
+        self.size_bytes -= size
+        if reason is not None:
+            EVICTION_COUNTER.inc(model_name=model_name, reason=reason)
@@ -0,0 +1,144 @@
+"""Pre-fork multi-process serving
+
+The supervisor loads the model once, then forks worker processes that each run their own gRPC server on the
+same port. The kernel spreads incoming connections across the workers through SO_REUSEPORT, so pure Python
+models are no longer limited to the one core a single process can use under the GIL.
+"""
+import logging
+import math
+import os
+import signal
+import sys
+import time
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+WORKERS_AUTO = 'auto'
+# a worker exiting sooner than this after its start counts as a crash loop and is restarted with a backoff
+_MIN_HEALTHY_LIFETIME_SECONDS = 10
+_MAX_RESTART_BACKOFF_SECONDS = 30
+
+
+def _read_first_line(path):
+    try:
+        with open(path) as quota_file:
+            return quota_file.readline().strip()
+    except (IOError, OSError):
+        return None
+
+
+def cpu_quota():
+    """
+    CPU limit of the container from the cgroup CPU quota
+
+    :return: number of CPUs as a float, None if the container is not limited
+    """
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    cpu_max = _read_first_line('/sys/fs/cgroup/cpu.max')
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota != 'max' and period:
+            return int(quota) / float(period)
+        return None
+    # cgroup v1
+    quota = _read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+    period = _read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return int(quota) / float(period)
+    return None
+
+
+def available_cpus():
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, int(math.ceil(quota)))
+    return max(1, cpus)
+
+
+def worker_count(setting):
+    """
+    :param setting: value of MODEL_CONTAINER_WORKERS, a number or 'auto' for one worker per CPU of the quota
+    """
+    if str(setting).lower() == WORKERS_AUTO:
+        return available_cpus()
+    workers = int(setting)
+    if workers < 1:
+        raise ValueError('Number of workers must be positive: {}'.format(setting))
+    return workers
+
+
+class PreforkSupervisor:
+    """
+    Forks num_workers processes running server_factory().start(model, port) and restarts the ones that exit
+    """
+
+    def __init__(self, server_factory, num_workers):
+        self.server_factory = server_factory
+        self.num_workers = num_workers
+        self.workers = {}
+        self.stopping = False
+        self._failures = 0
+
+    def serve(self, model, port):
+        LOG.info("Starting %s worker processes on port %s", self.num_workers, port)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id, model, port)
+
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            worker_id, started_at = self.workers.pop(pid, (None, None))
+            if worker_id is None or self.stopping:
+                continue
+            lifetime = time.monotonic() - started_at
+            LOG.error("Worker %s (pid %s) exited with status %s after %.1f s, restarting", worker_id, pid,
+                      status, lifetime)
+            if lifetime < _MIN_HEALTHY_LIFETIME_SECONDS:
+                self._failures += 1
+                time.sleep(min(2 ** self._failures, _MAX_RESTART_BACKOFF_SECONDS))
+            else:
+                self._failures = 0
+            if not self.stopping:
+                self._spawn(worker_id, model, port)
+
+    def _spawn(self, worker_id, model, port):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                # until the server replaces it with its graceful stop, see GrpcServer.start
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                # each worker serves its metrics on its own port, see metrics.serve_from_env
+                os.environ['MODEL_CONTAINER_WORKER_ID'] = str(worker_id)
+                LOG.info("Worker %s started with pid %s", worker_id, os.getpid())
+                self.server_factory().start(model, port)
+            except BaseException as ex:
+                LOG.error("Worker %s failed: %s", worker_id, ex)
+                exit_code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exit_code)
+        self.workers[pid] = (worker_id, time.monotonic())
+
+    def _stop(self, signum, frame):
+        LOG.info("Received signal %s, stopping workers", signum)
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
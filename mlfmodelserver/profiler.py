@@ -0,0 +1,240 @@
+"""Sampling CPU profiler: stacks of the request threads read from sys._current_frames, written as collapsed stacks"""
+import collections
+import contextlib
+import logging
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+from mlfmodelserver import metrics
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+PROFILE_PATH = '/debug/profile'
+CONTENT_TYPE = 'text/plain; charset=utf-8'
+
+# RPC method and model name of the threads serving a request, by thread ident
+_THREAD_TAGS = {}
+_FRAME_LABELS = {}
+# space ends the stack and ';' separates the frames of a collapsed stack line
+_SEPARATORS = str.maketrans({' ': '_', ';': '_', '\n': '_'})
+
+SAMPLE_COUNTER = metrics.counter('mlf_mc_profiler_samples_total', 'Stack samples taken by the profiler',
+                                 label_names=('mode',))
+
+
+@contextlib.contextmanager
+def tagged(method, model_name):
+    """Tag the samples of the calling thread with the RPC method and model it is serving"""
+    ident = threading.get_ident()
+    previous = _THREAD_TAGS.get(ident)
+    _THREAD_TAGS[ident] = (method, model_name)
+    try:
+        yield
+    finally:
+        if previous is None:
+            _THREAD_TAGS.pop(ident, None)
+        else:
+            _THREAD_TAGS[ident] = previous
+
+
+def _frame_label(code):
+    label = _FRAME_LABELS.get(code)
+    if label is None:
+        label = '{}:{}'.format(os.path.basename(code.co_filename), getattr(code, 'co_qualname', code.co_name))
+        label = _FRAME_LABELS[code] = label.translate(_SEPARATORS)
+    return label
+
+
+def collapse(frame):
+    """:return: the stack of a frame, outermost call first, joined with ';'"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels)
+
+
+def sample(counts, all_threads=False):
+    """
+    Add one sample of the stack of every thread serving a request to counts, prefixed with its method and model
+
+    :param all_threads: also sample the other threads, prefixed with their thread name
+    """
+    own = threading.get_ident()
+    tags = dict(_THREAD_TAGS)
+    names = {thread.ident: thread.name for thread in threading.enumerate()} if all_threads else {}
+    for ident, frame in sys._current_frames().items():
+        if ident == own:
+            continue
+        tag = tags.get(ident)
+        if tag is not None:
+            method, model_name = tag
+            prefix = '{};{}'.format(method.translate(_SEPARATORS), model_name.translate(_SEPARATORS))
+        elif all_threads:
+            prefix = names.get(ident, 'thread-{}'.format(ident)).translate(_SEPARATORS)
+        else:
+            continue
+        counts[prefix + ';' + collapse(frame)] += 1
+
+
+def format_collapsed(counts):
+    """:return: one 'stack count' line per stack, the input of flamegraph.pl and speedscope"""
+    return ''.join('{} {}\n'.format(stack, count) for stack, count in sorted(counts.items()))
+
+
+def record(seconds, interval_seconds=0.005, all_threads=False):
+    """
+    Sample the threads every interval_seconds for seconds, on the calling thread
+
+    :return: Counter of collapsed stack to samples
+    """
+    counts = collections.Counter()
+    deadline = time.monotonic() + seconds
+    samples = 0
+    while True:
+        sample(counts, all_threads)
+        samples += 1
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(interval_seconds, remaining))
+    SAMPLE_COUNTER.inc(samples, mode='on_demand')
+    return counts
+
+
+class ContinuousProfiler(threading.Thread):
+    """
+    Always-on sampler keeping the samples of the last windows of window_seconds
+
+    The sampling interval grows so that the time spent sampling stays under overhead of the elapsed time.
+    """
+
+    def __init__(self, overhead=0.01, min_interval_seconds=0.01, window_seconds=60, windows=10):
+        super().__init__(name='continuous-profiler')
+        self.daemon = True
+        self.overhead = overhead
+        self.min_interval_seconds = min_interval_seconds
+        self.window_seconds = window_seconds
+        self.interval_seconds = min_interval_seconds
+        self._windows = collections.deque([collections.Counter()], maxlen=windows)
+        self._window_started = time.monotonic()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def __repr__(self):
+        return 'ContinuousProfiler(overhead={}, window_seconds={}, windows={})'.format(
+            self.overhead, self.window_seconds, self._windows.maxlen)
+
+    @classmethod
+    def from_env(cls):
+        return cls(overhead=float(os.environ.get('PROFILER_OVERHEAD', 0.01)),
+                   window_seconds=float(os.environ.get('PROFILER_WINDOW_SECONDS', 60)),
+                   windows=int(os.environ.get('PROFILER_WINDOWS', 10)))
+
+    def run(self):
+        while not self._stopped.is_set():
+            started = time.perf_counter()
+            counts = collections.Counter()
+            sample(counts)
+            now = time.monotonic()
+            with self._lock:
+                if now - self._window_started >= self.window_seconds:
+                    self._windows.append(collections.Counter())
+                    self._window_started = now
+                self._windows[-1].update(counts)
+            SAMPLE_COUNTER.inc(mode='continuous')
+            cost = time.perf_counter() - started
+            self.interval_seconds = max(self.min_interval_seconds, cost / self.overhead)
+            self._stopped.wait(self.interval_seconds)
+
+    def aggregate(self):
+        """:return: Counter of the samples of the retained windows"""
+        with self._lock:
+            total = collections.Counter()
+            for window in self._windows:
+                total.update(window)
+            return total
+
+    def stop(self):
+        self._stopped.set()
+
+
+_CONTINUOUS = []
+
+
+def continuous_profiler():
+    """:return: the running ContinuousProfiler, None if it was not started"""
+    return _CONTINUOUS[0] if _CONTINUOUS else None
+
+
+def _profile_endpoint(query):
+    """
+    ?seconds=N samples for N seconds (default 10, at most 300) every interval seconds (default 0.005, at least 0.001),
+    all=1 includes the threads not serving a request, continuous=1 returns the aggregates of the continuous profiler
+    instead
+    """
+    if query.get('continuous') == '1':
+        profiler = continuous_profiler()
+        if profiler is None:
+            raise ValueError('Continuous profiler not running, set PROFILER_CONTINUOUS=true')
+        return CONTENT_TYPE, format_collapsed(profiler.aggregate())
+    seconds = float(query.get('seconds', 10))
+    if not 0 < seconds <= 300:
+        raise ValueError('seconds must be in (0, 300]: {}'.format(seconds))
+    interval_seconds = float(query.get('interval', 0.005))
+    if not 0.001 <= interval_seconds <= seconds:
+        raise ValueError('interval must be in [0.001, seconds]: {}'.format(interval_seconds))
+    return CONTENT_TYPE, format_collapsed(record(seconds, interval_seconds, query.get('all') == '1'))
+
+
+def write_profile(seconds, directory, interval_seconds=0.005):
+    """
+    Record a profile and write it to directory/profile-<pid>-<time>.collapsed
+
+    :return: path of the file
+    """
+    counts = record(seconds, interval_seconds)
+    path = os.path.join(directory, 'profile-{}-{}.collapsed'.format(os.getpid(), time.strftime('%Y%m%d-%H%M%S')))
+    # renamed once complete, so a file watcher never picks up a partial profile
+    with open(path + '.tmp', 'w') as profile:
+        profile.write(format_collapsed(counts))
+    os.replace(path + '.tmp', path)
+    LOG.info("Profile of %s s with %s samples written to %s", seconds, sum(counts.values()), path)
+    return path
+
+
+def install_signal_handler(signum=signal.SIGUSR2, seconds=30, directory=None):
+    """
+    Record a profile of seconds on a background thread when the process receives signum, e.g. kill -USR2 <pid>
+    """
+    directory = directory or tempfile.gettempdir()
+
+    def on_signal(received, frame):
+        thread = threading.Thread(target=write_profile, args=(seconds, directory), name='signal-profiler')
+        thread.daemon = True
+        thread.start()
+
+    return signal.signal(signum, on_signal)
+
+
+def install_from_env():
+    """
+    Serve on-demand profiles on the metrics port and record one on SIGUSR2; PROFILER_CONTINUOUS=true also starts
+    the continuous profiler
+    """
+    metrics.add_endpoint(PROFILE_PATH, _profile_endpoint)
+    if threading.current_thread() is threading.main_thread():
+        install_signal_handler(seconds=float(os.environ.get('PROFILE_SECONDS', 30)),
+                               directory=os.environ.get('PROFILE_DIR'))
+    if os.environ.get('PROFILER_CONTINUOUS', 'false').lower() == 'true' and not _CONTINUOUS:
+        profiler = ContinuousProfiler.from_env()
+        profiler.start()
+        _CONTINUOUS.append(profiler)
+        LOG.info("Continuous profiling: %s", profiler)
@@ -7,9 +7,9 @@ import os
 import sys
 import numpy as np
 import pandas as pd
-from os import listdir
-from os.path import isdir, join
 from mlfmodelserver import grpc_server
+from mlfmodelserver.model_config import get_model_spec
+from mlfmodelserver.model_registry import find_model_version
 from pyspark.sql import SparkSession
 from numpy import ndarray
 
@@ -55,45 +55,6 @@ def generic_predict_func(predict_func, path):
     """Generic Predict Function"""
     return predict_func(path)
 
-# Refactor to standard json parsing...
-
-
-def get_model_spec(config_file_path, delimiter):
-    """
-    :param config_file_path:
-    :param delimiter:
-    :return: model spec as key value pair
-    """
-    model_spec = {}
-    try:
-        with open(config_file_path) as model_spec_file:
-            for line in model_spec_file:
-                if delimiter in line:
-                    key, value = line.split(delimiter)
-                    if key and (key.strip().replace("\"", "").startswith('base_path')
-                     or key.strip().replace("\"", "")):
-                        model_spec[str(key.strip().replace("\"", ""))] = value.strip().replace("\"", "").replace(",", "")
-        return model_spec
-    except FileNotFoundError as file_not_found_error:
-        raise FileNotFoundError("File Not Found")
-    return model_spec
-
-
-def find_model_version(base_path):
-    """Find model version from model folder"""
-    # Fetch the version folder from the model base path
-    # Validation to see if there is at least one folder named with a digit denoting the version
-    # If more than one version folders are present get the max
-
-    try:
-        version_dirs = [f for f in listdir(base_path) if (isdir(join(base_path, f))
-                                                          and f.isdigit())]
-        return max(version_dirs)
-    except ValueError as value_error:
-        message = "No directory named with number in the model base path to denote the version"
-        LOG.error(message)
-        raise ValueError(message)
-
 
 class ModelContainer(grpc_server.ModelContainerBase):
     """Model Container"""
@@ -120,8 +81,6 @@ class ModelContainer(grpc_server.ModelContainerBase):
 
     def wrapper_predict_func(self, inputs):
         """Wrapper for model predict function"""
-        print("The deserialized predict func {}".format(dir(self.predict_func)))
-
         list_inputs = []
         for k in inputs:
             if isinstance(inputs[k], ndarray):
@@ -149,6 +108,9 @@ def start_server():
     else:
         LOG.info("Connecting to Model Container with default port on port: %s", port)
 
+    server_mode = os.environ.get("MODEL_CONTAINER_SERVER_MODE", grpc_server.SERVER_MODE_SYNC)
+    LOG.info("gRPC server mode: %s", server_mode)
+
     model_config_file_path = os.environ["MODELS_CONFIG_FILE_PATH"]
     LOG.info("Model config file path from env : %s", model_config_file_path)
 
@@ -158,7 +120,7 @@ def start_server():
 
     try:
         model = ModelContainer(model_config_file_path)
-        rpc_service = grpc_server.GrpcServer()
+        rpc_service = grpc_server.create_server(server_mode)
         rpc_service.start(model, port)  # Input to be not specified
 
     except ImportError as e:
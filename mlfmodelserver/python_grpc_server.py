@@ -1,15 +1,17 @@
 """Python grpc server implementation"""
 from __future__ import print_function
+import contextlib
 import os
 import sys
 import json
 import logging
-from os import listdir
-from os.path import isdir, join
+import threading
 import cloudpickle
-from mlfmodelserver import grpc_server
+from mlfmodelserver import grpc_server, model_config, model_metadata, model_registry, prefork
+from mlfmodelserver.model_config import get_model_spec
+from mlfmodelserver.model_registry import find_model_version
+import numpy as np
 from numpy import ndarray
-import pandas as pd
 
 IMPORT_ERROR_RETURN_CODE = 3
 PIP_INSTALL_ERROR_CODE = 1
@@ -18,6 +20,11 @@ LOG=logging.getLogger(__name__)
 LOG.setLevel(logging.INFO)
 LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
 
+# modules folders of the loaded model versions; _MODULES_LOCK guards them, sys.path and sys.modules while a
+# version imports its modules
+_MODULES_FOLDERS = set()
+_MODULES_LOCK = threading.Lock()
+
 
 def get_config_json(config_file_path):
     """Get Config json by reading file"""
@@ -40,48 +47,44 @@ def load_predict_func(file_path):
         raise generic_exception
 
 
-def generic_predict_func(predict_func, path):
-    """Generic Predict Function"""
-    return predict_func(path)
-
-# Refactor to standard json parsing...
+def _folder_of(module):
+    module_file = getattr(module, '__file__', None)
+    if not module_file:
+        return None
+    for folder in _MODULES_FOLDERS:
+        if module_file.startswith(folder + os.sep):
+            return folder
+    return None
 
 
-def get_model_spec(config_file_path, delimiter):
+@contextlib.contextmanager
+def isolated_modules(modules_folder_path):
     """
-    :param config_file_path:
-    :param delimiter:
-    :return: model spec as key value pair
+    Import from the modules folder of one model version first, while modules imported from the folders of the
+    other loaded versions are hidden, so that two versions with a module of the same name each unpickle their own
+    code. Modules the version imports later, inside its functions, are looked up in the folders of all versions.
     """
-    model_spec = {}
-    try:
-        with open(config_file_path) as model_spec_file:
-            for line in model_spec_file:
-                if delimiter in line:
-                    key, value = line.split(delimiter)
-                    if key and (key.strip().replace("\"", "").startswith('base_path')
-                                or key.strip().replace("\"", "").startswith("name")):
-                        model_spec[str(key.strip().replace("\"", ""))] = value.strip().replace("\"", "").replace(",", "")
-        return model_spec
-    except FileNotFoundError as file_not_found_error:
-        raise FileNotFoundError("File Not Found")
-    return model_spec
+    with _MODULES_LOCK:
+        _MODULES_FOLDERS.add(modules_folder_path)
+        hidden = {name: module for name, module in sys.modules.items()
+                  if _folder_of(module) not in (None, modules_folder_path)}
+        for name in hidden:
+            del sys.modules[name]
+        sys.path.insert(0, modules_folder_path)
+        try:
+            yield
+        finally:
+            sys.path.remove(modules_folder_path)
+            if modules_folder_path not in sys.path:
+                sys.path.append(modules_folder_path)
+            # the modules of the version loaded last take the names they share with older versions
+            for name, module in hidden.items():
+                sys.modules.setdefault(name, module)
 
 
-def find_model_version(base_path):
-    """Find model version from model folder"""
-    # Fetch the version folder from the model base path
-    # Validation to see if there is at least one folder named with a digit denoting the version
-    # If more than one version folders are present get the max
-
-    try:
-        version_dirs = [f for f in listdir(base_path) if (isdir(join(base_path, f))
-                                                          and f.isdigit())]
-        return max(version_dirs)
-    except ValueError as value_error:
-        message = "No directory named with number in the model base path to denote the version"
-        LOG.error(message)
-        raise ValueError(message)
+def generic_predict_func(predict_func, path):
+    """Generic Predict Function"""
+    return predict_func(path)
 
 
 class ModelContainer(grpc_server.ModelContainerBase):
@@ -95,18 +98,52 @@ class ModelContainer(grpc_server.ModelContainerBase):
         LOG.info("model base path with version : %s", model_base_path)
         self.model_name = model_spec.get('name', '')
         LOG.info("model name from config file %s ", self.model_name)
-        modules_folder_path = "{dir}/modules/".format(dir=model_base_path)
-        sys.path.append(os.path.abspath(modules_folder_path))
+        self._load(model_base_path)
+
+    @classmethod
+    def for_version(cls, config, model_version):
+        """
+        :param config: ModelConfig of one entry of the model_config_list
+        :param model_version: version directory to load
+        """
+        container = cls.__new__(cls)
+        container.model_name = config.name
+        container.model_version = model_version
+        container._load(config.base_path + "/" + model_version)
+        return container
+
+    def _load(self, model_base_path):
+        modules_folder_path = os.path.abspath("{dir}/modules/".format(dir=model_base_path))
         predict_fname = "func.pkl"
         predict_path = "{dir}/{predict_fname}".format(
             dir=model_base_path, predict_fname=predict_fname)
         self.asset_files_path = model_base_path
-        self.predict_func = load_predict_func(predict_path)
-        self.classification_func = load_predict_func(predict_path)
+        self.modules_folder_path = modules_folder_path
+        probed = []
+
+        def probe(inputs):
+            probed.append(inputs)
+            return self.wrapper_predict_func(inputs)
+
+        with isolated_modules(modules_folder_path):
+            self.predict_func = load_predict_func(predict_path)
+            self.classification_func = load_predict_func(predict_path)
+            self.regression_func = self.classification_func
+            self.signature_def_map = model_metadata.load_signature_def_map(model_base_path, probe)
+        # a successful signature probe ran the warmup request already
+        self._warmed_up = bool(probed) and self.signature_def_map is not None
+
+    def warmup(self):
+        """Run the warmup request of the version, if it has one and the signature probe did not run it"""
+        if self._warmed_up:
+            return
+        warmup_path = os.path.join(self.asset_files_path, model_metadata.WARMUP_REQUEST_FILE)
+        if os.path.isfile(warmup_path):
+            with isolated_modules(self.modules_folder_path):
+                self.wrapper_predict_func(model_metadata.read_warmup_inputs(warmup_path))
 
     def wrapper_predict_func(self, inputs):
         """Wrapper for model predict function"""
-        print ("The deserialized predict func {}".format(dir(self.predict_func)))
         list_inputs = None
         for k in inputs:
             if isinstance(inputs[k], ndarray):
@@ -114,14 +151,39 @@ class ModelContainer(grpc_server.ModelContainerBase):
             else:
                 list_inputs = inputs[k]
         preds = self.predict_func(list_inputs)
-        return pd.DataFrame({'col': preds})
+        return {'col': np.asarray(preds)}
 
     def wrapper_classification_func(self, inputs):
         """Wrapper for model classification function"""
-        print("The deserialized classification func {}".format(dir(self.classification_func)))
         output = self.classification_func(inputs)
         return output
 
+    def wrapper_regression_func(self, inputs):
+        """Wrapper for model regression function, called with a DataFrame of all examples of a request"""
+        return self.regression_func(inputs)
+
+
+
+def load_models(model_config_file_path):
+    """
+    :return: ModelContainer of the configured model, or a ModelRegistry when the config lists several models, a
+        single model with a model_version_policy applied, or new versions and config changes are picked up while
+        serving
+    """
+    config_file = model_config.config_file(model_config_file_path)
+    configs = config_file.load().configs
+    if len(configs) == 1 and not model_registry.version_polling_enabled():
+        if not model_config.serves_several_versions_or_models(configs):
+            return ModelContainer(model_config_file_path)
+        if not model_registry.version_policy_enabled():
+            LOG.info("Serving %s from its base path, set MODEL_VERSION_POLICY_ENABLED=true to apply its "
+                     "model_version_policy", configs[0].name)
+            return ModelContainer(model_config_file_path)
+    registry = model_registry.ModelRegistry.from_env(ModelContainer.for_version)
+    registry.use_config_file(config_file)
+    registry.load_all()
+    LOG.info("Serving %s", registry)
+    return registry
 
 
 def start_server():
@@ -140,6 +202,10 @@ def start_server():
     else:
         LOG.info("Connecting to Model Container with default port on port: %s", port)
 
+    server_mode = os.environ.get("MODEL_CONTAINER_SERVER_MODE", grpc_server.SERVER_MODE_SYNC)
+    LOG.info("gRPC server mode: %s", server_mode)
+    workers = prefork.worker_count(os.environ.get("MODEL_CONTAINER_WORKERS", 1))
+
     model_config_file_path = os.environ["MODELS_CONFIG_FILE_PATH"]
     LOG.info("Model config file path from env : %s", model_config_file_path)
 
@@ -148,10 +214,14 @@ def start_server():
     sys.stderr.flush()
 
     try:
-        model = ModelContainer(model_config_file_path)
-        rpc_service = grpc_server.GrpcServer()
-        model_health_status = rpc_service.get_model_health_status()
-        rpc_service.start(model, port)  # Input to be not specified
+        model = load_models(model_config_file_path)
+        if workers > 1:
+            supervisor = prefork.PreforkSupervisor(lambda: grpc_server.create_server(server_mode), workers)
+            supervisor.serve(model, port)
+        else:
+            rpc_service = grpc_server.create_server(server_mode)
+            model_health_status = rpc_service.get_model_health_status()
+            rpc_service.start(model, port)  # Input to be not specified
         
     except ImportError as e:
         LOG.error(e)
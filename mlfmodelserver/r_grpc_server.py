@@ -3,9 +3,9 @@ import sys
 import logging
 import rpy2.robjects as ro
 import numpy
-from os import listdir
-from os.path import isdir, join
 from mlfmodelserver import grpc_server
+from mlfmodelserver.model_config import get_model_spec
+from mlfmodelserver.model_registry import find_model_version
 from rpy2.robjects import r, pandas2ri
 from numpy import ndarray
 
@@ -27,43 +27,6 @@ def load_predict_func(file_path):
         raise generic_exception
 
 
-def get_model_spec(config_file_path, delimiter):
-    """
-    :param config_file_path:
-    :param delimiter:
-    :return: model spec as key value pair
-    """
-    model_spec = {}
-    try:
-        with open(config_file_path) as model_spec_file:
-            for line in model_spec_file:
-                if delimiter in line:
-                    key, value = line.split(delimiter)
-                    if key and (key.strip().replace("\"", "").startswith('base_path')
-                    or key.strip().replace("\"", "").startswith("name")):
-                        model_spec[str(key.strip().replace("\"", ""))] = value.strip().replace("\"", "").replace(",", "")
-        return model_spec
-    except FileNotFoundError as file_not_found_error:
-        raise FileNotFoundError("File Not Found")
-    return model_spec
-
-
-def find_model_version(base_path):
-    """Find model version from model folder"""
-    # Fetch the version folder from the model base path
-    # Validation to see if there is at least one folder named with a digit denoting the version
-    # If more than one version folders are present get the max
-
-    try:
-        version_dirs = [f for f in listdir(base_path) if (isdir(join(base_path, f))
-                                                          and f.isdigit())]
-        return max(version_dirs)
-    except ValueError as value_error:
-        message = "No directory named with number in the model base path to denote the version"
-        LOG.error(message)
-        raise ValueError(message)
-
-
 class ModelContainer(grpc_server.ModelContainerBase):
     """Model Container"""
     def __init__(self, model_config_path):
@@ -113,6 +76,9 @@ def start_server():
     else:
         LOG.info("Connecting to Model Container with default port on port: %s", port)
 
+    server_mode = os.environ.get("MODEL_CONTAINER_SERVER_MODE", grpc_server.SERVER_MODE_SYNC)
+    LOG.info("gRPC server mode: %s", server_mode)
+
     model_config_file_path = os.environ["MODELS_CONFIG_FILE_PATH"]
     LOG.info("Model path from env : %s", model_config_file_path)
 
@@ -122,7 +88,7 @@ def start_server():
 
     try:
         model = ModelContainer(model_config_file_path)
-        rpc_service = grpc_server.GrpcServer()
+        rpc_service = grpc_server.create_server(server_mode)
         rpc_service.start(model, port)
     except ImportError as e:
         LOG.error(e)
@@ -0,0 +1,200 @@
+"""Bulk encoding of model scores into ClassificationResult and RegressionResult messages"""
+import collections
+import logging
+import os
+import sys
+
+import numpy as np
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+LABEL_PREFIX = "Class-"
+
+# wire format tags of field 1 length-delimited, field 1 fixed32 and field 2 fixed32
+_TAG_FIELD_1 = 0x0A
+_TAG_FIELD_1_FIXED32 = 0x0D
+_TAG_FIELD_2_FIXED32 = 0x15
+# Regression { value = 1 } prefixed by its tag and length in RegressionResult, followed by the 4 value bytes
+_REGRESSION_PREFIX = np.array([_TAG_FIELD_1, 5, _TAG_FIELD_1_FIXED32], dtype=np.uint8)
+_MAX_VARINT_BYTES = 5
+# below this many scores building the messages directly is cheaper than the numpy setup
+_DIRECT_ENCODE_LIMIT = 256
+
+LabelTable = collections.namedtuple('LabelTable', ['keys', 'labels', 'chunks', 'chunk_lengths', 'score_offsets'])
+
+
+def _varint(value):
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _varints(values):
+    """
+    :return: uint8 array of shape (len(values), 5) with the varint of each value left aligned, and the number
+        of bytes of each varint
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for index in range(1, _MAX_VARINT_BYTES):
+        lengths += values >= (1 << (7 * index))
+    shifts = np.arange(_MAX_VARINT_BYTES, dtype=np.uint64) * np.uint64(7)
+    encoded = ((values[:, None] >> shifts) & np.uint64(0x7F)).astype(np.uint8)
+    encoded[np.arange(_MAX_VARINT_BYTES) < (lengths - 1)[:, None]] |= 0x80
+    return encoded, lengths
+
+
+def score_matrix(outputs):
+    """
+    :param outputs: classification function output, a mapping of class name to the scores of each row such as a
+        dict of Series or a DataFrame, or a 2-D array with a column per class
+    :return: tuple of the class names and a float32 array of shape (rows, classes)
+    """
+    if isinstance(outputs, np.ndarray):
+        scores = outputs.reshape(len(outputs), -1) if outputs.ndim != 2 else outputs
+        return tuple(str(index) for index in range(scores.shape[1])), scores.astype(np.float32, copy=False)
+    items = list(outputs.items())
+    if not items:
+        return (), np.empty((0, 0), dtype=np.float32)
+    keys = tuple(str(key) for key, _ in items)
+    return keys, np.column_stack([np.asarray(values, dtype=np.float32).reshape(-1) for _, values in items])
+
+
+def regression_values(outputs):
+    """
+    :param outputs: regression function output, an array or Series with a value per row, or a mapping with a
+        single such entry like the output of a predict function
+    :return: float32 array with a value per row
+    """
+    if hasattr(outputs, 'items') and not hasattr(outputs, 'dtype'):
+        items = list(outputs.items())
+        if len(items) != 1:
+            raise ValueError('Expected a single regression output, got {}'.format([key for key, _ in items]))
+        outputs = items[0][1]
+    values = np.asarray(outputs, dtype=np.float32)
+    if values.ndim > 1 and values.size != len(values):
+        raise ValueError('Expected a regression value per row, got shape {}'.format(values.shape))
+    return values.reshape(-1)
+
+
+def encode_regressions(values, result):
+    """
+    Fill a RegressionResult with a Regression per value
+
+    Every Regression has the same 7 byte encoding, so all of them are written into one array and the result is
+    parsed from it in a single call.
+    """
+    values = np.asarray(values, dtype='<f4').reshape(-1)
+    if len(values) <= _DIRECT_ENCODE_LIMIT:
+        for value in values.tolist():
+            result.regressions.add(value=value)
+        return
+    encoded = np.empty((len(values), len(_REGRESSION_PREFIX) + 4), dtype=np.uint8)
+    encoded[:, :len(_REGRESSION_PREFIX)] = _REGRESSION_PREFIX
+    encoded[:, len(_REGRESSION_PREFIX):] = values.view(np.uint8).reshape(-1, 4)
+    result.MergeFromString(encoded.tobytes())
+
+
+class ClassificationEncoder:
+    """
+    Fills a ClassificationResult from a score matrix without building a Class message per score
+
+    The wire encoding of every Class, label included, is prepared once per set of class names and only the
+    scores are filled in per request, for all rows at once with numpy; the result message is then parsed from
+    those bytes in a single call. Small results are built directly from the interned labels. With top_k, each
+    row only holds its k best classes, best first; otherwise every class in the order returned by the model.
+    """
+
+    def __init__(self, top_k=0):
+        if top_k < 0:
+            raise ValueError('Invalid top k: {}'.format(top_k))
+        self.top_k = top_k
+        self._table = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(top_k=int(os.environ.get('CLASSIFY_TOP_K', 0)))
+
+    def __repr__(self):
+        return 'ClassificationEncoder(top_k={})'.format(self.top_k)
+
+    def labels(self, keys):
+        """
+        :return: LabelTable with the encoded Class of each class name, cached until the class names change
+        """
+        table = self._table
+        if table is None or table.keys != keys:
+            table = self._label_table(keys)
+            self._table = table
+        return table
+
+    @staticmethod
+    def _label_table(keys):
+        labels = tuple(LABEL_PREFIX + key for key in keys)
+        encoded = []
+        for label in labels:
+            label_bytes = label.encode('utf-8')
+            # Class { label = 1; score = 2 } with a zeroed score, prefixed by its tag and length in Classifications
+            body = bytes([_TAG_FIELD_1]) + _varint(len(label_bytes)) + label_bytes + bytes([_TAG_FIELD_2_FIXED32])
+            header = bytes([_TAG_FIELD_1]) + _varint(len(body) + 4)
+            encoded.append(header + body)
+        width = max([len(chunk) for chunk in encoded], default=0) + 4
+        chunks = np.zeros((len(encoded), width), dtype=np.uint8)
+        for index, chunk in enumerate(encoded):
+            chunks[index, :len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+        score_offsets = np.array([len(chunk) for chunk in encoded], dtype=np.int64)
+        return LabelTable(keys, labels, chunks, score_offsets + 4, score_offsets)
+
+    def encode(self, keys, scores, result):
+        """
+        :param keys: class names, one per column of scores
+        :param scores: array of shape (rows, classes)
+        :param result: ClassificationResult to fill
+        """
+        scores = np.asarray(scores, dtype='<f4')
+        if scores.ndim != 2 or scores.shape[1] != len(keys):
+            raise ValueError('Expected scores of shape (rows, {}), got {}'.format(len(keys), scores.shape))
+        table = self.labels(keys)
+        if self.top_k and self.top_k < len(keys):
+            # the k best classes of each row, best first
+            best = np.argpartition(-scores, self.top_k - 1, axis=1)[:, :self.top_k]
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind='stable')
+            classes = np.take_along_axis(best, order, axis=1)
+            scores = np.take_along_axis(best_scores, order, axis=1)
+        else:
+            classes = np.broadcast_to(np.arange(len(keys)), scores.shape)
+        if classes.size <= _DIRECT_ENCODE_LIMIT:
+            labels = table.labels
+            for row_classes, row_scores in zip(classes.tolist(), scores.tolist()):
+                classification = result.classifications.add()
+                for index, score in zip(row_classes, row_scores):
+                    classification.classes.add(label=labels[index], score=score)
+        else:
+            result.MergeFromString(self._serialize(table, classes, scores))
+
+    @staticmethod
+    def _serialize(table, classes, scores):
+        rows, count = classes.shape
+        width = table.chunks.shape[1]
+        # padded Class encodings of every selected class with its score written after the score tag
+        body = table.chunks[classes]
+        score_positions = table.score_offsets[classes][..., None] + np.arange(4)
+        np.put_along_axis(body, score_positions, np.ascontiguousarray(scores).view(np.uint8).reshape(rows, count, 4),
+                          axis=2)
+        chunk_lengths = table.chunk_lengths[classes]
+        body_valid = np.arange(width) < chunk_lengths[..., None]
+
+        # Classifications of each row, prefixed by its tag and length in ClassificationResult
+        row_lengths, row_length_bytes = _varints(chunk_lengths.sum(axis=1))
+        header = np.concatenate([np.full((rows, 1), _TAG_FIELD_1, dtype=np.uint8), row_lengths], axis=1)
+        header_valid = np.arange(_MAX_VARINT_BYTES + 1) <= row_length_bytes[:, None]
+
+        encoded = np.concatenate([header, body.reshape(rows, count * width)], axis=1)
+        valid = np.concatenate([header_valid, body_valid.reshape(rows, count * width)], axis=1)
+        return encoded[valid].tobytes()
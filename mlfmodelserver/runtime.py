@@ -0,0 +1,82 @@
+"""Runtime mode and lazily imported heavy dependencies
+
+In the lite runtime (MLF_LITE_RUNTIME=true) the serving path only needs the generated protos and numpy.
+The generated tensorflow_serving.apis modules import TensorProto and friends from tensorflow.core, which
+normally executes tensorflow/__init__.py and loads the whole TensorFlow runtime. The lite runtime registers
+the tensorflow package without executing it, so only the proto modules are loaded; the package is
+initialized in place on first attribute access, e.g. when an unpickled model uses tf.*, or when
+tensorflow() is called.
+"""
+import importlib
+import importlib.util
+import logging
+import os
+import sys
+import threading
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+LITE_RUNTIME_ENV = 'MLF_LITE_RUNTIME'
+
+_DEFERRED_MARKER = '__mlf_deferred__'
+_IMPORT_LOCK = threading.RLock()
+_INITIALIZING = threading.local()
+
+
+def lite_runtime_enabled():
+    return os.environ.get(LITE_RUNTIME_ENV, 'false').lower() == 'true'
+
+
+def defer_tensorflow_import():
+    """
+    Make tensorflow.core proto modules importable without initializing TensorFlow.
+
+    Has to run before the first import of a tensorflow_serving.apis module. Does nothing outside the lite
+    runtime, when tensorflow is already imported or when it is not installed.
+    """
+    if not lite_runtime_enabled() or 'tensorflow' in sys.modules:
+        return False
+    spec = importlib.util.find_spec('tensorflow')
+    if spec is None or spec.loader is None:
+        return False
+    module = importlib.util.module_from_spec(spec)
+    setattr(module, _DEFERRED_MARKER, True)
+    # module level __getattr__ is only consulted for missing attributes, so importing the proto
+    # submodules does not trigger it but any use of the TensorFlow API does
+    module.__getattr__ = _initialize_on_access
+    sys.modules['tensorflow'] = module
+    LOG.info("Lite runtime: tensorflow is initialized on first use")
+    return True
+
+
+def _initialize_on_access(name):
+    if getattr(_INITIALIZING, 'active', False):
+        # tensorflow/__init__.py probing its own, not yet defined attributes
+        raise AttributeError("module 'tensorflow' has no attribute '{}'".format(name))
+    return getattr(tensorflow(), name)
+
+
+def tensorflow():
+    """Import tensorflow, completing a deferred initialization"""
+    with _IMPORT_LOCK:
+        module = sys.modules.get('tensorflow')
+        if module is not None and getattr(module, _DEFERRED_MARKER, False):
+            # execute tensorflow/__init__.py in the module object that already holds the proto submodules
+            LOG.info("Initializing tensorflow")
+            _INITIALIZING.active = True
+            try:
+                module.__spec__.loader.exec_module(module)
+            finally:
+                _INITIALIZING.active = False
+            delattr(module, _DEFERRED_MARKER)
+            if module.__dict__.get('__getattr__') is _initialize_on_access:
+                del module.__getattr__
+            return module
+    return importlib.import_module('tensorflow')
+
+
+def pandas():
+    """Import pandas on first use"""
+    return importlib.import_module('pandas')
@@ -0,0 +1,211 @@
+"""Bidirectional streaming Predict, authenticated once per stream and batched within the stream"""
+import logging
+import os
+import queue
+import sys
+import threading
+
+import grpc
+import numpy as np
+
+from mlpkitsecurity import SecurityError
+from mlfmodelserver import batching, metrics, model_registry, profiler, tensor_codec
+from mlfmodelserver.streaming import streaming_predict_pb2, streaming_predict_pb2_grpc
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+STREAM_BATCH_HISTOGRAM = metrics.histogram('mlf_mc_stream_batch_requests',
+                                           'PredictRequests of a stream scored together',
+                                           label_names=('model_name',), buckets=metrics.DEFAULT_SIZE_BUCKETS)
+STREAM_REQUEST_COUNTER = metrics.counter('mlf_mc_stream_requests_total', 'PredictRequests received on streams',
+                                         label_names=('model_name', 'code'))
+
+_END = object()
+
+
+class _StreamItem:
+    __slots__ = ('request', 'model', 'inputs', 'rows', 'signature', 'outputs', 'error')
+
+    def __init__(self, request):
+        self.request = request
+        self.model = None
+        self.inputs = None
+        self.rows = None
+        self.signature = None
+        self.outputs = None
+        self.error = None
+
+
+def error_status(ex):
+    """grpc status code of an error raised while answering one request of a stream"""
+    if isinstance(ex, tensor_codec.TensorCodecError):
+        return grpc.StatusCode.INVALID_ARGUMENT
+    if isinstance(ex, model_registry.ModelNotFoundError):
+        return grpc.StatusCode.NOT_FOUND
+    if isinstance(ex, NotImplementedError):
+        return grpc.StatusCode.UNIMPLEMENTED
+    return grpc.StatusCode.INTERNAL
+
+
+class StreamingServicer(streaming_predict_pb2_grpc.StreamingPredictionServiceServicer):
+    """
+    StreamPredict on top of the Predict servicer
+
+    The token of the first request is validated for the whole stream. Requests are read ahead on a separate
+    thread; whatever arrived while the model was busy, up to max_batch_size requests, is decoded, concatenated
+    along axis 0 where the inputs line up and scored in one model call. Responses are sent in request order,
+    a failing request is answered with its error code and does not end the stream.
+    """
+
+    def __init__(self, servicer, max_batch_size=32, read_ahead=128):
+        if max_batch_size < 1 or read_ahead < 1:
+            raise ValueError('Invalid stream settings: max_batch_size={}, read_ahead={}'.format(max_batch_size,
+                                                                                               read_ahead))
+        self.servicer = servicer
+        self.max_batch_size = max_batch_size
+        self.read_ahead = read_ahead
+
+    @classmethod
+    def from_env(cls, servicer):
+        return cls(servicer, max_batch_size=int(os.environ.get('STREAM_MAX_BATCH_SIZE', 32)),
+                   read_ahead=int(os.environ.get('STREAM_READ_AHEAD', 128)))
+
+    def __repr__(self):
+        return 'StreamingServicer(max_batch_size={}, read_ahead={})'.format(self.max_batch_size, self.read_ahead)
+
+    def authorize(self, request, context):
+        """
+        Validate the token of a stream with its first request, aborting the stream if it is not accepted
+        """
+        try:
+            authorized = self.servicer._Validations(request, context)
+        except SecurityError as ex:
+            context.abort(grpc.StatusCode.UNAUTHENTICATED, getattr(ex, 'message', str(ex)))
+        except NotImplementedError as ex:
+            context.abort(grpc.StatusCode.UNIMPLEMENTED, str(ex))
+        except model_registry.ModelNotFoundError as ex:
+            context.abort(grpc.StatusCode.NOT_FOUND, str(ex))
+        if authorized is not True:
+            context.abort(grpc.StatusCode.UNAUTHENTICATED, 'Token not validated')
+
+    def StreamPredict(self, request_iterator, context):
+        requests = queue.Queue(maxsize=self.read_ahead)
+        closed = threading.Event()
+        reader = threading.Thread(target=self._read, args=(request_iterator, requests, closed), name='stream-reader')
+        reader.daemon = True
+        reader.start()
+        try:
+            first = requests.get()
+            if first is _END:
+                return
+            self.authorize(first, context)
+            pending = first
+            while pending is not _END:
+                batch = [pending]
+                pending = None
+                while len(batch) < self.max_batch_size:
+                    try:
+                        request = requests.get_nowait()
+                    except queue.Empty:
+                        break
+                    if request is _END:
+                        pending = _END
+                        break
+                    batch.append(request)
+                for response in self.predict_batch(batch):
+                    yield response
+                if pending is None:
+                    pending = requests.get()
+        finally:
+            # unblock the reader if the stream ended early, e.g. the client cancelled it
+            closed.set()
+            while not requests.empty():
+                requests.get_nowait()
+
+    @staticmethod
+    def _read(request_iterator, requests, closed):
+        try:
+            for request in request_iterator:
+                if closed.is_set():
+                    return
+                requests.put(request)
+        except Exception as ex:
+            # the client cancelled or the stream broke, the handler finishes the requests read so far
+            LOG.info("Stream closed: %s", ex)
+        finally:
+            if not closed.is_set():
+                requests.put(_END)
+
+    def predict_batch(self, requests):
+        """
+        :param requests: PredictRequests of one stream, in order
+        :return: list of StreamPredictResponse, one per request in the same order
+        """
+        items = [_StreamItem(request) for request in requests]
+        with profiler.tagged('StreamPredict', ''):
+            for item in items:
+                try:
+                    item.model = self.servicer.model_for(item.request)
+                    item.inputs = tensor_codec.decode_inputs(item.request.inputs)
+                    item.rows, item.signature = batching.input_signature(item.inputs)
+                except Exception as ex:
+                    item.error = ex
+
+            start = 0
+            while start < len(items):
+                end = start + 1
+                if items[start].error is None and items[start].signature is not None:
+                    while end < len(items) and items[end].error is None and items[end].model is items[start].model \
+                            and items[end].signature == items[start].signature:
+                        end += 1
+                with profiler.tagged('StreamPredict', getattr(items[start].model, 'model_name', '')):
+                    self._score(items[start:end])
+                start = end
+            return [self._response(item) for item in items]
+
+    @staticmethod
+    def _score(group):
+        if group[0].error is not None:
+            return
+        model = group[0].model
+        STREAM_BATCH_HISTOGRAM.observe(len(group), model_name=model.model_name)
+        if len(group) > 1:
+            merged = {k: np.concatenate([item.inputs[k] for item in group]) for k in group[0].inputs}
+            try:
+                outputs = model.wrapper_predict_func(merged)
+            except Exception as ex:
+                # score one by one, so only the failing requests are answered with an error
+                LOG.warning("Model call on %s stream requests failed, retrying them one by one: %s", len(group), ex)
+                outputs = None
+            if outputs is not None and batching.output_rows(outputs) == sum(item.rows for item in group):
+                start = 0
+                for item in group:
+                    item.outputs = batching.slice_outputs(outputs, start, start + item.rows)
+                    start += item.rows
+                return
+        for item in group:
+            try:
+                item.outputs = model.wrapper_predict_func(item.inputs)
+            except Exception as ex:
+                item.error = ex
+
+    def _response(self, item):
+        result = streaming_predict_pb2.StreamPredictResponse()
+        if item.error is None:
+            try:
+                tensor_codec.encode_outputs(item.outputs, result.response.outputs)
+            except Exception as ex:
+                item.error = ex
+        if item.error is not None:
+            code = error_status(item.error)
+            result.Clear()
+            result.error_code = code.value[0]
+            result.error_message = getattr(item.error, 'message', str(item.error))
+        else:
+            code = grpc.StatusCode.OK
+        # model names sent by clients are only used as label values for the models that are served
+        model_name = item.request.model_spec.name
+        STREAM_REQUEST_COUNTER.inc(model_name=model_name if self.servicer.serves(model_name) else '', code=code.name)
+        return result
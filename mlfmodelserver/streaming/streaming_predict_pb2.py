@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: mlfmodelserver/streaming/streaming_predict.proto
+"""Generated protocol buffer code."""
+from google.protobuf.internal import builder as _builder
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+from tensorflow_serving.apis import predict_pb2 as tensorflow__serving_dot_apis_dot_predict__pb2
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n0mlfmodelserver/streaming/streaming_predict.proto\x12\x0bmlf.serving\x1a%tensorflow_serving/apis/predict.proto\"y\n\x15StreamPredictResponse\x12\x35\n\x08response\x18\x01 \x01(\x0b\x32#.tensorflow.serving.PredictResponse\x12\x12\n\nerror_code\x18\x02 \x01(\x05\x12\x15\n\rerror_message\x18\x03 \x01(\t2y\n\x1aStreamingPredictionService\x12[\n\rStreamPredict\x12\".tensorflow.serving.PredictRequest\x1a\".mlf.serving.StreamPredictResponse(\x01\x30\x01\x62\x06proto3')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'mlfmodelserver.streaming.streaming_predict_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  _STREAMPREDICTRESPONSE._serialized_start=104
+  _STREAMPREDICTRESPONSE._serialized_end=225
+  _STREAMINGPREDICTIONSERVICE._serialized_start=227
+  _STREAMINGPREDICTIONSERVICE._serialized_end=348
+# @@protoc_insertion_point(module_scope)
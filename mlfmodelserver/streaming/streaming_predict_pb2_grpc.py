@@ -0,0 +1,73 @@
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+
+from mlfmodelserver.streaming import streaming_predict_pb2 as mlfmodelserver_dot_streaming_dot_streaming__predict__pb2
+from tensorflow_serving.apis import predict_pb2 as tensorflow__serving_dot_apis_dot_predict__pb2
+
+
+class StreamingPredictionServiceStub(object):
+    """Predict over a long lived stream: the token is validated once per stream, requests are answered in the
+    order they were sent and consecutive requests may be scored in one model call.
+    """
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.StreamPredict = channel.stream_stream(
+                '/mlf.serving.StreamingPredictionService/StreamPredict',
+                request_serializer=tensorflow__serving_dot_apis_dot_predict__pb2.PredictRequest.SerializeToString,
+                response_deserializer=mlfmodelserver_dot_streaming_dot_streaming__predict__pb2.StreamPredictResponse.FromString,
+                )
+
+
+class StreamingPredictionServiceServicer(object):
+    """Predict over a long lived stream: the token is validated once per stream, requests are answered in the
+    order they were sent and consecutive requests may be scored in one model call.
+    """
+
+    def StreamPredict(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_StreamingPredictionServiceServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'StreamPredict': grpc.stream_stream_rpc_method_handler(
+                    servicer.StreamPredict,
+                    request_deserializer=tensorflow__serving_dot_apis_dot_predict__pb2.PredictRequest.FromString,
+                    response_serializer=mlfmodelserver_dot_streaming_dot_streaming__predict__pb2.StreamPredictResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'mlf.serving.StreamingPredictionService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+
+
+ # This class is part of an EXPERIMENTAL API.
+class StreamingPredictionService(object):
+    """Predict over a long lived stream: the token is validated once per stream, requests are answered in the
+    order they were sent and consecutive requests may be scored in one model call.
+    """
+
+    @staticmethod
+    def StreamPredict(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(request_iterator, target, '/mlf.serving.StreamingPredictionService/StreamPredict',
+            tensorflow__serving_dot_apis_dot_predict__pb2.PredictRequest.SerializeToString,
+            mlfmodelserver_dot_streaming_dot_streaming__predict__pb2.StreamPredictResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
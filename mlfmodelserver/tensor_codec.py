@@ -0,0 +1,286 @@
+"""TensorProto <-> numpy conversion without the TensorFlow python layer"""
+import numpy as np
+
+# DataType enum values from tensorflow/core/framework/types.proto
+DT_INVALID = 0
+DT_FLOAT = 1
+DT_DOUBLE = 2
+DT_INT32 = 3
+DT_UINT8 = 4
+DT_INT16 = 5
+DT_INT8 = 6
+DT_STRING = 7
+DT_COMPLEX64 = 8
+DT_INT64 = 9
+DT_BOOL = 10
+DT_QINT8 = 11
+DT_QUINT8 = 12
+DT_QINT32 = 13
+DT_BFLOAT16 = 14
+DT_QINT16 = 15
+DT_QUINT16 = 16
+DT_UINT16 = 17
+DT_COMPLEX128 = 18
+DT_HALF = 19
+DT_UINT32 = 22
+DT_UINT64 = 23
+
+# tensor_content is always little endian
+_NUMPY_DTYPES = {
+    DT_FLOAT: np.dtype('<f4'),
+    DT_DOUBLE: np.dtype('<f8'),
+    DT_INT32: np.dtype('<i4'),
+    DT_UINT8: np.dtype('u1'),
+    DT_INT16: np.dtype('<i2'),
+    DT_INT8: np.dtype('i1'),
+    DT_COMPLEX64: np.dtype('<c8'),
+    DT_INT64: np.dtype('<i8'),
+    DT_BOOL: np.dtype('?'),
+    DT_QINT8: np.dtype('i1'),
+    DT_QUINT8: np.dtype('u1'),
+    DT_QINT32: np.dtype('<i4'),
+    DT_QINT16: np.dtype('<i2'),
+    DT_QUINT16: np.dtype('<u2'),
+    DT_UINT16: np.dtype('<u2'),
+    DT_COMPLEX128: np.dtype('<c16'),
+    DT_HALF: np.dtype('<f2'),
+    DT_UINT32: np.dtype('<u4'),
+    DT_UINT64: np.dtype('<u8'),
+}
+
+# repeated field holding the values of each dtype when tensor_content is not used
+_VALUE_FIELDS = {
+    DT_FLOAT: 'float_val',
+    DT_DOUBLE: 'double_val',
+    DT_INT32: 'int_val',
+    DT_UINT8: 'int_val',
+    DT_INT16: 'int_val',
+    DT_INT8: 'int_val',
+    DT_QINT8: 'int_val',
+    DT_QUINT8: 'int_val',
+    DT_QINT32: 'int_val',
+    DT_QINT16: 'int_val',
+    DT_QUINT16: 'int_val',
+    DT_UINT16: 'int_val',
+    DT_COMPLEX64: 'scomplex_val',
+    DT_COMPLEX128: 'dcomplex_val',
+    DT_INT64: 'int64_val',
+    DT_BOOL: 'bool_val',
+    DT_HALF: 'half_val',
+    DT_BFLOAT16: 'half_val',
+    DT_UINT32: 'uint32_val',
+    DT_UINT64: 'uint64_val',
+    DT_STRING: 'string_val',
+}
+
+
+class TensorCodecError(ValueError):
+    """Tensor cannot be converted"""
+    pass
+
+
+def tensor_shape(tensor):
+    """Shape of a TensorProto as a tuple"""
+    return tuple(dim.size for dim in tensor.tensor_shape.dim)
+
+
+def _num_elements(shape):
+    num_elements = 1
+    for size in shape:
+        num_elements *= size
+    return num_elements
+
+
+def _bfloat16_to_float32(bits):
+    """bfloat16 is the upper half of a float32"""
+    return (bits.astype('<u4') << 16).view('<f4')
+
+
+def _fill(values, shape):
+    """Expand the values of a typed field to the tensor shape the way TensorFlow does"""
+    num_elements = _num_elements(shape)
+    if values.size == num_elements:
+        return values.reshape(shape)
+    if values.size == 0:
+        return np.zeros(shape, dtype=values.dtype)
+    if values.size > num_elements:
+        raise TensorCodecError('Tensor has {} values but shape {} holds {}'.format(values.size, shape,
+                                                                                  num_elements))
+    # TensorFlow repeats the last value to fill the remaining elements
+    return np.pad(values, (0, num_elements - values.size), 'edge').reshape(shape)
+
+
+def _decode_strings(values, decode_strings):
+    if not decode_strings:
+        return np.array(values, dtype=object)
+    try:
+        return np.array([value.decode('utf-8') for value in values], dtype=str)
+    except UnicodeDecodeError:
+        return np.array(values, dtype=object)
+
+
+def decode_tensor(tensor, decode_strings=True):
+    """
+    Convert a TensorProto to an ndarray.
+
+    tensor_content is wrapped with np.frombuffer, so the returned array is a read-only view on the bytes object
+    of the field. Reading that field from the parsed request already copied the content once; frombuffer adds
+    no copy of its own. Typed *_val fields are converted with a single bulk conversion.
+
+    :param tensor: TensorProto
+    :param decode_strings: return string tensors as a str array instead of an object array of bytes;
+                           tensors that are not valid utf-8 are always returned as bytes
+    :return: ndarray
+    """
+    dtype = tensor.dtype
+    shape = tensor_shape(tensor)
+
+    if dtype == DT_STRING:
+        return _fill(_decode_strings(tensor.string_val, decode_strings), shape)
+
+    if dtype == DT_BFLOAT16:
+        if tensor.tensor_content:
+            return _bfloat16_to_float32(np.frombuffer(tensor.tensor_content, dtype='<u2')).reshape(shape)
+        return _fill(_bfloat16_to_float32(np.fromiter(tensor.half_val, dtype='<u2', count=len(tensor.half_val))),
+                     shape)
+
+    np_dtype = _NUMPY_DTYPES.get(dtype)
+    if np_dtype is None:
+        raise TensorCodecError('Unsupported tensor dtype: {}'.format(dtype))
+
+    if tensor.tensor_content:
+        return np.frombuffer(tensor.tensor_content, dtype=np_dtype).reshape(shape)
+
+    values = getattr(tensor, _VALUE_FIELDS[dtype])
+    if dtype == DT_HALF:
+        # half_val holds the raw 16 bit patterns
+        array = np.fromiter(values, dtype='<u2', count=len(values)).view(np_dtype)
+    elif dtype in (DT_COMPLEX64, DT_COMPLEX128):
+        # complex values are stored as interleaved real and imaginary parts
+        array = np.fromiter(values, dtype=np_dtype.type(0).real.dtype, count=len(values)).view(np_dtype)
+    else:
+        array = np.fromiter(values, dtype=np_dtype, count=len(values))
+    return _fill(array, shape)
+
+
+def decode_inputs(tensor_map, decode_strings=True):
+    """Convert a map of TensorProtos, e.g. PredictRequest.inputs, to a dict of ndarrays"""
+    return {k: decode_tensor(v, decode_strings) for k, v in tensor_map.items()}
+
+
+_TENSOR_DTYPES = {
+    np.dtype('float32'): DT_FLOAT,
+    np.dtype('float64'): DT_DOUBLE,
+    np.dtype('int32'): DT_INT32,
+    np.dtype('uint8'): DT_UINT8,
+    np.dtype('int16'): DT_INT16,
+    np.dtype('int8'): DT_INT8,
+    np.dtype('complex64'): DT_COMPLEX64,
+    np.dtype('int64'): DT_INT64,
+    np.dtype('bool'): DT_BOOL,
+    np.dtype('uint16'): DT_UINT16,
+    np.dtype('complex128'): DT_COMPLEX128,
+    np.dtype('float16'): DT_HALF,
+    np.dtype('uint32'): DT_UINT32,
+    np.dtype('uint64'): DT_UINT64,
+}
+
+_INT32_MIN = np.iinfo(np.int32).min
+_INT32_MAX = np.iinfo(np.int32).max
+
+
+def _first_element(values):
+    while isinstance(values, (list, tuple)) and values:
+        values = values[0]
+    return values
+
+
+def _as_ndarray(values):
+    """
+    Convert a model output to an ndarray.
+
+    Python ints and floats follow make_tensor_proto's inference: int32 unless a value does not fit and
+    float32. Numpy and pandas values keep their dtype.
+    """
+    if isinstance(values, np.ndarray):
+        array = values
+    elif hasattr(values, '__array__'):
+        # pandas Series/DataFrame and numpy scalars
+        array = np.asarray(values)
+    else:
+        array = np.asarray(values)
+        first = _first_element(values)
+        if type(first) is int and array.dtype.kind == 'i' and array.size and \
+                _INT32_MIN <= array.min() and array.max() <= _INT32_MAX:
+            array = array.astype(np.int32)
+        elif type(first) is float and array.dtype.kind == 'f':
+            array = array.astype(np.float32)
+
+    if array.dtype.kind == 'O' and array.size and not isinstance(array.flat[0], (str, bytes)):
+        # object columns holding numbers, e.g. pandas Series of mixed python scalars
+        array = np.asarray(array.tolist())
+    return array
+
+
+def data_type(dtype):
+    """
+    :param dtype: numpy dtype or its name, 'string' for byte and unicode strings
+    :return: DataType enum value of TensorProto.dtype
+    """
+    if isinstance(dtype, str) and dtype == 'string':
+        return DT_STRING
+    # 'bytes' and 'str' are the names of the numpy S and U dtypes
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'OSU':
+        return DT_STRING
+    data_type_value = _TENSOR_DTYPES.get(dtype.newbyteorder('='))
+    if data_type_value is None:
+        raise TensorCodecError('Unsupported dtype: {}'.format(dtype))
+    return data_type_value
+
+
+def output_spec(values):
+    """
+    :return: (DataType enum value, shape) of the TensorProto encode_tensor writes for a model output
+    """
+    array = _as_ndarray(values)
+    return data_type(array.dtype), array.shape
+
+
+def encode_tensor(values, tensor):
+    """
+    Fill a TensorProto in place from a model output.
+
+    Numeric arrays are written to tensor_content in one contiguous little endian copy; string arrays are
+    written to string_val in one pass.
+
+    :param values: ndarray, pandas Series/DataFrame, list or scalar
+    :param tensor: TensorProto to fill, e.g. PredictResponse.outputs[k]
+    """
+    array = _as_ndarray(values)
+
+    tensor.Clear()
+    for size in array.shape:
+        tensor.tensor_shape.dim.add().size = size
+
+    if array.dtype.kind in 'OSU':
+        tensor.dtype = DT_STRING
+        tensor.string_val.extend([value.encode('utf-8') if isinstance(value, str) else value
+                                  for value in array.ravel().tolist()])
+        return tensor
+
+    dtype = _TENSOR_DTYPES.get(array.dtype.newbyteorder('='))
+    if dtype is None:
+        raise TensorCodecError('Unsupported output dtype: {}'.format(array.dtype))
+    tensor.dtype = dtype
+    tensor.tensor_content = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<')).tobytes()
+    return tensor
+
+
+def encode_outputs(outputs, tensor_map):
+    """
+    Fill a map of TensorProtos, e.g. PredictResponse.outputs, from a dict or DataFrame of model outputs
+    """
+    for k, v in outputs.items():
+        encode_tensor(v, tensor_map[k])
+    return tensor_map
@@ -1,16 +1,98 @@
 """Token Validator"""
+import collections
+import hashlib
 import os
 import logging
 import sys
+import threading
+import time
 from mlpkitsecurity.token_utils import JWTTokenManager
+from mlfmodelserver import metrics
+from mlfmodelserver.key_provider import KeyProvider
 
 
 LOG = logging.getLogger(__name__)
 LOG.setLevel(logging.INFO)
 LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
 
-_BEGIN_STATEMENT = "-----BEGIN PUBLIC KEY-----"
-_END_STATEMENT = "-----END PUBLIC KEY-----"
+TOKEN_CACHE_HIT_COUNTER = metrics.counter('mlf_mc_token_cache_hits_total',
+                                          'Bearer tokens found in the verified token cache')
+TOKEN_CACHE_MISS_COUNTER = metrics.counter('mlf_mc_token_cache_misses_total',
+                                           'Bearer tokens verified against the public key')
+
+VerifiedToken = collections.namedtuple('VerifiedToken', ['payload', 'zone_id', 'scopes', 'expires_at'])
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of tokens whose signature was verified, keyed by the sha256 digest of the token
+
+    Entries are kept until the exp claim of their token. All entries are dropped when the validation key
+    changes.
+    """
+
+    def __init__(self, max_entries=10000):
+        if max_entries < 1:
+            raise ValueError('Invalid token cache size: {}'.format(max_entries))
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._key_fingerprint = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def digest(access_token):
+        return hashlib.sha256(access_token.encode('utf-8')).digest()
+
+    def get(self, access_token, key_fingerprint):
+        """
+        :return: VerifiedToken, None if the token is not cached, expired or verified with another key
+        """
+        digest = self.digest(access_token)
+        with self._lock:
+            self._check_key(key_fingerprint)
+            entry = self._entries.get(digest)
+            if entry is not None and entry.expires_at <= time.time():
+                del self._entries[digest]
+                entry = None
+            if entry is None:
+                TOKEN_CACHE_MISS_COUNTER.inc()
+                return None
+            self._entries.move_to_end(digest)
+        TOKEN_CACHE_HIT_COUNTER.inc()
+        return entry
+
+    def put(self, access_token, key_fingerprint, payload):
+        """
+        Cache the payload of a token verified with the key of the given fingerprint
+        """
+        entry = VerifiedToken(payload, payload.get('zid'), frozenset(payload.get('scope', ())),
+                              float(payload['exp']))
+        digest = self.digest(access_token)
+        with self._lock:
+            self._check_key(key_fingerprint)
+            self._entries[digest] = entry
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _check_key(self, key_fingerprint):
+        if key_fingerprint != self._key_fingerprint:
+            if self._key_fingerprint is not None:
+                LOG.info('Token validation key changed, dropping %s cached tokens', len(self._entries))
+            self._entries.clear()
+            self._key_fingerprint = key_fingerprint
+
+
+VERIFIED_TOKENS = VerifiedTokenCache(int(os.environ.get('JWT_CACHE_MAX_ENTRIES', 10000)))
+KEY_PROVIDER = KeyProvider.from_env()
 
 
 class TokenValidator:
@@ -21,24 +103,24 @@ class TokenValidator:
 
     def validate_token(self):
         """Validate token"""
-        LOG.info('Start of Validating Token')
+        LOG.debug('Start of Validating Token')
         access_token = ""
         for item in self.metadata:
             if item.key == 'authorization':
                 access_token = item.value
 
-        if _BEGIN_STATEMENT in os.environ['JWT_VALIDATION_KEY'] and \
-                _END_STATEMENT in os.environ['JWT_VALIDATION_KEY']:
-            pub_key = os.environ['JWT_VALIDATION_KEY']
-            final_public_key = pub_key[len(_BEGIN_STATEMENT):len(pub_key) - len(_END_STATEMENT)]
-            formatted_key = _BEGIN_STATEMENT + "\n" + final_public_key + "\n" + _END_STATEMENT
+        keys = KEY_PROVIDER.keys()
+        scopes = [os.environ['SCOPES_REQUIRED']]
+
+        verified_token = VERIFIED_TOKENS.get(access_token, keys.fingerprint)
+        if verified_token is None:
+            token_manager = JWTTokenManager(None)
+            token_result, tkn = token_manager._offline_validate(access_token, public_key=keys.public_keys,
+                                                                scopes=scopes)
+            verified_token = VERIFIED_TOKENS.put(access_token, keys.fingerprint,
+                                                 token_manager._extract_json_payload(access_token))
         else:
-            formatted_key = _BEGIN_STATEMENT + "\n" + os.environ['JWT_VALIDATION_KEY'] \
-                            + "\n" + _END_STATEMENT
-
-        token_manager = JWTTokenManager(None)
-        zone_id = token_manager.extract_zone_id(access_token)
-        LOG.info('zone id %s', zone_id)
-        token_result, tkn = token_manager._offline_validate(access_token, public_key=formatted_key,
-                                                            scopes=[os.environ['SCOPES_REQUIRED']])
+            JWTTokenManager._validate_scopes(verified_token.scopes, scopes=scopes)
+            token_result, tkn = True, access_token
+        LOG.debug('zone id %s', verified_token.zone_id)
         return token_result, tkn
@@ -0,0 +1,410 @@
+"""Request tracing: spans timed with perf_counter_ns, W3C trace context and batched OTLP/JSON export"""
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import urllib.request
+
+from mlfmodelserver import metrics
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+TRACEPARENT_HEADER = 'traceparent'
+EXPORTER_FILE = 'file'
+EXPORTER_OTLP = 'otlp'
+DEFAULT_SERVICE_NAME = 'mlf-model-server'
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# wall clock time at which perf_counter_ns() was 0: span times are monotonic, exported as wall clock times
+_EPOCH_NS = time.time_ns() - time.perf_counter_ns()
+
+_CURRENT_SPAN = contextvars.ContextVar('mlf_current_span', default=None)
+_QUEUED_SINCE_NS = contextvars.ContextVar('mlf_queued_since_ns', default=None)
+_STOP = object()
+
+EXPORTED_SPAN_COUNTER = metrics.counter('mlf_mc_trace_spans_exported_total', 'Sampled spans written by the exporter')
+DROPPED_SPAN_COUNTER = metrics.counter('mlf_mc_trace_spans_dropped_total',
+                                       'Sampled spans dropped, because the export queue was full or the export failed',
+                                       label_names=('reason',))
+
+
+def parse_traceparent(value):
+    """
+    :param value: W3C traceparent header, e.g. 00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01
+    :return: (trace id, parent span id, sampled), None if the header is not valid
+    """
+    parts = value.strip().split('-')
+    if len(parts) < 4 or [len(part) for part in parts[:4]] != [2, 32, 16, 2] or parts[0] == 'ff' or \
+            (parts[0] == '00' and len(parts) != 4):
+        return None
+    try:
+        int(parts[0], 16)
+        trace_id = int(parts[1], 16)
+        span_id = int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if trace_id == 0 or span_id == 0:
+        return None
+    return trace_id, span_id, bool(flags & 1)
+
+
+def format_traceparent(span):
+    return '00-{:032x}-{:016x}-{:02x}'.format(span.trace_id, span.span_id, 1 if span.sampled else 0)
+
+
+class Span:
+    """
+    Timed operation of a trace
+
+    Used as a context manager it is the current span of the block, the parent of spans made by span(), and ends
+    when the block exits. Its direct children are kept in children.
+    """
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'kind', 'sampled', 'start_ns', 'end_ns', 'attributes',
+                 'status', 'status_message', 'children', '_exporter', '_token')
+
+    def __init__(self, name, trace_id, parent_id, sampled, exporter, kind=SPAN_KIND_INTERNAL, start_ns=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64) or 1
+        self.parent_id = parent_id
+        self.kind = kind
+        self.sampled = sampled
+        self.start_ns = time.perf_counter_ns() if start_ns is None else start_ns
+        self.end_ns = None
+        self.attributes = {}
+        self.status = STATUS_UNSET
+        self.status_message = ''
+        self.children = []
+        self._exporter = exporter
+        self._token = None
+
+    def __repr__(self):
+        return 'Span({}, {:.3f} ms)'.format(self.name, self.duration_ms())
+
+    def __enter__(self):
+        self._token = _CURRENT_SPAN.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_value is not None:
+            self.set_status(STATUS_ERROR, '{}: {}'.format(exc_type.__name__, exc_value))
+        _CURRENT_SPAN.reset(self._token)
+        self.end()
+        return False
+
+    def child(self, name, start_ns=None, **attributes):
+        span = Span(name, self.trace_id, self.span_id, self.sampled, self._exporter, start_ns=start_ns)
+        if attributes:
+            span.attributes.update(attributes)
+        self.children.append(span)
+        return span
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_status(self, status, message=''):
+        self.status = status
+        self.status_message = message
+
+    def end(self, end_ns=None):
+        """End the span, once; a sampled span is handed to the exporter"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.perf_counter_ns() if end_ns is None else end_ns
+        if self.sampled and self._exporter is not None:
+            self._exporter.export(self)
+
+    def duration_ms(self):
+        """Duration of the span, up to now while it did not end"""
+        end_ns = time.perf_counter_ns() if self.end_ns is None else self.end_ns
+        return (end_ns - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    """Span of model code running outside of a sampled request"""
+    sampled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def child(self, name, start_ns=None, **attributes):
+        return self
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_status(self, status, message=''):
+        pass
+
+    def end(self, end_ns=None):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def current_span():
+    """:return: the span of the running block, None outside of a traced request"""
+    return _CURRENT_SPAN.get()
+
+
+def span(name, **attributes):
+    """
+    Child span of the current span, for model functions to time their own steps:
+
+        with tracing.span('feature_lookup', rows=len(inputs)):
+            ...
+
+    :return: a Span, or a span doing nothing when the request is not sampled
+    """
+    parent = _CURRENT_SPAN.get()
+    if parent is None or not parent.sampled:
+        return NOOP_SPAN
+    return parent.child(name, **attributes)
+
+
+@contextlib.contextmanager
+def queued_since(submitted_ns):
+    """
+    Mark the block as running a request that was queued since submitted_ns (perf_counter_ns); the span of the
+    request starts then, with a queue_wait child up to its start
+    """
+    token = _QUEUED_SINCE_NS.set(submitted_ns)
+    try:
+        yield
+    finally:
+        _QUEUED_SINCE_NS.reset(token)
+
+
+class Tracer:
+    """
+    Starts the spans of RPCs and samples them
+
+    A request carrying a traceparent joins its trace and follows its sampling decision; other requests are
+    sampled at sample_ratio. Nothing is sampled without an exporter, the spans then only time the stages.
+    """
+
+    def __init__(self, exporter=None, sample_ratio=1.0):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+
+    def __repr__(self):
+        return 'Tracer(exporter={}, sample_ratio={})'.format(self.exporter, self.sample_ratio)
+
+    @classmethod
+    def from_env(cls):
+        """
+        TRACE_EXPORTER 'file' appends to TRACE_FILE, 'otlp' posts to TRACE_OTLP_ENDPOINT; unset, nothing is exported
+        """
+        exporter_name = os.environ.get('TRACE_EXPORTER', '').strip().lower()
+        sample_ratio = float(os.environ.get('TRACE_SAMPLE_RATIO', 0.01))
+        if not exporter_name:
+            return cls(None, sample_ratio)
+        service_name = os.environ.get('TRACE_SERVICE_NAME', DEFAULT_SERVICE_NAME)
+        if exporter_name == EXPORTER_FILE:
+            writer = FileWriter(os.environ.get('TRACE_FILE', 'mlf_traces.jsonl'), service_name)
+        elif exporter_name == EXPORTER_OTLP:
+            writer = OtlpHttpWriter(os.environ.get('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces'),
+                                    service_name)
+        else:
+            raise ValueError('Unknown TRACE_EXPORTER: {}'.format(exporter_name))
+        exporter = BatchExporter(writer, max_batch_size=int(os.environ.get('TRACE_MAX_BATCH_SIZE', 512)),
+                                 schedule_delay_seconds=float(os.environ.get('TRACE_SCHEDULE_DELAY_SECONDS', 1)),
+                                 max_queue_size=int(os.environ.get('TRACE_MAX_QUEUE_SIZE', 2048)))
+        return cls(exporter, sample_ratio)
+
+    def start_rpc(self, method, metadata=()):
+        """
+        :param method: RPC method name, the name of the span
+        :param metadata: invocation metadata of the RPC, read for a traceparent
+        :return: server Span of the RPC, not current yet
+        """
+        now = time.perf_counter_ns()
+        parent = None
+        for key, value in metadata:
+            if key == TRACEPARENT_HEADER:
+                parent = parse_traceparent(value)
+                break
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = random.getrandbits(128) or 1, None
+            sampled = self.sample_ratio > 0 and random.random() < self.sample_ratio
+        queued_since_ns = _QUEUED_SINCE_NS.get()
+        rpc_span = Span(method, trace_id, parent_id, sampled and self.exporter is not None, self.exporter,
+                        kind=SPAN_KIND_SERVER, start_ns=now if queued_since_ns is None else queued_since_ns)
+        if queued_since_ns is not None:
+            rpc_span.child('queue_wait', start_ns=queued_since_ns).end(now)
+        return rpc_span
+
+    def shutdown(self):
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+class BatchExporter:
+    """
+    Request threads queue the sampled spans without blocking, a daemon thread writes them in batches of up to
+    max_batch_size spans at least every schedule_delay_seconds. Spans beyond max_queue_size are dropped.
+    """
+
+    def __init__(self, writer, max_batch_size=512, schedule_delay_seconds=1.0, max_queue_size=2048):
+        self.writer = writer
+        self.max_batch_size = max_batch_size
+        self.schedule_delay_seconds = schedule_delay_seconds
+        self._queue = queue.Queue(max_queue_size)
+        self._thread = threading.Thread(target=self._run, name='trace-exporter')
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def __repr__(self):
+        return 'BatchExporter({})'.format(self.writer)
+
+    def export(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            DROPPED_SPAN_COUNTER.inc(reason='queue_full')
+
+    def shutdown(self, timeout=5.0):
+        """Write the queued spans, then stop the export thread"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            LOG.warning("Trace export queue still full at shutdown, queued spans dropped")
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.schedule_delay_seconds
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self.writer.write(batch)
+            EXPORTED_SPAN_COUNTER.inc(len(batch))
+        except Exception as ex:
+            DROPPED_SPAN_COUNTER.inc(len(batch), reason='export_failed')
+            LOG.error("Trace export of %s spans failed: %s", len(batch), ex)
+
+
+def _any_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _attributes(attributes):
+    return [{'key': key, 'value': _any_value(value)} for key, value in attributes.items()]
+
+
+def otlp_json(spans, service_name=DEFAULT_SERVICE_NAME):
+    """
+    :return: ExportTraceServiceRequest of the ended spans in the OTLP/JSON encoding
+    """
+    encoded = []
+    for span in spans:
+        encoded_span = {
+            'traceId': '{:032x}'.format(span.trace_id),
+            'spanId': '{:016x}'.format(span.span_id),
+            'name': span.name,
+            'kind': span.kind,
+            'startTimeUnixNano': str(_EPOCH_NS + span.start_ns),
+            'endTimeUnixNano': str(_EPOCH_NS + span.end_ns),
+            'attributes': _attributes(span.attributes),
+            'status': {'code': span.status},
+        }
+        if span.parent_id is not None:
+            encoded_span['parentSpanId'] = '{:016x}'.format(span.parent_id)
+        if span.status_message:
+            encoded_span['status']['message'] = span.status_message
+        encoded.append(encoded_span)
+    return {'resourceSpans': [{
+        'resource': {'attributes': _attributes({'service.name': service_name})},
+        'scopeSpans': [{'scope': {'name': __name__}, 'spans': encoded}],
+    }]}
+
+
+class FileWriter:
+    """
+    Appends each batch as one line of OTLP/JSON, the format read by the OpenTelemetry collector's
+    otlpjsonfile receiver
+    """
+
+    def __init__(self, path, service_name=DEFAULT_SERVICE_NAME):
+        self.path = path
+        self.service_name = service_name
+
+    def __repr__(self):
+        return 'FileWriter({})'.format(self.path)
+
+    def write(self, spans):
+        line = (json.dumps(otlp_json(spans, self.service_name), separators=(',', ':')) + '\n').encode('utf-8')
+        # a single write on a file opened for appending, so the lines of several worker processes do not mix
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+class OtlpHttpWriter:
+    """
+    Posts each batch in the OTLP/JSON encoding to a collector's /v1/traces endpoint
+    """
+
+    def __init__(self, endpoint, service_name=DEFAULT_SERVICE_NAME, timeout=5.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def __repr__(self):
+        return 'OtlpHttpWriter({})'.format(self.endpoint)
+
+    def write(self, spans):
+        body = json.dumps(otlp_json(spans, self.service_name), separators=(',', ':')).encode('utf-8')
+        request = urllib.request.Request(self.endpoint, data=body, headers={'Content-Type': 'application/json'},
+                                         method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
@@ -12,4 +12,5 @@ MLP_XSUAA_SERVICE_INSTANCE_NAME = 'MLP_XSUAA_SERVICE_INSTANCE_NAME'
 CLEA_UAA_SERVER_BASE_URL = 'CLEA_UAA_SERVER_BASE_URL'
 CLEA_UAA_USE_GLOBAL_TENANT = 'CLEA_UAA_USE_GLOBAL_TENANT'
 MLP_FOUNDATION_SERVICE_NAME = 'MLP_FOUNDATION_SERVICE_NAME'
-MLP_FOUNDATION_SERVICE_INSTANCE_NAME = 'MLP_FOUNDATION_SERVICE_INSTANCE_NAME'
\ No newline at end of file
+MLP_FOUNDATION_SERVICE_INSTANCE_NAME = 'MLP_FOUNDATION_SERVICE_INSTANCE_NAME'
+MLP_JWT_VERIFIER = 'MLP_JWT_VERIFIER'
\ No newline at end of file
@@ -1,4 +1,5 @@
 import json
+import os
 import time
 import re
 import abc
@@ -7,7 +8,15 @@ from urllib.request import urlopen, Request
 from urllib.parse import urljoin, urlencode
 from rsa import PublicKey
 import rsa
+try:
+    from cryptography.exceptions import InvalidSignature, UnsupportedAlgorithm
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+    from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey, RSAPublicNumbers
+except ImportError:
+    serialization = None
 from mlpkitsecurity import (
+    MLP_JWT_VERIFIER,
     SecurityError,
     TokenError,
     b2s,
@@ -63,6 +72,132 @@ def extract_zone_id(access_token):
     return JWTTokenManager(base_url=None).extract_zone_id(access_token)
 
 
+class RsaVerifier(object):
+    """RS256 signature verification with the pure-Python `rsa` package."""
+
+    name = 'rsa'
+
+    @staticmethod
+    def load_public_key(pem):
+        """
+        :raises SecurityError: not the PEM of an RSA public key
+        """
+        try:
+            return PublicKey.load_pkcs1_openssl_pem(pem)
+        except Exception as err:
+            raise SecurityError('Invalid public key, RSA expected: {}'.format(err), root_cause=err) from err
+
+    def prepare(self, public_key):
+        """Key object of this backend from a PEM string or a key of another backend."""
+        if isinstance(public_key, PublicKey):
+            return public_key
+        if isinstance(public_key, str):
+            return self.load_public_key(public_key)
+        if cryptography_available() and isinstance(public_key, RSAPublicKey):
+            numbers = public_key.public_numbers()
+            return PublicKey(numbers.n, numbers.e)
+        raise SecurityError('Invalid public key, RSA expected: {}'.format(type(public_key).__name__))
+
+    @staticmethod
+    def verify(message, signature, public_key):
+        """
+        :raise rsa.VerificationError: invalid signature
+        """
+        return rsa.verify(message, signature, public_key)
+
+
+class CryptographyVerifier(object):
+    """
+    RS256 signature verification with the OpenSSL-backed `cryptography` package.
+
+    The modular exponentiation runs in native code without holding the GIL.
+    """
+
+    name = 'cryptography'
+
+    @staticmethod
+    def load_public_key(pem):
+        """
+        :raises SecurityError: not the PEM of an RSA public key, e.g. an EC or Ed25519 key
+        """
+        try:
+            public_key = serialization.load_pem_public_key(pem.encode('utf-8'))
+        except (ValueError, UnsupportedAlgorithm) as err:
+            raise SecurityError('Invalid public key, RSA expected: {}'.format(err), root_cause=err) from err
+        if not isinstance(public_key, RSAPublicKey):
+            raise SecurityError('Invalid public key, RSA expected: {}'.format(type(public_key).__name__))
+        return public_key
+
+    def prepare(self, public_key):
+        """Key object of this backend from a PEM string or a key of another backend."""
+        if isinstance(public_key, RSAPublicKey):
+            return public_key
+        if isinstance(public_key, str):
+            return self.load_public_key(public_key)
+        if isinstance(public_key, PublicKey):
+            return RSAPublicNumbers(public_key.e, public_key.n).public_key()
+        raise SecurityError('Invalid public key, RSA expected: {}'.format(type(public_key).__name__))
+
+    @staticmethod
+    def verify(message, signature, public_key):
+        """
+        :raise rsa.VerificationError: invalid signature, same as the `rsa` backend
+        """
+        try:
+            public_key.verify(signature, message, padding.PKCS1v15(), hashes.SHA256())
+        except InvalidSignature:
+            raise rsa.VerificationError('Verification failed')
+        return 'SHA-256'
+
+
+def cryptography_available():
+    return serialization is not None
+
+
+_VERIFIERS = {}
+
+
+def get_verifier(name=None):
+    """
+    Signature verifier by name: 'cryptography' or 'rsa'.
+
+    Without a name the `MLP_JWT_VERIFIER` environment variable decides, defaulting to 'cryptography' when the
+    package is installed and to 'rsa' otherwise.
+    """
+    name = name or os.getenv(MLP_JWT_VERIFIER) or ('cryptography' if cryptography_available() else 'rsa')
+    verifier = _VERIFIERS.get(name)
+    if verifier is None:
+        if name == CryptographyVerifier.name:
+            if not cryptography_available():
+                raise SecurityError('JWT verifier cryptography requires the cryptography package', code=500)
+            verifier = CryptographyVerifier()
+        elif name == RsaVerifier.name:
+            verifier = RsaVerifier()
+        else:
+            raise SecurityError('Unknown JWT verifier: {}'.format(name), code=500)
+        _VERIFIERS[name] = verifier
+    return verifier
+
+
+def load_public_keys(pem, verifier=None):
+    """
+    Parse the RSA public keys of a PEM string once, so they can be passed to `JWTTokenManager.validate`
+    instead of the PEM string.
+
+    :param pem: one or more '-----BEGIN PUBLIC KEY-----' blocks
+    :param verifier: backend the keys are loaded for, see `get_verifier`
+    :return: list of public keys of the verifier
+    :raises SecurityError: no public key in the string
+    """
+    verifier = verifier or get_verifier()
+    bodies = re.findall(r'-----BEGIN PUBLIC KEY-----(.*?)-----END PUBLIC KEY-----', pem, flags=re.DOTALL)
+    if not bodies:
+        raise SecurityError('Invalid public key: {}'.format(pem))
+    # the markers may share a line with the base64 body, e.g. when the key comes from a single line variable
+    return [verifier.load_public_key('-----BEGIN PUBLIC KEY-----\n{}\n-----END PUBLIC KEY-----'.format(
+        ''.join(body.split()))) for body in bodies]
+
+
 class Singleton(type):
     _instances = {}
 
@@ -168,8 +303,9 @@ class TokenManager(metaclass=abc.ABCMeta):
 
 
 class JWTTokenManager(TokenManager):
-    def __init__(self, base_url):
+    def __init__(self, base_url, verifier=None):
         self.base_url = base_url
+        self.verifier = verifier or get_verifier()
 
     @property
     def token_type(self):
@@ -251,10 +387,19 @@ class JWTTokenManager(TokenManager):
             raise SecurityError('Invalid algorithm!', code=401)
 
         decoded_signature = TokenManager.b64decode(signature)
-        pubkey = PublicKey.load_pkcs1_openssl_pem(public_key)
-        message = header + '.' + encoded_payload
-        verified = rsa.verify(message.encode('utf-8'), decoded_signature, pubkey)
-        return verified, encoded_payload
+        message = (header + '.' + encoded_payload).encode('utf-8')
+        # a PEM string, a parsed rsa.PublicKey or a list of them, e.g. the current and the next key of a rotation
+        pubkeys = public_key if isinstance(public_key, (list, tuple)) else [public_key]
+        if not pubkeys:
+            raise SecurityError('Invalid public key: {}'.format(public_key))
+        for index, pubkey in enumerate(pubkeys):
+            try:
+                verified = self.verifier.verify(message, decoded_signature, self.verifier.prepare(pubkey))
+            except rsa.VerificationError:
+                if index == len(pubkeys) - 1:
+                    raise
+                continue
+            return verified, encoded_payload
 
     @staticmethod
     def _validate_payload_expiry(json_payload):
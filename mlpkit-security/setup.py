@@ -27,7 +27,8 @@ def get_install_requires():
 def get_extras_require():
     with open('test-requirements.txt') as reqs_file:
         reqs = [line.rstrip() for line in reqs_file.readlines()]
-    return {'test': reqs}
+    # OpenSSL-backed RS256 verification, see mlpkitsecurity.token_utils.get_verifier
+    return {'test': reqs, 'crypto': ['cryptography']}
 
 
 setup(name="sapclea-mlpkit-security",
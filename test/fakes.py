@@ -0,0 +1,106 @@
+"""Fakes shared by the servicer tests: a gRPC context, models and request builders"""
+from unittest import mock
+
+import numpy as np
+
+from mlfmodelserver import grpc_server
+from mlfmodelserver.tensor_codec import encode_tensor
+from tensorflow_serving.apis import predict_pb2 as tensorflow__serving_dot_apis_dot_predict__pb2
+from tensorflow_serving.apis import regression_pb2 as tensorflow__serving_dot_apis_dot_regression__pb2
+
+
+class AbortError(Exception):
+    """Raised by FakeContext.abort, as grpc ends a servicer method that aborts its RPC"""
+
+
+class FakeContext(object):
+    """ServicerContext of a unary RPC, keeping the status code and details set by the servicer"""
+
+    def __init__(self, metadata=(), time_remaining=None):
+        self.metadata = tuple(metadata)
+        self.code = None
+        self.details = None
+        self._time_remaining = time_remaining
+
+    def invocation_metadata(self):
+        return self.metadata
+
+    def time_remaining(self):
+        return self._time_remaining
+
+    def set_code(self, code):
+        self.code = code
+
+    def set_details(self, details):
+        self.details = details
+
+    def abort(self, code, details):
+        self.code = code
+        self.details = details
+        raise AbortError(details)
+
+
+class SumModel(object):
+    """Predict model summing the rows of X, counting its calls"""
+    model_name = 'sum'
+    model_version = '1'
+    signature_def_map = None
+
+    def __init__(self):
+        self.calls = 0
+
+    def wrapper_predict_func(self, inputs):
+        self.calls += 1
+        return {'col': inputs['X'].sum(axis=1)}
+
+
+def predict_request(name='sum', version=None, **inputs):
+    """PredictRequest of float32 inputs, X of two rows of ones unless given"""
+    request = tensorflow__serving_dot_apis_dot_predict__pb2.PredictRequest()
+    request.model_spec.name = name
+    if version is not None:
+        request.model_spec.version.value = version
+    for input_name, values in (inputs or {'X': np.ones((2, 3))}).items():
+        encode_tensor(np.asarray(values, dtype=np.float32), request.inputs[input_name])
+    return request
+
+
+class LinearModel(object):
+    """Regression model 2 * x + y, counting its calls"""
+    model_name = 'linear'
+
+    def __init__(self):
+        self.calls = 0
+
+    def wrapper_regression_func(self, inputs):
+        self.calls += 1
+        return {'col': inputs['x'] * 2 + inputs['y']}
+
+
+def regression_request(rows, name='linear'):
+    """RegressionRequest of an example with a float feature x and an int feature y per (x, y) row"""
+    request = tensorflow__serving_dot_apis_dot_regression__pb2.RegressionRequest()
+    request.model_spec.name = name
+    for x, y in rows:
+        example = request.input.example_list.examples.add()
+        example.features.feature['x'].float_list.value.append(x)
+        example.features.feature['y'].int64_list.value.append(y)
+    return request
+
+
+def single_model_servicer(model):
+    servicer = grpc_server.Servicer()
+    servicer.model = model
+    return servicer
+
+
+def multi_model_servicer(models):
+    """Servicer routing requests to the model of their model_spec.name in the dict models"""
+    servicer = grpc_server.Servicer()
+    servicer.model_for = lambda request, context=None: models[request.model_spec.name]
+    return servicer
+
+
+def authorized(servicer, valid=True):
+    """Patch the token validation of servicer to accept every request, or to answer them all with valid"""
+    return mock.patch.object(servicer, '_Validations', return_value=valid)
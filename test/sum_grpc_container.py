@@ -74,7 +74,7 @@ class SumContainer(grpc_server.ModelContainerBase):
 
 if __name__ == "__main__":
 
-    port = 9000
+    port = int(os.environ.get('MODEL_CONTAINER_PORT', 9000))
     model_spec = dict()
     model_spec['model_name'] = "sum-model"
     model_spec['model_version'] = 1
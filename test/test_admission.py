@@ -0,0 +1,127 @@
+import logging
+import sys
+import threading
+import time
+import unittest
+
+import grpc
+
+from mlfmodelserver import admission
+
+from fakes import AbortError, FakeContext
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+class HandlerCallDetails(object):
+    method = '/tensorflow.serving.PredictionService/Predict'
+
+
+def echo(request, context):
+    return request
+
+
+class TestAdmission(unittest.TestCase):
+
+    def test_queue_full(self):
+        LOG.info("test rejection once the queue is full")
+        controller = admission.AdmissionController(max_workers=2, max_queue_size=1)
+        self.assertIsNone(controller.check())
+        for _ in range(3):
+            controller._submitted()
+        self.assertEqual(1, controller.queued())
+        self.assertEqual(admission.REASON_QUEUE_FULL, controller.check())
+        controller._finished(5.0)
+        self.assertIsNone(controller.check())
+
+    def test_estimated_wait(self):
+        controller = admission.AdmissionController(max_workers=2, max_queue_wait_ms=15)
+        controller._submitted()
+        controller._finished(10.0)
+        for _ in range(3):
+            controller._submitted()
+        # two running, one queued: the next request waits for two of the 10 ms calls on two threads
+        self.assertAlmostEqual(10.0, controller.estimated_wait_ms())
+        self.assertIsNone(controller.check())
+        controller._submitted()
+        self.assertAlmostEqual(15.0, controller.estimated_wait_ms())
+        controller._submitted()
+        self.assertEqual(admission.REASON_QUEUE_WAIT, controller.check())
+
+    def test_deadline_guard_skips_expired_requests(self):
+        controller = admission.AdmissionController()
+        guarded = controller.deadline_guard(echo, 'Predict')
+        self.assertEqual(1, guarded(1, FakeContext(time_remaining=5)))
+        context = FakeContext(time_remaining=0)
+        self.assertRaises(AbortError, guarded, 1, context)
+        self.assertEqual(grpc.StatusCode.DEADLINE_EXCEEDED, context.code)
+        self.assertEqual(1, admission.SHED_COUNTER.value(method='Predict', reason=admission.REASON_DEADLINE_EXPIRED))
+
+    def test_interceptor_rejects_inline(self):
+        LOG.info("test rejected requests do not wait in the executor queue")
+        controller = admission.AdmissionController(max_workers=1, max_queue_size=0)
+        executor = admission.AdmissionExecutor(controller)
+        interceptor = admission.AdmissionInterceptor(controller, executor)
+        try:
+            release = threading.Event()
+            executor.submit(release.wait)
+            shed_before = admission.SHED_COUNTER.value(method='Predict', reason=admission.REASON_QUEUE_FULL)
+
+            handler = interceptor.intercept_service(lambda details: grpc.unary_unary_rpc_method_handler(echo),
+                                                    HandlerCallDetails())
+            context = FakeContext()
+            future = executor.submit(handler.unary_unary, 1, context)
+            self.assertIsInstance(future.exception(timeout=5), AbortError)
+            self.assertEqual(grpc.StatusCode.RESOURCE_EXHAUSTED, context.code)
+            self.assertEqual(shed_before + 1,
+                             admission.SHED_COUNTER.value(method='Predict', reason=admission.REASON_QUEUE_FULL))
+            self.assertEqual(1, controller.pending())
+
+            release.set()
+            executor.shutdown(wait=True)
+            self.assertEqual(0, controller.pending())
+            handler = interceptor.intercept_service(lambda details: grpc.unary_unary_rpc_method_handler(echo),
+                                                    HandlerCallDetails())
+            self.assertEqual(1, handler.unary_unary(1, FakeContext()))
+        finally:
+            executor.shutdown(wait=False)
+
+    def test_streams_run_apart_from_unary_requests(self):
+        LOG.info("test open streams neither hold worker threads nor count in the queue, and are capped")
+        controller = admission.AdmissionController(max_workers=1, max_queue_size=0, max_streams=1)
+        executor = admission.AdmissionExecutor(controller)
+        self.addCleanup(executor.shutdown, wait=False)
+        interceptor = admission.AdmissionInterceptor(controller, executor)
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def stream(requests, context):
+            release.wait(5)
+            return threading.current_thread().name
+
+        stream_handler = grpc.stream_stream_rpc_method_handler(stream)
+        handler = interceptor.intercept_service(lambda details: stream_handler, HandlerCallDetails())
+        open_stream = executor.submit(handler.stream_stream, iter(()), FakeContext())
+        self.assertEqual((0, 1), (controller.pending(), controller.streams()))
+        self.assertIsNone(controller.check())
+
+        handler = interceptor.intercept_service(lambda details: stream_handler, HandlerCallDetails())
+        context = FakeContext()
+        self.assertIsInstance(executor.submit(handler.stream_stream, iter(()), context).exception(timeout=5),
+                              AbortError)
+        self.assertEqual(grpc.StatusCode.RESOURCE_EXHAUSTED, context.code)
+
+        handler = interceptor.intercept_service(lambda details: grpc.unary_unary_rpc_method_handler(echo),
+                                                HandlerCallDetails())
+        self.assertEqual(1, executor.submit(handler.unary_unary, 1, FakeContext()).result(timeout=5))
+        time.sleep(0.3)
+        release.set()
+        self.assertIn('stream', open_stream.result(timeout=5))
+        self.assertEqual(0, controller.streams())
+        # the unary call alone, not the lifetime of the stream
+        self.assertLess(controller._service_time_ms, 200)
+
+if __name__ == "__main__":
+    unittest.main()
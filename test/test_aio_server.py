@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import sys
+import unittest
+from concurrent import futures
+
+import grpc
+
+from mlfmodelserver import admission
+from mlfmodelserver.aio_server import AioServicer
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+class AbortError(Exception):
+    pass
+
+
+class FakeAioContext(object):
+    def __init__(self):
+        self.code = None
+        self.details = None
+
+    def invocation_metadata(self):
+        return (('authorization', 'Bearer token'),)
+
+    def time_remaining(self):
+        return None
+
+    def set_code(self, code):
+        self.code = code
+
+    def set_details(self, details):
+        self.details = details
+
+    async def abort(self, code, details):
+        self.code = code
+        self.details = details
+        raise AbortError(details)
+
+
+class FakeServicer(object):
+    def Predict(self, request, context):
+        context.set_code(grpc.StatusCode.OK)
+        context.set_details(dict(context.invocation_metadata())['authorization'])
+        return request * 2
+
+    def Classify(self, request, context):
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        raise NotImplementedError('Model spec name and model env does not match')
+
+
+class TestAioServicer(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = futures.ThreadPoolExecutor(max_workers=2)
+        self.servicer = AioServicer(FakeServicer(), self.executor)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_predict_runs_in_executor_and_applies_status(self):
+        LOG.info("test async predict delegates to the sync servicer")
+        context = FakeAioContext()
+        response = asyncio.run(self.servicer.Predict(21, context))
+        self.assertEqual(42, response)
+        self.assertEqual(grpc.StatusCode.OK, context.code)
+        self.assertEqual('Bearer token', context.details)
+
+    def test_error_status_aborts_rpc(self):
+        context = FakeAioContext()
+        with self.assertRaises(AbortError):
+            asyncio.run(self.servicer.Classify(None, context))
+        self.assertEqual(grpc.StatusCode.UNIMPLEMENTED, context.code)
+        self.assertEqual('Model spec name and model env does not match', context.details)
+
+    def test_full_queue_rejects_before_executor(self):
+        controller = admission.AdmissionController(max_workers=1, max_queue_size=0)
+        controller._submitted()
+        servicer = AioServicer(FakeServicer(), self.executor, controller)
+        context = FakeAioContext()
+        with self.assertRaises(AbortError):
+            asyncio.run(servicer.Predict(21, context))
+        self.assertEqual(grpc.StatusCode.RESOURCE_EXHAUSTED, context.code)
+        controller._finished(1.0)
+        self.assertEqual(42, asyncio.run(servicer.Predict(21, FakeAioContext())))
+
+
+if __name__ == "__main__":
+    unittest.main()
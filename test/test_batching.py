@@ -0,0 +1,110 @@
+import logging
+import sys
+import threading
+import unittest
+
+import numpy as np
+
+from mlfmodelserver.batching import BatchingParameters, BatchScheduler, input_signature, slice_outputs
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+class RecordingModel(object):
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, inputs):
+        self.calls.append(inputs['X'].shape[0])
+        return {'col': inputs['X'].sum(axis=1)}
+
+
+def submit_concurrently(scheduler, requests):
+    results = [None] * len(requests)
+
+    def run(idx):
+        results[idx] = scheduler.submit(requests[idx])
+
+    threads = [threading.Thread(target=run, args=(idx,)) for idx in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestBatching(unittest.TestCase):
+
+    def test_concurrent_requests_are_batched_and_split(self):
+        LOG.info("test concurrent requests share one model call")
+        model = RecordingModel()
+        scheduler = BatchScheduler(model.predict, BatchingParameters(max_batch_size=64,
+                                                                     batch_timeout_micros=200000))
+        requests = [{'X': np.full((idx + 1, 3), idx, dtype=np.float32)} for idx in range(4)]
+        results = submit_concurrently(scheduler, requests)
+        scheduler.stop()
+
+        for idx, result in enumerate(results):
+            np.testing.assert_array_equal(result['col'], np.full(idx + 1, 3 * idx, dtype=np.float32))
+        self.assertEqual(sum(model.calls), 10)
+        self.assertLess(len(model.calls), 4)
+
+    def test_batch_respects_max_batch_size(self):
+        model = RecordingModel()
+        scheduler = BatchScheduler(model.predict, BatchingParameters(max_batch_size=4,
+                                                                     batch_timeout_micros=100000))
+        submit_concurrently(scheduler, [{'X': np.ones((2, 3))} for _ in range(6)])
+        scheduler.stop()
+        self.assertTrue(all(rows <= 4 for rows in model.calls))
+        self.assertEqual(sum(model.calls), 12)
+
+    def test_mismatched_output_rows_fall_back_to_single_calls(self):
+        def total(inputs):
+            return {'col': np.array([inputs['X'].sum()])}
+
+        scheduler = BatchScheduler(total, BatchingParameters(max_batch_size=64, batch_timeout_micros=100000))
+        results = submit_concurrently(scheduler, [{'X': np.ones((1, 2))}, {'X': np.ones((1, 2)) * 2}])
+        scheduler.stop()
+        self.assertEqual(sorted(result['col'][0] for result in results), [2.0, 4.0])
+
+    def test_model_error_is_raised_to_caller(self):
+        def failing(inputs):
+            raise RuntimeError('model failed')
+
+        scheduler = BatchScheduler(failing, BatchingParameters(batch_timeout_micros=0))
+        with self.assertRaises(RuntimeError):
+            scheduler.submit({'X': np.ones((1, 2))})
+        scheduler.stop()
+
+    def test_requests_after_stop_run_side_by_side(self):
+        LOG.info("test requests to a stopped scheduler call the model without holding its lock")
+        barrier = threading.Barrier(2, timeout=5)
+
+        def predict(inputs):
+            barrier.wait()
+            return {'col': inputs['X'].sum(axis=1)}
+
+        scheduler = BatchScheduler(predict, BatchingParameters(batch_timeout_micros=0))
+        scheduler.stop()
+        results = submit_concurrently(scheduler, [{'X': np.ones((1, 2))}, {'X': np.ones((1, 2)) * 2}])
+        self.assertFalse(barrier.broken)
+        self.assertEqual(sorted(result['col'][0] for result in results), [2.0, 4.0])
+
+    def test_input_signature(self):
+        rows, signature = input_signature({'X': np.array(['a', 'bcd']), 'Y': np.ones((2, 4))})
+        self.assertEqual(rows, 2)
+        self.assertEqual(signature, input_signature({'X': np.array(['ab', 'c']), 'Y': np.zeros((2, 4))})[1])
+        self.assertEqual((None, None), input_signature({'X': np.ones(2), 'Y': np.ones(3)}))
+        self.assertEqual((None, None), input_signature({'X': np.array(1.0)}))
+
+    def test_slice_outputs(self):
+        outputs = {'col': np.arange(5), 'labels': ['a', 'b', 'c', 'd', 'e']}
+        sliced = slice_outputs(outputs, 1, 3)
+        np.testing.assert_array_equal(sliced['col'], [1, 2])
+        self.assertEqual(sliced['labels'], ['b', 'c'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+import logging
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from mlfmodelserver import example_codec, response_codec
+from mlfmodelserver.example_codec import ExampleCodecError, ExampleDecoder
+from tensorflow_serving.apis import classification_pb2 as tensorflow__serving_dot_apis_dot_classification__pb2
+
+from fakes import FakeContext, authorized, multi_model_servicer, single_model_servicer
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+class FakeModel(object):
+    model_name = 'iris'
+
+    def __init__(self):
+        self.inputs = None
+
+    def wrapper_classification_func(self, inputs):
+        self.inputs = inputs
+        return {'a': inputs['length'] * 0.5, 'b': inputs['length'] * 0.25}
+
+
+class OtherModel(FakeModel):
+    model_name = 'other'
+
+    def wrapper_classification_func(self, inputs):
+        return {'c': inputs['length'] * 0.1, 'd': inputs['length'] * 0.2, 'e': inputs['length'] * 0.3}
+
+
+def classification_request(rows):
+    request = tensorflow__serving_dot_apis_dot_classification__pb2.ClassificationRequest()
+    request.model_spec.name = 'iris'
+    for length, count, name in rows:
+        example = request.input.example_list.examples.add()
+        example.features.feature['length'].float_list.value.append(length)
+        example.features.feature['count'].int64_list.value.append(count)
+        example.features.feature['name'].bytes_list.value.append(name)
+    return request
+
+
+class TestExampleCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.decoder = ExampleDecoder()
+
+    def test_example_per_row(self):
+        LOG.info("test one example per row")
+        request = classification_request([(1.5, 1, b'x'), (2.5, 2, b'y'), (3.5, 3, b'z')])
+        frame = self.decoder.decode(request.input)
+        self.assertEqual(['length', 'count', 'name'], list(frame.columns))
+        self.assertEqual(np.float32, frame['length'].dtype)
+        self.assertEqual(np.int64, frame['count'].dtype)
+        self.assertEqual([1.5, 2.5, 3.5], list(frame['length']))
+        self.assertEqual([1, 2, 3], list(frame['count']))
+        self.assertEqual([b'x', b'y', b'z'], list(frame['name']))
+
+    def test_single_columnar_example(self):
+        LOG.info("test a single example holding a column per feature, as before")
+        request = tensorflow__serving_dot_apis_dot_classification__pb2.ClassificationRequest()
+        example = request.input.example_list.examples.add()
+        example.features.feature['sepal length'].float_list.value.extend([5.1, 7.0, 6.3])
+        example.features.feature['sepal width'].float_list.value.extend([3.5, 3.2, 3.3])
+        example.features.feature['empty'].int64_list.value.extend([])
+        legacy = pd.DataFrame.from_records(list(zip([5.1, 7.0, 6.3], [3.5, 3.2, 3.3])),
+                                           columns=['sepal length', 'sepal width'])
+        frame = self.decoder.decode(request.input)
+        self.assertEqual(list(legacy.columns), list(frame.columns))
+        np.testing.assert_allclose(legacy.values, frame.values, rtol=1e-6)
+
+        example.features.feature['sepal width'].float_list.value.append(3.0)
+        self.assertRaises(ExampleCodecError, self.decoder.decode, request.input)
+
+    def test_multi_valued_feature(self):
+        request = tensorflow__serving_dot_apis_dot_classification__pb2.ClassificationRequest()
+        for values in ([1, 2], [3], []):
+            request.input.example_list.examples.add().features.feature['ids'].int64_list.value.extend(values)
+        request.input.example_list.examples[0].features.feature['ids'].int64_list.value.extend([])
+        frame = self.decoder.decode(request.input)
+        self.assertEqual([[1, 2], [3], []], [list(ids) for ids in frame['ids']])
+
+    def test_context_features(self):
+        request = tensorflow__serving_dot_apis_dot_classification__pb2.ClassificationRequest()
+        examples = request.input.example_list_with_context
+        for length in (1.0, 2.0):
+            examples.examples.add().features.feature['length'].float_list.value.append(length)
+        examples.context.features.feature['region'].bytes_list.value.append(b'eu')
+        frame = self.decoder.decode(request.input)
+        self.assertEqual(['length', 'region'], list(frame.columns))
+        self.assertEqual([b'eu', b'eu'], list(frame['region']))
+
+    def test_invalid_examples(self):
+        request = classification_request([(1.5, 1, b'x'), (2.5, 2, b'y')])
+        del request.input.example_list.examples[1].features.feature['count']
+        self.assertRaises(ExampleCodecError, self.decoder.decode, request.input)
+
+        request = classification_request([(1.5, 1, b'x'), (2.5, 2, b'y')])
+        request.input.example_list.examples[1].features.feature['count'].float_list.value.append(2.0)
+        self.assertRaises(ExampleCodecError, self.decoder.decode, request.input)
+
+        request = tensorflow__serving_dot_apis_dot_classification__pb2.ClassificationRequest()
+        self.assertRaises(ExampleCodecError, self.decoder.decode, request.input)
+
+    def test_layout_cached(self):
+        request = classification_request([(1.5, 1, b'x'), (2.5, 2, b'y')])
+        layout = self.decoder.layout(request.input.example_list.examples[0])
+        self.decoder.decode(classification_request([(3.5, 3, b'z'), (4.5, 4, b'w')]).input)
+        self.assertIs(layout, self.decoder.layout(request.input.example_list.examples[1]))
+
+        example = request.input.example_list.examples[0]
+        example.features.feature['extra'].int64_list.value.append(1)
+        self.assertEqual(('length', 'count', 'name', 'extra'), self.decoder.layout(example).names)
+
+    def test_layout_recomputed_when_kind_changes(self):
+        self.decoder.decode(classification_request([(1.5, 1, b'x'), (2.5, 2, b'y')]).input)
+        for rows in ([(1.5, 1, b'x'), (2.5, 2, b'y')], [(1.5, 1, b'x')]):
+            request = classification_request(rows)
+            for example in request.input.example_list.examples:
+                example.features.feature['count'].float_list.value.append(0.5)
+            frame = self.decoder.decode(request.input)
+            self.assertEqual(np.float32, frame['count'].dtype)
+            self.assertEqual([0.5] * len(rows), list(frame['count']))
+
+    def test_layout_kept_per_model(self):
+        LOG.info("test requests alternating between models keep the column layout of each")
+        models = {'iris': FakeModel(), 'other': FakeModel()}
+        servicer = multi_model_servicer(models)
+        iris = classification_request([(2.0, 1, b'x'), (4.0, 2, b'y')])
+        other = classification_request([(1.0, 1, b'x'), (3.0, 2, b'y')])
+        other.model_spec.name = 'other'
+        for example in other.input.example_list.examples:
+            example.features.feature['extra'].int64_list.value.append(7)
+        with authorized(servicer), \
+                mock.patch.object(example_codec, '_signature', wraps=example_codec._signature) as signature:
+            for _ in range(3):
+                servicer.Classify(iris, FakeContext())
+                servicer.Classify(other, FakeContext())
+        self.assertEqual(2, signature.call_count)
+        self.assertEqual(['length', 'count', 'name', 'extra'], list(models['other'].inputs.columns))
+
+    def test_label_table_kept_per_model(self):
+        LOG.info("test requests alternating between classification models keep the label table of each")
+        servicer = multi_model_servicer({'iris': FakeModel(), 'other': OtherModel()})
+        servicer.classify_top_k = 1
+        iris = classification_request([(2.0, 1, b'x')])
+        other = classification_request([(2.0, 1, b'x')])
+        other.model_spec.name = 'other'
+        label_table = response_codec.ClassificationEncoder._label_table
+        with authorized(servicer), \
+                mock.patch.object(response_codec.ClassificationEncoder, '_label_table', wraps=label_table) as built:
+            for _ in range(3):
+                iris_response = servicer.Classify(iris, FakeContext())
+                other_response = servicer.Classify(other, FakeContext())
+        self.assertEqual(2, built.call_count)
+        self.assertEqual(['Class-a'], [c.label for c in iris_response.result.classifications[0].classes])
+        self.assertEqual(['Class-e'], [c.label for c in other_response.result.classifications[0].classes])
+
+    def test_classify_scores_every_example(self):
+        LOG.info("test Classify returns a classification per example")
+        servicer = single_model_servicer(FakeModel())
+        request = classification_request([(2.0, 1, b'x'), (4.0, 2, b'y'), (8.0, 3, b'z')])
+        with authorized(servicer):
+            response = servicer.Classify(request, FakeContext())
+        self.assertEqual(3, len(servicer.model.inputs))
+        self.assertEqual(3, len(response.result.classifications))
+        self.assertEqual(['Class-a', 'Class-b'], [c.label for c in response.result.classifications[2].classes])
+        self.assertEqual([4.0, 2.0], [c.score for c in response.result.classifications[2].classes])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from mlfmodelserver import key_provider
+from mlfmodelserver.key_provider import KeyProvider
+from TestTokenValidator import public_key, public_key_2
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+def key_body(pem):
+    return ''.join(line.strip() for line in pem.strip().splitlines()[1:-1])
+
+
+class TestKeyProvider(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.key_file = os.path.join(self.directory, 'key.pem')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_key(self, content, mtime):
+        with open(self.key_file, 'w') as key_file:
+            key_file.write(content)
+        os.utime(self.key_file, (mtime, mtime))
+
+    def test_key_formats(self):
+        LOG.info("test PEM, single line PEM and bare base64 keys")
+        expected = key_provider.parse_validation_keys(public_key)
+        single_line = '-----BEGIN PUBLIC KEY-----' + key_body(public_key) + '-----END PUBLIC KEY-----'
+        self.assertEqual(expected, key_provider.parse_validation_keys(single_line))
+        self.assertEqual(expected, key_provider.parse_validation_keys(key_body(public_key)))
+        self.assertEqual(2, len(key_provider.parse_validation_keys(public_key + public_key_2).public_keys))
+
+    def test_env_key_parsed_once(self):
+        provider = KeyProvider()
+        with mock.patch.dict(os.environ, {'JWT_VALIDATION_KEY': public_key}), \
+                mock.patch.object(key_provider, 'load_public_keys',
+                                  side_effect=key_provider.load_public_keys) as load_public_keys:
+            keys = provider.keys()
+            self.assertIs(keys, provider.keys())
+            self.assertEqual(1, load_public_keys.call_count)
+            os.environ['JWT_VALIDATION_KEY'] = public_key_2
+            self.assertNotEqual(keys.fingerprint, provider.keys().fingerprint)
+            self.assertEqual(2, load_public_keys.call_count)
+
+    def test_file_reloaded_on_change(self):
+        LOG.info("test key rotation through a mounted file")
+        self.write_key(public_key, 1000)
+        provider = KeyProvider(key_file=self.key_file, check_interval_seconds=0)
+        first = provider.keys()
+        self.assertIs(first, provider.keys())
+
+        self.write_key(public_key_2, 2000)
+        second = provider.keys()
+        self.assertNotEqual(first.fingerprint, second.fingerprint)
+
+        self.write_key('not a key', 3000)
+        self.assertIs(second, provider.keys())
+
+    def test_check_interval(self):
+        self.write_key(public_key, 1000)
+        provider = KeyProvider(key_file=self.key_file, check_interval_seconds=60)
+        first = provider.keys()
+        self.write_key(public_key_2, 2000)
+        self.assertIs(first, provider.keys())
+
+    def test_missing_key(self):
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertRaises(key_provider.SecurityError, KeyProvider().keys)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import argparse
+import collections
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'benchmarks'))
+import loadgen  # noqa: E402
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+def measurement(requests_per_s=100.0, p99_ms=10.0, error_rate=0.0, **key):
+    result = {'target': 'sum', 'in_process': False, 'load': 'closed', 'level': 10, 'rows': None, 'batch_size': 0,
+              'requests_per_s': requests_per_s, 'p99_ms': p99_ms, 'error_rate': error_rate}
+    result.update(key)
+    return result
+
+
+class TestLoadgen(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_payloads(self, lines):
+        path = os.path.join(self.directory, 'payloads.jsonl')
+        with open(path, 'w') as payload_file:
+            payload_file.write('\n'.join(lines))
+        return path
+
+    def test_read_payloads(self):
+        LOG.info("test payload logs and warmup style inputs are read as Predict inputs")
+        path = self.write_payloads([
+            json.dumps({'model_name': 'iris', 'inputs': {'X': [[5.1, 3.5], [1.4, 0.2]]}}),
+            '',
+            json.dumps({'method': 'Classify', 'model_name': 'iris', 'inputs': {'X': [[1.0]]}}),
+            json.dumps({'signature_name': 'scores', 'inputs': {'X': {'dtype': 'int64', 'value': [1, 2]},
+                                                                'big': {'shape': [3, 4], 'dtype': 'float64'}}}),
+        ])
+        (name, signature, inputs), (other_name, other_signature, other_inputs) = loadgen.read_payloads(path)
+        self.assertEqual(('iris', ''), (name, signature))
+        self.assertEqual(np.float32, inputs['X'].dtype)
+        np.testing.assert_allclose([[5.1, 3.5], [1.4, 0.2]], inputs['X'], rtol=1e-6)
+        self.assertEqual((None, 'scores'), (other_name, other_signature))
+        self.assertEqual(np.int64, other_inputs['X'].dtype)
+        np.testing.assert_array_equal(np.zeros((3, 4)), other_inputs['big'])
+        self.assertEqual(np.float64, other_inputs['big'].dtype)
+        self.assertEqual(np.float64, loadgen.read_payloads(path, 'float64')[0][2]['X'].dtype)
+
+        empty = self.write_payloads([json.dumps({'method': 'Regress', 'inputs': {'X': [1.0]}})])
+        self.assertRaises(ValueError, loadgen.read_payloads, empty)
+
+    def test_summarize(self):
+        LOG.info("test latency percentiles, throughput and errors of a measurement")
+        codes = collections.Counter({'OK': 100, 'RESOURCE_EXHAUSTED': 20, 'DEADLINE_EXCEEDED': 5})
+        summary = loadgen.summarize([index / 1000.0 for index in range(1, 101)], codes, elapsed=2.0, sent=125)
+        self.assertEqual(125, summary['requests'])
+        self.assertEqual(50.0, summary['requests_per_s'])
+        self.assertAlmostEqual(50.5, summary['p50_ms'])
+        self.assertAlmostEqual(99.01, summary['p99_ms'])
+        self.assertEqual(0.2, summary['error_rate'])
+        self.assertEqual({'RESOURCE_EXHAUSTED': 20, 'DEADLINE_EXCEEDED': 5}, summary['errors'])
+
+        summary = loadgen.summarize([], collections.Counter(), elapsed=1.0, sent=0)
+        self.assertEqual((0, 0.0, 0.0, 0.0), (summary['requests'], summary['requests_per_s'], summary['p99_ms'],
+                                              summary['error_rate']))
+
+    def test_compare(self):
+        LOG.info("test measurements are compared with the baseline measurement of the same setup")
+        baseline = [measurement(), measurement(level=100, requests_per_s=500.0)]
+        comparison, = loadgen.compare([measurement(requests_per_s=95.0, p99_ms=10.5)], baseline, 0.1)
+        self.assertAlmostEqual(-0.05, comparison['requests_per_s_change'])
+        self.assertAlmostEqual(0.05, comparison['p99_ms_change'])
+        self.assertFalse(comparison['regression'])
+
+        regressions = loadgen.compare([measurement(requests_per_s=80.0), measurement(p99_ms=12.0),
+                                       measurement(error_rate=0.02)], baseline, 0.1)
+        self.assertEqual([True, True, True], [comparison['regression'] for comparison in regressions])
+
+        # a baseline saved without in_process measured a subprocess, in process results are not compared with it
+        old_baseline = [{key: value for key, value in measurement().items() if key != 'in_process'}]
+        self.assertEqual(1, len(loadgen.compare([measurement()], old_baseline, 0.1)))
+        self.assertEqual([], loadgen.compare([measurement(in_process=True)], old_baseline, 0.1))
+        self.assertEqual([], loadgen.compare([measurement(batch_size=8)], baseline, 0.1))
+
+    def test_in_process_server_restores_environment(self):
+        LOG.info("test the settings of an in process sweep are not left in the environment of the next one")
+        args = argparse.Namespace(target=loadgen.TARGET_SUM, in_process=True, server_env=['GRPC_MAX_WORKERS=3'])
+        server = mock.Mock()
+        with mock.patch.dict(os.environ, {'ENABLE_BATCHING': 'false'}), \
+                mock.patch.object(loadgen, 'load_model'), \
+                mock.patch('mlfmodelserver.grpc_server.GrpcServer') as grpc_server:
+            grpc_server.return_value.serve.return_value = server
+            os.environ.pop('GRPC_MAX_WORKERS', None)
+            with loadgen.model_server(args, batch_size=8):
+                self.assertEqual(('3', 'true', '8'), (os.environ['GRPC_MAX_WORKERS'], os.environ['ENABLE_BATCHING'],
+                                                      os.environ['BATCH_MAX_BATCH_SIZE']))
+            self.assertNotIn('GRPC_MAX_WORKERS', os.environ)
+            self.assertNotIn('BATCH_MAX_BATCH_SIZE', os.environ)
+            self.assertEqual('false', os.environ['ENABLE_BATCHING'])
+        server.stop.assert_called_once_with(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import io
+import json
+import logging
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from mlfmodelserver import grpc_server, log_pipeline
+
+from fakes import FakeContext, SumModel, authorized, predict_request, single_model_servicer
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+class BlockingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.release.wait(5)
+        return super().write(text)
+
+
+class TestLogPipeline(unittest.TestCase):
+
+    def logger(self, handler):
+        logger = logging.getLogger('test_log_pipeline.{}'.format(self.id()))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+        return logger
+
+    def test_json_lines(self):
+        LOG.info("test records are written by the writer thread as JSON lines with their extra fields")
+        stream = io.StringIO()
+        handler = log_pipeline.AsyncHandler(stream)
+        handler.setFormatter(log_pipeline.JsonFormatter(max_items=4))
+        logger = self.logger(handler)
+        logger.warning('Model %s loaded', 'iris', extra={'model_name': 'iris', 'inputs': np.arange(3)})
+        logger.info('big input', extra={'inputs': np.zeros((10, 2), dtype=np.float32)})
+        try:
+            raise ValueError('broken')
+        except ValueError:
+            logger.exception('failed')
+        handler.flush()
+
+        first, second, third = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(('WARNING', 'Model iris loaded', 'iris', [0, 1, 2]),
+                         (first['level'], first['message'], first['model_name'], first['inputs']))
+        self.assertEqual({'shape': [10, 2], 'dtype': 'float32'}, second['inputs'])
+        self.assertIn('ValueError: broken', third['exception'])
+
+    def test_full_queue_drops_records(self):
+        stream = BlockingStream()
+        handler = log_pipeline.AsyncHandler(stream, max_queue_size=1)
+        logger = self.logger(handler)
+        dropped = log_pipeline.DROPPED_RECORD_COUNTER.value(reason=log_pipeline.DROP_QUEUE_FULL)
+        for index in range(5):
+            logger.info('record %s', index)
+        self.assertGreaterEqual(log_pipeline.DROPPED_RECORD_COUNTER.value(reason=log_pipeline.DROP_QUEUE_FULL),
+                                dropped + 3)
+        stream.release.set()
+        handler.flush()
+        self.assertIn('record 0', stream.getvalue())
+
+    def test_error_flood_rate_limited(self):
+        LOG.info("test repeated errors are rate limited and the next one reports how many were suppressed")
+        stream = io.StringIO()
+        handler = log_pipeline.AsyncHandler(stream)
+        handler.setFormatter(log_pipeline.JsonFormatter())
+        handler.addFilter(log_pipeline.RateLimitFilter(rate_per_second=1, burst=2))
+        logger = self.logger(handler)
+        with mock.patch('time.monotonic', return_value=100.0):
+            for index in range(10):
+                logger.error('Request %s failed', index)
+            logger.error('Other failure')
+            logger.info('not limited')
+        with mock.patch('time.monotonic', return_value=101.0):
+            logger.error('Request %s failed', 10)
+        handler.flush()
+
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(['Request 0 failed', 'Request 1 failed', 'Other failure', 'not limited', 'Request 10 failed'],
+                         [record['message'] for record in records])
+        self.assertEqual(8, records[-1]['suppressed'])
+
+    def test_payloads_sampled(self):
+        LOG.info("test Predict logs no payload by default and the sampled ones on the payload logger")
+        servicer = single_model_servicer(SumModel())
+        with authorized(servicer), \
+                mock.patch.object(log_pipeline.PAYLOAD_LOG, 'info') as payload_info:
+            servicer.Predict(predict_request(), FakeContext())
+            self.assertFalse(payload_info.called)
+
+            with mock.patch.dict('os.environ', {'LOG_PAYLOAD_SAMPLE_RATE': '1'}):
+                servicer.payload_logger = log_pipeline.PayloadLogger.from_env()
+            servicer.Predict(predict_request(), FakeContext())
+        fields = payload_info.call_args[1]['extra']
+        self.assertEqual(('sum', 'Predict'), (fields['model_name'], fields['method']))
+        self.assertEqual([3.0, 3.0], list(fields['outputs']['col']))
+
+    def test_install_replaces_stdout_handlers(self):
+        logger = logging.getLogger('mlfmodelserver.test_install')
+        logger.addHandler(logging.StreamHandler(stream=sys.stdout))
+        self.addCleanup(logging.Logger.manager.loggerDict.pop, logger.name)
+        loggers = [installed for installed in logging.Logger.manager.loggerDict.values()
+                   if isinstance(installed, logging.Logger)]
+        handlers = [(installed, installed.handlers[:], installed.propagate) for installed in loggers]
+        self.addCleanup(self.restore, handlers)
+        with mock.patch.object(log_pipeline, '_INSTALLED', []):
+            handler = log_pipeline.install(stream=io.StringIO())
+            self.addCleanup(handler.close)
+            self.assertEqual([handler], logger.handlers)
+            self.assertIn(handler, grpc_server.LOG.handlers)
+            self.assertEqual([handler], log_pipeline.PAYLOAD_LOG.handlers)
+            self.assertIs(handler, log_pipeline.install())
+
+    @staticmethod
+    def restore(handlers):
+        for logger, logger_handlers, propagate in handlers:
+            logger.handlers[:] = logger_handlers
+            logger.propagate = propagate
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import logging
+import sys
+import threading
+import unittest
+import urllib.request
+from unittest import mock
+
+import grpc
+
+from mlfmodelserver import grpc_server, metrics, profiler
+
+from fakes import FakeContext, LinearModel, authorized, regression_request, single_model_servicer
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counts_of_all_threads(self):
+        LOG.info("test counters and histograms merge the values recorded by every thread, ended ones included")
+        counter = metrics.Counter('test_calls_total', 'Calls', label_names=('code',))
+        histogram = metrics.Histogram('test_call_ms', 'Call time', buckets=(1, 10))
+
+        def record():
+            for _ in range(1000):
+                counter.inc(code='OK')
+                histogram.observe(5)
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(code='UNKNOWN')
+        histogram.observe(50)
+
+        self.assertEqual(4000, counter.value(code='OK'))
+        self.assertEqual([(('OK',), 4000), (('UNKNOWN',), 1)], sorted(counter.collect()))
+        self.assertEqual([((), [0, 4000, 4001], 20050.0, 4001)], histogram.collect())
+
+    def test_exposition(self):
+        registered = {}
+        with mock.patch.object(metrics, '_REGISTRY', registered):
+            metrics.counter('test_requests_total', 'Requests\nserved', label_names=('model_name',)).inc(
+                model_name='a"b')
+            histogram = metrics.histogram('test_latency_ms', 'Latency', buckets=(0.5, 2))
+            histogram.observe(1)
+            metrics.gauge('test_queue_depth', 'Queued').set_function(lambda: 3)
+            self.assertEqual('\n'.join([
+                '# HELP test_latency_ms Latency',
+                '# TYPE test_latency_ms histogram',
+                'test_latency_ms_bucket{le="0.5"} 0',
+                'test_latency_ms_bucket{le="2"} 1',
+                'test_latency_ms_bucket{le="+Inf"} 1',
+                'test_latency_ms_sum 1',
+                'test_latency_ms_count 1',
+                '# HELP test_queue_depth Queued',
+                '# TYPE test_queue_depth gauge',
+                'test_queue_depth 3',
+                '# HELP test_requests_total Requests\\nserved',
+                '# TYPE test_requests_total counter',
+                'test_requests_total{model_name="a\\"b"} 1',
+                '']), metrics.exposition())
+            self.assertRaises(ValueError, metrics.gauge, 'test_requests_total', 'Requests')
+
+    def test_requests_by_status_code(self):
+        LOG.info("test requests are counted by status code, unknown model names without their name")
+        servicer = single_model_servicer(LinearModel())
+        ok = grpc_server.REQUEST_COUNTER.value(model_name='linear', method='Regress', code='OK')
+        unimplemented = grpc_server.REQUEST_COUNTER.value(model_name='', method='Regress', code='UNIMPLEMENTED')
+        unauthenticated = grpc_server.REQUEST_COUNTER.value(model_name='linear', method='Regress',
+                                                            code='UNAUTHENTICATED')
+        with authorized(servicer):
+            servicer.Regress(regression_request([(1.0, 0)], 'linear'), FakeContext())
+            context = FakeContext()
+            self.assertRaises(Exception, servicer.Regress, regression_request([(1.0, 0)], 'other'), context)
+            self.assertEqual(grpc.StatusCode.UNIMPLEMENTED, context.code)
+        with authorized(servicer, False):
+            self.assertIsNone(servicer.Regress(regression_request([(1.0, 0)], 'linear'), FakeContext()))
+
+        self.assertEqual(ok + 1, grpc_server.REQUEST_COUNTER.value(model_name='linear', method='Regress', code='OK'))
+        self.assertEqual(unimplemented + 1, grpc_server.REQUEST_COUNTER.value(model_name='', method='Regress',
+                                                                              code='UNIMPLEMENTED'))
+        self.assertEqual(unauthenticated + 1, grpc_server.REQUEST_COUNTER.value(model_name='linear', method='Regress',
+                                                                                code='UNAUTHENTICATED'))
+
+    def test_profiler_tags_without_unknown_model_names(self):
+        LOG.info("test profiler samples of requests for unknown models are tagged without their name")
+        servicer = single_model_servicer(LinearModel())
+        with authorized(servicer), \
+                mock.patch.object(profiler, 'tagged', wraps=profiler.tagged) as tagged:
+            servicer.Regress(regression_request([(1.0, 0)], 'linear'), FakeContext())
+            self.assertRaises(Exception, servicer.Regress, regression_request([(1.0, 0)], 'other model;x'),
+                              FakeContext())
+        self.assertEqual([mock.call('Regress', 'linear'), mock.call('Regress', '')], tagged.call_args_list)
+
+    def test_http_endpoint(self):
+        LOG.info("test the metrics are scraped over HTTP")
+        server = metrics.start_http_server(0, host='127.0.0.1')
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:{}/metrics'.format(server.server_address[1])
+        with urllib.request.urlopen(url, timeout=5) as response:
+            self.assertEqual(metrics.CONTENT_TYPE, response.headers['Content-Type'])
+            self.assertIn('# TYPE mlf_mc_requests_total counter', response.read().decode('utf-8'))
+
+
+if __name__ == "__main__":
+    unittest.main()
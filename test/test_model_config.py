@@ -0,0 +1,104 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from mlfmodelserver import model_config
+from mlfmodelserver.model_config import ModelConfigError, VersionPolicy, model_configs
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+dirname = os.path.dirname(__file__)
+
+MULTI_MODEL_CONFIG = """
+model_config_list: {
+  config: {
+    name: "iris",
+    base_path: "/models/iris",
+    model_platform: "python",
+    model_version_policy: { latest: { num_versions: 2 } }
+  }
+  config: {
+    name: 'churn'  # pinned versions
+    base_path: "/models/churn"
+    model_version_policy { specific { versions: 3 versions: 1 } }
+  }
+  config < name: "fraud" base_path: "/models/fraud" model_version_policy: { all: {} } >
+}
+"""
+
+
+class TestModelConfig(unittest.TestCase):
+
+    def test_model_config_list(self):
+        LOG.info("test every entry of the model_config_list with its version policy")
+        iris, churn, fraud = model_configs(MULTI_MODEL_CONFIG)
+        self.assertEqual(('iris', '/models/iris', 'python'), iris[:3])
+        self.assertEqual(VersionPolicy(model_config.POLICY_LATEST, 2, ()), iris.version_policy)
+        self.assertEqual(VersionPolicy(model_config.POLICY_SPECIFIC, None, (1, 3)), churn.version_policy)
+        self.assertEqual(model_config.POLICY_ALL, fraud.version_policy.kind)
+        self.assertTrue(model_config.serves_several_versions_or_models([iris]))
+
+    def test_single_model_config_files(self):
+        LOG.info("test the config files deployed so far, one without its last closing brace")
+        configs = model_config.read_model_configs(os.path.join(dirname, 'resources/classification/model_config.conf'))
+        self.assertEqual([model_config.ModelConfig('func.pkl', '../test/resources/classification', 'python',
+                                                   model_config.DEFAULT_VERSION_POLICY)], configs)
+        self.assertFalse(model_config.serves_several_versions_or_models(configs))
+        configs = model_config.read_model_configs(
+            os.path.join(dirname, 'resources/deployment_api_model_config/sample_model_config.conf'))
+        self.assertEqual('sklearn-model', configs[0].name)
+        self.assertEqual(model_config.POLICY_ALL, configs[0].version_policy.kind)
+
+    def test_version_policy_select(self):
+        available = [3, 1, 10, 2]
+        self.assertEqual([10], model_config.DEFAULT_VERSION_POLICY.select(available))
+        self.assertEqual([3, 10], VersionPolicy(model_config.POLICY_LATEST, 2, ()).select(available))
+        self.assertEqual([1, 2, 3, 10], VersionPolicy(model_config.POLICY_ALL, None, ()).select(available))
+        self.assertEqual([1, 10], VersionPolicy(model_config.POLICY_SPECIFIC, None, (1, 7, 10)).select(available))
+
+    def test_invalid_config(self):
+        self.assertRaises(ModelConfigError, model_configs, 'model_config_list { }')
+        self.assertRaises(ModelConfigError, model_configs, 'model_config_list { config { name: "a" } }')
+        self.assertRaises(ModelConfigError, model_configs, 'model_config_list { config { name: "a }')
+        self.assertRaises(ModelConfigError, model_configs,
+                          'model_config_list { config { name: "a" base_path: "/a" } config { name: "a" '
+                          'base_path: "/b" } }')
+        self.assertRaises(ModelConfigError, model_configs,
+                          'model_config_list { config { name: "a" base_path: "/a" '
+                          'model_version_policy { latest { num_versions: 0 } } } }')
+
+    def test_config_file_reloaded_on_change(self):
+        LOG.info("test a config file is parsed once and again when it changed")
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'models.config')
+        with open(path, 'w') as config:
+            config.write(MULTI_MODEL_CONFIG)
+        config_file = model_config.config_file(path)
+        self.assertIs(config_file, model_config.config_file(os.path.join(directory, '.', 'models.config')))
+        loaded = config_file.load()
+        self.assertIs(loaded, config_file.load())
+        self.assertEqual('/models/churn', loaded.model('churn').base_path)
+        self.assertIsNone(loaded.model('other'))
+        self.assertEqual({'name': 'iris', 'base_path': '/models/iris'}, model_config.get_model_spec(path))
+
+        with open(path, 'w') as config:
+            config.write('model_config_list { config { name: "other" base_path: "/models/other" } }')
+        os.utime(path, ns=(0, 1))
+        reloaded = config_file.load()
+        self.assertEqual(['other'], [config.name for config in reloaded.configs])
+
+        with open(path, 'w') as config:
+            config.write('model_config_list { config { name: "broken" } }')
+        os.utime(path, ns=(0, 2))
+        self.assertIs(reloaded, config_file.load())
+        self.assertRaises(FileNotFoundError, model_config.get_model_spec, os.path.join(directory, 'missing'))
+
+
+if __name__ == "__main__":
+    unittest.main()
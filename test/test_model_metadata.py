@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from concurrent import futures
+
+import grpc
+
+from mlfmodelserver import grpc_server, model_metadata, tensor_codec
+from mlfmodelserver.model_metadata import ModelMetadataCache, load_signature_def_map
+from tensorflow_serving.apis import get_model_metadata_pb2 as tensorflow__serving_dot_apis_dot_get__model__metadata__pb2
+from tensorflow_serving.apis import prediction_service_pb2_grpc as \
+    tensorflow__serving_dot_apis_dot_prediction_service__pb2_grpc
+
+from fakes import FakeContext, SumModel, authorized, single_model_servicer
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+SIGNATURE = {
+    'inputs': {'X': {'dtype': 'float32', 'shape': [-1, 3]}, 'name': {'dtype': 'string', 'shape': [-1]}},
+    'outputs': {'col': {'dtype': 'float64', 'shape': [-1]}},
+}
+
+
+def metadata_request(*fields):
+    request = tensorflow__serving_dot_apis_dot_get__model__metadata__pb2.GetModelMetadataRequest()
+    request.model_spec.name = 'sum'
+    request.metadata_field.extend(fields)
+    return request
+
+
+def parse_response(serialized):
+    return tensorflow__serving_dot_apis_dot_get__model__metadata__pb2.GetModelMetadataResponse.FromString(serialized)
+
+
+def unpack_signatures(response):
+    signature_map = tensorflow__serving_dot_apis_dot_get__model__metadata__pb2.SignatureDefMap()
+    response.metadata['signature_def'].Unpack(signature_map)
+    return signature_map
+
+
+class TestModelMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_json(self, file_name, content):
+        with open(os.path.join(self.directory, file_name), 'w') as json_file:
+            json.dump(content, json_file)
+
+    def test_signature_file(self):
+        LOG.info("test the signature declared in signature.json")
+        self.write_json(model_metadata.SIGNATURE_FILE, SIGNATURE)
+        predict_func = mock.Mock()
+        signature_def = load_signature_def_map(self.directory, predict_func).signature_def['serving_default']
+        self.assertEqual(model_metadata.PREDICT_METHOD_NAME, signature_def.method_name)
+        self.assertEqual(tensor_codec.DT_FLOAT, signature_def.inputs['X'].dtype)
+        self.assertEqual([-1, 3], [dim.size for dim in signature_def.inputs['X'].tensor_shape.dim])
+        self.assertEqual(tensor_codec.DT_STRING, signature_def.inputs['name'].dtype)
+        self.assertEqual(tensor_codec.DT_DOUBLE, signature_def.outputs['col'].dtype)
+        predict_func.assert_not_called()
+
+    def test_warmup_probe(self):
+        LOG.info("test the signature probed with a warmup request")
+        self.write_json(model_metadata.WARMUP_REQUEST_FILE, {'X': {'dtype': 'float32', 'value': [[1, 2, 3]]}})
+        signature_def = load_signature_def_map(self.directory, SumModel().wrapper_predict_func) \
+            .signature_def['serving_default']
+        self.assertEqual([-1, 3], [dim.size for dim in signature_def.inputs['X'].tensor_shape.dim])
+        self.assertEqual(tensor_codec.DT_FLOAT, signature_def.outputs['col'].dtype)
+        self.assertEqual([-1], [dim.size for dim in signature_def.outputs['col'].tensor_shape.dim])
+
+        self.assertIsNone(load_signature_def_map(self.directory, mock.Mock(side_effect=ValueError('bad input'))))
+        os.remove(os.path.join(self.directory, model_metadata.WARMUP_REQUEST_FILE))
+        self.assertIsNone(load_signature_def_map(self.directory, SumModel().wrapper_predict_func))
+
+    def test_invalid_signature(self):
+        self.assertRaises(model_metadata.ModelMetadataError, model_metadata.signature_def_map,
+                          {'inputs': {'X': {'dtype': 'complex256'}}})
+        self.assertRaises(model_metadata.ModelMetadataError, model_metadata.signature_def_map,
+                          {'inputs': {'X': {'shape': [1]}}})
+
+    def test_cache_rebuilt_on_version_change(self):
+        model = SumModel()
+        model.signature_def_map = model_metadata.signature_def_map(SIGNATURE)
+        cache = ModelMetadataCache()
+        serialized = cache.add(model)
+        self.assertIsInstance(serialized, bytes)
+        with mock.patch.object(model_metadata, 'metadata_response') as build:
+            self.assertIs(serialized, cache.response(model))
+        build.assert_not_called()
+        response = parse_response(serialized)
+        self.assertEqual(1, response.model_spec.version.value)
+        self.assertEqual(model.signature_def_map, unpack_signatures(response))
+
+        model.model_version = '2'
+        self.assertEqual(2, parse_response(cache.response(model)).model_spec.version.value)
+
+    def test_get_model_metadata(self):
+        LOG.info("test GetModelMetadata answers from the cached response")
+        servicer = single_model_servicer(SumModel())
+        with authorized(servicer):
+            context = FakeContext()
+            self.assertRaises(Exception, servicer.GetModelMetadata, metadata_request('signature_def'), context)
+            self.assertEqual(grpc.StatusCode.NOT_FOUND, context.code)
+
+            servicer.model = SumModel()
+            servicer.model.model_version = '3'
+            servicer.model.signature_def_map = model_metadata.signature_def_map(SIGNATURE)
+            response = parse_response(servicer.GetModelMetadata(metadata_request('signature_def'), FakeContext()))
+            self.assertEqual('sum', response.model_spec.name)
+            self.assertEqual(servicer.model.signature_def_map, unpack_signatures(response))
+
+            context = FakeContext()
+            self.assertRaises(Exception, servicer.GetModelMetadata, metadata_request('assets'), context)
+            self.assertEqual(grpc.StatusCode.INVALID_ARGUMENT, context.code)
+
+    def test_metadata_sent_as_serialized(self):
+        LOG.info("test the response serialized at load time is sent over gRPC as it is")
+        model = SumModel()
+        model.signature_def_map = model_metadata.signature_def_map(SIGNATURE)
+        with mock.patch.object(model_metadata, 'metadata_response', wraps=model_metadata.metadata_response) as build:
+            servicer = grpc_server.GrpcServer().create_servicer(model)
+            self.assertEqual(1, build.call_count)
+            server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+            server.add_generic_rpc_handlers((grpc_server.metadata_rpc_handler(servicer.GetModelMetadata),))
+            tensorflow__serving_dot_apis_dot_prediction_service__pb2_grpc.add_PredictionServiceServicer_to_server(
+                servicer, server)
+            port = server.add_insecure_port('127.0.0.1:0')
+            server.start()
+            self.addCleanup(server.stop, 0)
+            with grpc.insecure_channel('127.0.0.1:{}'.format(port)) as channel, \
+                    authorized(servicer):
+                stub = tensorflow__serving_dot_apis_dot_prediction_service__pb2_grpc.PredictionServiceStub(channel)
+                for _ in range(2):
+                    response = stub.GetModelMetadata(metadata_request('signature_def'), timeout=10)
+                    self.assertEqual(model.signature_def_map, unpack_signatures(response))
+            self.assertEqual(1, build.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,319 @@
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import weakref
+from unittest import mock
+
+import cloudpickle
+import grpc
+import numpy as np
+
+from mlfmodelserver import grpc_server, model_config, model_registry, python_grpc_server, tensor_codec
+from mlfmodelserver.model_config import ModelConfig, VersionPolicy, POLICY_ALL, DEFAULT_VERSION_POLICY
+from mlfmodelserver.model_registry import ModelNotFoundError, ModelRegistry
+from mlfmodelserver.stream_predict import StreamingServicer
+
+from fakes import FakeContext, authorized, predict_request
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+MODEL_BYTES = 100
+
+
+class ScaleModel(object):
+    """Multiplies its input by its version"""
+
+    def __init__(self, model_name, model_version):
+        self.model_name = model_name
+        self.model_version = model_version
+        self.warmed_up = False
+
+    def warmup(self):
+        self.warmed_up = True
+
+    def wrapper_predict_func(self, inputs):
+        return {'col': inputs['X'].sum(axis=1) * int(self.model_version)}
+
+
+class TestModelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.memory = 0
+        self.loads = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def model_config(self, name, versions, policy=DEFAULT_VERSION_POLICY):
+        base_path = os.path.join(self.directory, name)
+        for version in versions:
+            os.makedirs(os.path.join(base_path, str(version)))
+        return ModelConfig(name, base_path, 'python', policy)
+
+    def load(self, config, version):
+        if os.path.exists(os.path.join(config.base_path, version, 'broken')):
+            raise ValueError('cannot unpickle')
+        self.loads.append((config.name, version))
+        self.memory += MODEL_BYTES
+        return ScaleModel(config.name, version)
+
+    def registry(self, memory_budget_bytes=0, poll_seconds=0):
+        registry = ModelRegistry(self.load, memory_budget_bytes, memory_usage=lambda: self.memory,
+                                 poll_seconds=poll_seconds)
+        registry.add(self.model_config('a', [1, 2, 10], VersionPolicy(POLICY_ALL, None, ())))
+        registry.add(self.model_config('b', [1, 3]))
+        return registry
+
+    def test_single_model_policy_applied_on_request(self):
+        LOG.info("test a single model with a version policy is served from its base path unless enabled")
+        base_path = self.model_config('a', [1]).base_path
+        config_path = os.path.join(self.directory, 'model_config.conf')
+        with open(config_path, 'w') as config_file:
+            config_file.write('model_config_list: { config: { name: "a" base_path: "{}" '
+                              'model_version_policy: { all: {} } } }'.replace('{}', base_path))
+        with mock.patch.object(python_grpc_server, 'ModelContainer') as container, \
+                mock.patch.object(model_registry.ModelRegistry, 'load_all') as load_all, \
+                mock.patch.dict(os.environ, {'MODEL_VERSION_POLL_SECONDS': '0'}):
+            os.environ.pop('MODEL_VERSION_POLICY_ENABLED', None)
+            self.assertIs(container.return_value, python_grpc_server.load_models(config_path))
+            container.assert_called_once_with(config_path)
+            load_all.assert_not_called()
+            os.environ['MODEL_VERSION_POLICY_ENABLED'] = 'true'
+            self.assertIsInstance(python_grpc_server.load_models(config_path), model_registry.ModelRegistry)
+            load_all.assert_called_once_with()
+
+    def write_version_with_module(self, base_path, version, factor):
+        """Version whose func.pkl refers to predict of its modules/clash_helper.py by name"""
+        modules = os.path.join(base_path, version, 'modules')
+        os.makedirs(modules)
+        with open(os.path.join(modules, 'clash_helper.py'), 'w') as helper:
+            helper.write('FACTOR = {}\n\n\ndef predict(rows):\n    return [row * FACTOR for row in rows]\n'
+                         .format(factor))
+        sys.path.insert(0, modules)
+        try:
+            import clash_helper
+            with open(os.path.join(base_path, version, 'func.pkl'), 'wb') as func:
+                cloudpickle.dump(clash_helper.predict, func)
+        finally:
+            sys.path.remove(modules)
+            sys.modules.pop('clash_helper', None)
+
+    def test_versions_import_their_own_modules(self):
+        LOG.info("test two versions with a module of the same name each run their own module")
+        base_path = os.path.join(self.directory, 'clash')
+        self.write_version_with_module(base_path, '1', 1)
+        self.write_version_with_module(base_path, '2', 10)
+        self.addCleanup(sys.modules.pop, 'clash_helper', None)
+        config = ModelConfig('clash', base_path, 'python', VersionPolicy(POLICY_ALL, None, ()))
+        first = python_grpc_server.ModelContainer.for_version(config, '1')
+        second = python_grpc_server.ModelContainer.for_version(config, '2')
+        self.assertEqual([3], first.predict_func([3]))
+        self.assertEqual([30], second.predict_func([3]))
+        self.assertEqual([3], python_grpc_server.ModelContainer.for_version(config, '1').predict_func([3]))
+
+    def test_reloaded_version_runs_its_own_modules_once_warmed_up(self):
+        LOG.info("test a version picked up by the watcher runs its own module and its warmup request once")
+        base_path = os.path.join(self.directory, 'clash')
+        self.write_version_with_module(base_path, '1', 1)
+        self.addCleanup(sys.modules.pop, 'clash_helper', None)
+        registry = ModelRegistry(python_grpc_server.ModelContainer.for_version)
+        registry.add(ModelConfig('clash', base_path, 'python', DEFAULT_VERSION_POLICY))
+        registry.load_all()
+        self.write_version_with_module(base_path, '2', 10)
+        with open(os.path.join(base_path, '2', 'warmup_request.json'), 'w') as warmup:
+            json.dump({'X': [[1.0, 2.0]]}, warmup)
+        wrapper = python_grpc_server.ModelContainer.wrapper_predict_func
+        with mock.patch.object(python_grpc_server.ModelContainer, 'wrapper_predict_func', autospec=True,
+                               side_effect=wrapper) as predict:
+            registry.refresh()
+        model = registry.model(predict_request('clash').model_spec)
+        self.assertEqual('2', model.model_version)
+        self.assertEqual(1, predict.call_count)
+        self.assertIsNotNone(model.signature_def_map)
+        self.assertEqual([30], model.predict_func([3]))
+
+    def test_routing(self):
+        LOG.info("test requests are routed on model name and version, the latest version without one")
+        registry = self.registry()
+        registry.load_all()
+        self.assertEqual([('a', '10'), ('b', '3'), ('a', '2'), ('a', '1')], self.loads)
+        self.assertEqual('10', registry.model(predict_request('a').model_spec).model_version)
+        self.assertEqual('2', registry.model(predict_request('a', 2).model_spec).model_version)
+        self.assertEqual('3', registry.model(predict_request('b').model_spec).model_version)
+        self.assertRaises(ModelNotFoundError, registry.model, predict_request('b', 1).model_spec)
+        self.assertRaises(ModelNotFoundError, registry.model, predict_request('c').model_spec)
+        self.assertEqual(4, len(self.loads))
+
+    def test_least_recently_used_unloaded(self):
+        LOG.info("test cold versions are unloaded under the memory budget and loaded again on use")
+        registry = self.registry(memory_budget_bytes=2 * MODEL_BYTES)
+        registry.load_all()
+        self.assertEqual([('a', '10'), ('b', '3')], self.loads)
+        self.assertEqual(2 * MODEL_BYTES, registry.loaded_bytes())
+
+        registry.model(predict_request('a').model_spec)
+        with mock.patch('time.monotonic', return_value=1e12):
+            registry.model(predict_request('a', 1).model_spec)
+        self.assertEqual(('a', '1'), self.loads[-1])
+        self.assertEqual(2 * MODEL_BYTES, registry.loaded_bytes())
+        # b was used least recently
+        registry.model(predict_request('a').model_spec)
+        self.assertEqual(3, len(self.loads))
+        registry.model(predict_request('b').model_spec)
+        self.assertEqual(('b', '3'), self.loads[-1])
+
+    def test_reloaded_version_keeps_its_size(self):
+        LOG.info("test a version loaded again after an unload keeps the size measured on its first load")
+        registry = self.registry(memory_budget_bytes=2 * MODEL_BYTES)
+        registry.load_all()
+        registry.model(predict_request('a', 1).model_spec)
+        self.assertIsNone(registry._slots[('a', 10)].model)
+        # the memory freed by the unload stays with the process, loading the version again does not grow it
+        self.memory -= MODEL_BYTES
+        registry.load_func = lambda config, version: ScaleModel(config.name, version)
+        registry.model(predict_request('a').model_spec)
+        self.assertEqual(MODEL_BYTES, registry._slots[('a', 10)].size_bytes)
+        self.assertEqual(2 * MODEL_BYTES, registry.loaded_bytes())
+        self.assertIsNone(registry._slots[('b', 3)].model)
+
+    def test_wrapper_and_close(self):
+        registry = self.registry(memory_budget_bytes=MODEL_BYTES)
+        wrapped = []
+
+        def wrap(model):
+            proxy = mock.Mock(model_name=model.model_name, model_version=model.model_version)
+            wrapped.append(proxy)
+            return proxy
+
+        registry.load_all()
+        registry.use_wrapper(wrap)
+        self.assertIs(wrapped[0], registry.model(predict_request('a').model_spec))
+        registry.model(predict_request('b').model_spec)
+        wrapped[0].close.assert_called_once_with()
+        self.assertEqual(MODEL_BYTES, registry.loaded_bytes())
+
+    def test_unloaded_version_closed_outside_load_lock(self):
+        LOG.info("test closing an evicted version does not block the loads and lookups of other requests")
+        registry = self.registry(memory_budget_bytes=MODEL_BYTES)
+        registry.load_all()
+        lock_free_while_closing = []
+
+        class SlowClose(object):
+            def __init__(self, model):
+                self.model_name = model.model_name
+                self.model_version = model.model_version
+
+            def close(self):
+                acquire = threading.Thread(target=lambda: lock_free_while_closing.append(
+                    registry._load_lock.acquire(timeout=1) and registry._load_lock.release() is None))
+                acquire.start()
+                acquire.join()
+
+        registry.use_wrapper(SlowClose)
+        registry.model(predict_request('b').model_spec)
+        self.assertEqual([True], lock_free_while_closing)
+
+    def test_servicer_routes_requests(self):
+        LOG.info("test Predict and StreamPredict on a servicer serving a registry")
+        registry = self.registry()
+        servicer = grpc_server.GrpcServer().create_servicer(registry)
+        with authorized(servicer):
+            for name, version, expected in (('a', None, 30.0), ('a', 2, 6.0), ('b', None, 9.0)):
+                response = servicer.Predict(predict_request(name, version), FakeContext())
+                self.assertEqual(expected, float(tensor_codec.decode_tensor(response.outputs['col'])[0]))
+
+            context = FakeContext()
+            self.assertRaises(Exception, servicer.Predict, predict_request('a', 5), context)
+            self.assertEqual(grpc.StatusCode.NOT_FOUND, context.code)
+
+            responses = StreamingServicer(servicer).predict_batch(
+                [predict_request('a'), predict_request('a', 1), predict_request('c')])
+            self.assertEqual(30.0, float(tensor_codec.decode_tensor(responses[0].response.outputs['col'])[0]))
+            self.assertEqual(3.0, float(tensor_codec.decode_tensor(responses[1].response.outputs['col'])[0]))
+            self.assertEqual(grpc.StatusCode.NOT_FOUND.value[0], responses[2].error_code)
+
+    def test_refresh_swaps_new_version(self):
+        LOG.info("test a new version is loaded and warmed up, then replaces the old one")
+        registry = self.registry()
+        registry.load_all()
+        retired = []
+        registry.on_retire(lambda name, version: retired.append((name, version)))
+        in_flight = registry.model(predict_request('b').model_spec)
+        released = weakref.ref(in_flight)
+
+        os.makedirs(os.path.join(self.directory, 'b', '5'))
+        registry.refresh()
+        model = registry.model(predict_request('b').model_spec)
+        self.assertEqual('5', model.model_version)
+        self.assertTrue(model.warmed_up)
+        self.assertEqual([('b', '3')], retired)
+        self.assertRaises(ModelNotFoundError, registry.model, predict_request('b', 3).model_spec)
+        # the call still running on the old version finishes with it, then it is freed
+        self.assertEqual({'col': 6.0}, {k: v[0] for k, v in in_flight.wrapper_predict_func(
+            {'X': np.ones((1, 2))}).items()})
+        del in_flight
+        self.assertIsNone(released())
+
+        broken = os.path.join(self.directory, 'b', '7')
+        os.makedirs(broken)
+        open(os.path.join(broken, 'broken'), 'w').close()
+        registry.refresh()
+        self.assertEqual('5', registry.model(predict_request('b').model_spec).model_version)
+        self.assertEqual([1, 2, 10], registry.served_versions('a'))
+
+        shutil.rmtree(os.path.join(self.directory, 'a', '10'))
+        registry.refresh()
+        self.assertEqual([1, 2], registry.served_versions('a'))
+        self.assertEqual('2', registry.model(predict_request('a').model_spec).model_version)
+
+    def test_models_added_and_removed_from_config(self):
+        LOG.info("test models added to the config file are served and removed ones retired")
+        self.model_config('a', [1])
+        self.model_config('c', [2])
+        path = os.path.join(self.directory, 'models.config')
+
+        def write_config(names, mtime_ns):
+            with open(path, 'w') as config:
+                config.write('model_config_list {' + ''.join(
+                    ' config {{ name: "{}" base_path: "{}" }}'.format(name, os.path.join(self.directory, name))
+                    for name in names) + ' }')
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+
+        write_config(['a'], 1)
+        registry = ModelRegistry(self.load, memory_usage=lambda: self.memory)
+        registry.use_config_file(model_config.ConfigFile(path))
+        retired = []
+        registry.on_retire(lambda name, version: retired.append((name, version)))
+        self.assertEqual('1', registry.model(predict_request('a').model_spec).model_version)
+
+        write_config(['c'], 2)
+        registry.refresh()
+        self.assertEqual('2', registry.model(predict_request('c').model_spec).model_version)
+        self.assertRaises(ModelNotFoundError, registry.model, predict_request('a').model_spec)
+        self.assertEqual([('a', '1')], retired)
+
+    def test_watcher_picks_up_versions(self):
+        LOG.info("test the watcher of a servicer's registry swaps in a new version")
+        registry = self.registry(poll_seconds=0.01)
+        servicer = grpc_server.GrpcServer().create_servicer(registry)
+        self.addCleanup(registry.stop_watcher)
+        os.makedirs(os.path.join(self.directory, 'b', '4'))
+        deadline = time.monotonic() + 5
+        while registry.served_versions('b') != [4] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with authorized(servicer):
+            response = servicer.Predict(predict_request('b'), FakeContext())
+        self.assertEqual(12.0, float(tensor_codec.decode_tensor(response.outputs['col'])[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import logging
+import os
+import sys
+import threading
+import unittest
+from concurrent import futures
+from unittest import mock
+
+import grpc
+
+from mlfmodelserver import grpc_server, tensor_codec
+
+from fakes import FakeContext, SumModel, authorized, predict_request, single_model_servicer
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+class TestPredictPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.servicer = single_model_servicer(SumModel())
+        self.servicer.auth_executor = futures.ThreadPoolExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.servicer.auth_executor.shutdown()
+
+    def test_decode_overlaps_authorization(self):
+        LOG.info("test inputs are decoded while the token is validated")
+        auth_started = threading.Event()
+        decode_done = threading.Event()
+        decode_inputs = tensor_codec.decode_inputs
+
+        def validations(request, context):
+            auth_started.set()
+            # authorization only finishes once decoding ran, which deadlocks a sequential pipeline
+            return decode_done.wait(5)
+
+        def decode(tensor_map):
+            self.assertTrue(auth_started.wait(5))
+            decoded = decode_inputs(tensor_map)
+            decode_done.set()
+            return decoded
+
+        auth_wait_count = self.stage_count('auth_wait')
+        with mock.patch.object(self.servicer, '_Validations', side_effect=validations), \
+                mock.patch.object(tensor_codec, 'decode_inputs', side_effect=decode):
+            response = self.servicer.Predict(predict_request(), FakeContext())
+        self.assertEqual([3.0, 3.0], list(tensor_codec.decode_tensor(response.outputs['col'])))
+        self.assertEqual(auth_wait_count + 1, self.stage_count('auth_wait'))
+
+    def test_unauthorized_request_never_reaches_model(self):
+        with mock.patch.object(self.servicer, '_Validations', side_effect=grpc_server.SecurityError('denied')):
+            self.assertRaises(Exception, self.servicer.Predict, predict_request(), FakeContext())
+        with authorized(self.servicer, False):
+            self.assertIsNone(self.servicer.Predict(predict_request(), FakeContext()))
+        self.assertEqual(0, self.servicer.model.calls)
+
+    def test_authorization_error_wins_over_decode_error(self):
+        request = predict_request()
+        request.inputs['X'].dtype = 9999
+        with mock.patch.object(self.servicer, '_Validations', side_effect=grpc_server.SecurityError('denied')):
+            with self.assertRaises(Exception) as raised:
+                self.servicer.Predict(request, FakeContext())
+        self.assertNotIn('dtype', str(raised.exception))
+
+    def test_sequential_without_auth_executor(self):
+        servicer = single_model_servicer(SumModel())
+        with authorized(servicer):
+            servicer.Predict(predict_request(), FakeContext())
+        self.assertEqual(1, servicer.model.calls)
+
+    def test_token_validated_when_enabled(self):
+        LOG.info("test the token is only validated with ENABLE_TOKEN_VALIDATION, a failure is UNAUTHENTICATED")
+        with mock.patch.object(grpc_server.TokenValidator, 'validate_token') as validate_token:
+            self.assertTrue(self.servicer._Validations(predict_request(), FakeContext()))
+            validate_token.assert_not_called()
+
+            with mock.patch.dict(os.environ, {'ENABLE_TOKEN_VALIDATION': 'true'}):
+                self.assertTrue(grpc_server.GrpcServer().create_servicer(SumModel()).validate_tokens)
+            self.servicer.validate_tokens = True
+            validate_token.return_value = (True, 'Bearer token')
+            self.servicer.Predict(predict_request(), FakeContext())
+            self.assertEqual(1, self.servicer.model.calls)
+
+            validate_token.side_effect = grpc_server.SecurityError('Token expired!')
+            context = FakeContext()
+            self.assertRaises(Exception, self.servicer.Predict, predict_request(), context)
+            self.assertEqual(grpc.StatusCode.UNAUTHENTICATED, context.code)
+            self.assertEqual(1, self.servicer.model.calls)
+        self.assertEqual(2, validate_token.call_count)
+
+    @staticmethod
+    def stage_count(stage):
+        for labels, _, _, count in grpc_server.PREDICT_STAGE_HISTOGRAM.collect():
+            if labels == ('sum', stage):
+                return count
+        return 0
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import logging
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from mlfmodelserver import prediction_cache
+from mlfmodelserver.prediction_cache import PredictionCache
+from mlfmodelserver.tensor_codec import encode_tensor
+from tensorflow_serving.apis import predict_pb2 as tensorflow__serving_dot_apis_dot_predict__pb2
+
+from fakes import FakeContext, SumModel, predict_request, single_model_servicer
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+def predict_response(size):
+    response = tensorflow__serving_dot_apis_dot_predict__pb2.PredictResponse()
+    encode_tensor(np.zeros(size, dtype=np.uint8), response.outputs['col'])
+    return response
+
+
+class TestPredictionCache(unittest.TestCase):
+
+    def test_request_key(self):
+        LOG.info("test cache key from the request content and model version")
+        first = predict_request(X=[[1, 2]], Y=[[3]])
+        second = tensorflow__serving_dot_apis_dot_predict__pb2.PredictRequest()
+        second.model_spec.name = 'sum'
+        second.inputs['Y'].CopyFrom(first.inputs['Y'])
+        second.inputs['X'].CopyFrom(first.inputs['X'])
+        self.assertEqual(prediction_cache.request_key(first, '1'), prediction_cache.request_key(second, '1'))
+        self.assertNotEqual(prediction_cache.request_key(first, '1'), prediction_cache.request_key(first, '2'))
+        self.assertNotEqual(prediction_cache.request_key(first, '1'),
+                            prediction_cache.request_key(predict_request(X=[[1, 3]], Y=[[3]]), '1'))
+
+    def test_lru_eviction_under_byte_budget(self):
+        size = predict_response(1000).ByteSize() + 16 + prediction_cache._ENTRY_OVERHEAD_BYTES
+        cache = PredictionCache(max_bytes=2 * size)
+        evictions = prediction_cache.EVICTION_COUNTER.value(model_name='sum', reason=prediction_cache.EVICTION_SIZE)
+        self.assertIsNone(cache.get(b'a' * 16, 'sum', '1'))
+        cache.put(b'a' * 16, 'sum', '1', predict_response(1000))
+        cache.put(b'b' * 16, 'sum', '1', predict_response(1000))
+        self.assertIsNotNone(cache.get(b'a' * 16, 'sum', '1'))
+        cache.put(b'c' * 16, 'sum', '1', predict_response(1000))
+        self.assertIsNone(cache.get(b'b' * 16, 'sum', '1'))
+        self.assertIsNotNone(cache.get(b'a' * 16, 'sum', '1'))
+        self.assertEqual(2 * size, cache.size_bytes)
+        self.assertEqual(evictions + 1, prediction_cache.EVICTION_COUNTER.value(
+            model_name='sum', reason=prediction_cache.EVICTION_SIZE))
+
+    def test_model_ttl(self):
+        cache = PredictionCache(max_bytes=1 << 20, ttl_seconds=60, model_ttl_seconds={'sum': 5})
+        with mock.patch.object(prediction_cache.time, 'monotonic', return_value=100.0):
+            for model_name in ('sum', 'other'):
+                self.assertIsNone(cache.get(model_name.encode(), model_name, '1'))
+                cache.put(model_name.encode(), model_name, '1', predict_response(10))
+        with mock.patch.object(prediction_cache.time, 'monotonic', return_value=106.0):
+            self.assertIsNone(cache.get(b'sum', 'sum', '1'))
+            self.assertIsNotNone(cache.get(b'other', 'other', '1'))
+
+    def test_versions_served_side_by_side(self):
+        LOG.info("test requests alternating between versions keep their entries until a version is retired")
+        cache = PredictionCache(max_bytes=1 << 20)
+        cache.put(b'key1', 'sum', '1', predict_response(10))
+        cache.put(b'key2', 'sum', '2', predict_response(10))
+        cache.put(b'other', 'other', '1', predict_response(10))
+        for _ in range(5):
+            self.assertIsNotNone(cache.get(b'key1', 'sum', '1'))
+            self.assertIsNotNone(cache.get(b'key2', 'sum', '2'))
+
+        cache.invalidate('sum', '1')
+        self.assertIsNone(cache.get(b'key1', 'sum', '1'))
+        self.assertIsNotNone(cache.get(b'key2', 'sum', '2'))
+        cache.invalidate('sum')
+        self.assertEqual(1, len(cache))
+
+    def test_servicer_predict_uses_cache(self):
+        LOG.info("test Predict serves repeated requests from the cache")
+        servicer = single_model_servicer(SumModel())
+        servicer.prediction_cache = PredictionCache(max_bytes=1 << 20)
+        request = predict_request(X=[[1, 2], [3, 4]])
+
+        first = servicer.Predict(request, FakeContext())
+        second = servicer.Predict(request, FakeContext())
+        self.assertEqual(1, servicer.model.calls)
+        self.assertEqual(first, second)
+        servicer.Predict(request, FakeContext([(prediction_cache.BYPASS_HEADER, 'true')]))
+        self.assertEqual(2, servicer.model.calls)
+
+        servicer.model.model_version = '2'
+        servicer.Predict(request, FakeContext())
+        self.assertEqual(3, servicer.model.calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
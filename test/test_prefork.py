@@ -0,0 +1,115 @@
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+from mlfmodelserver import grpc_server, prefork
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+def cgroup_files(files):
+    return mock.patch.object(prefork, '_read_first_line', side_effect=lambda path: files.get(path))
+
+
+class PidServer(object):
+    """Writes the pid of the worker to a pipe, then serves until it is terminated"""
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+
+    def start(self, model, port):
+        os.write(self.pipe, '{}\n'.format(os.getpid()).encode('ascii'))
+        time.sleep(60)
+
+
+class TestPrefork(unittest.TestCase):
+
+    def test_cpu_quota_cgroup_v2(self):
+        LOG.info("test cpu quota from cgroup v2 cpu.max")
+        with cgroup_files({'/sys/fs/cgroup/cpu.max': '250000 100000'}):
+            self.assertEqual(2.5, prefork.cpu_quota())
+        with cgroup_files({'/sys/fs/cgroup/cpu.max': 'max 100000'}):
+            self.assertIsNone(prefork.cpu_quota())
+
+    def test_cpu_quota_cgroup_v1(self):
+        with cgroup_files({'/sys/fs/cgroup/cpu/cpu.cfs_quota_us': '150000',
+                           '/sys/fs/cgroup/cpu/cpu.cfs_period_us': '100000'}):
+            self.assertEqual(1.5, prefork.cpu_quota())
+        with cgroup_files({'/sys/fs/cgroup/cpu/cpu.cfs_quota_us': '-1',
+                           '/sys/fs/cgroup/cpu/cpu.cfs_period_us': '100000'}):
+            self.assertIsNone(prefork.cpu_quota())
+
+    def test_worker_count_auto_rounds_quota_up(self):
+        with cgroup_files({'/sys/fs/cgroup/cpu.max': '150000 100000'}), \
+                mock.patch.object(prefork.os, 'sched_getaffinity', return_value=set(range(8)), create=True):
+            self.assertEqual(2, prefork.worker_count('auto'))
+
+    def test_worker_count_explicit(self):
+        self.assertEqual(4, prefork.worker_count('4'))
+        self.assertRaises(ValueError, prefork.worker_count, '0')
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_killed_worker_is_restarted(self):
+        LOG.info("test a worker killed by a signal is replaced by a new worker process")
+        read_end, write_end = os.pipe()
+        pids = os.fdopen(read_end)
+        self.addCleanup(pids.close)
+        self.addCleanup(os.close, write_end)
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+        supervisor = prefork.PreforkSupervisor(lambda: PidServer(write_end), 1)
+        started = []
+
+        def kill_first_worker():
+            started.append(int(pids.readline()))
+            os.kill(started[0], signal.SIGKILL)
+            started.append(int(pids.readline()))
+            supervisor._stop(signal.SIGTERM, None)
+
+        killer = threading.Thread(target=kill_first_worker, daemon=True)
+        killer.start()
+        with mock.patch.object(prefork, '_MIN_HEALTHY_LIFETIME_SECONDS', 0):
+            supervisor.serve(model=None, port=0)
+        killer.join(5)
+        self.assertEqual(2, len(started))
+        self.assertNotEqual(started[0], started[1])
+        self.assertEqual({}, supervisor.workers)
+
+    def test_server_stops_gracefully_on_sigterm(self):
+        LOG.info("test SIGTERM lets the RPCs in flight finish instead of killing the server")
+        self.addCleanup(signal.signal, signal.SIGTERM, signal.getsignal(signal.SIGTERM))
+        server = mock.Mock()
+        rpc_server = grpc_server.GrpcServer()
+        rpc_server.stop_grace_seconds = 5
+        serving = threading.Event()
+
+        def serve(model, port):
+            serving.set()
+            return server
+
+        def terminate():
+            serving.wait(5)
+            # the handler is installed right after serve returns
+            deadline = time.monotonic() + 5
+            while signal.getsignal(signal.SIGTERM) in (signal.SIG_DFL, None) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            # without a handler SIGTERM would end the test run, SIGINT ends only the server
+            graceful = signal.getsignal(signal.SIGTERM) not in (signal.SIG_DFL, None)
+            os.kill(os.getpid(), signal.SIGTERM if graceful else signal.SIGINT)
+
+        threading.Thread(target=terminate, daemon=True).start()
+        with mock.patch.object(rpc_server, 'serve', side_effect=serve):
+            rpc_server.start(model=None, port=0)
+        server.stop.assert_called_once_with(5)
+        server.stop.return_value.wait.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from mlfmodelserver import metrics, profiler
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+def burn_cpu(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.stop = threading.Event()
+        self.addCleanup(self.stop.set)
+
+    def start_request_thread(self):
+        def serve():
+            with profiler.tagged('Predict', 'iris'):
+                burn_cpu(self.stop)
+
+        threading.Thread(target=serve, daemon=True).start()
+        threading.Thread(target=self.stop.wait, name='idle-thread', daemon=True).start()
+
+    def test_record_tagged_threads(self):
+        LOG.info("test the stacks of request threads are sampled with their method and model")
+        self.start_request_thread()
+        counts = profiler.record(0.2, interval_seconds=0.005)
+        stacks = [stack for stack in counts if 'burn_cpu' in stack]
+        self.assertTrue(stacks)
+        self.assertTrue(all(stack.startswith('Predict;iris;') for stack in counts))
+        self.assertIn('test_profiler.py:burn_cpu', stacks[0].split(';'))
+
+        counts = profiler.record(0.05, all_threads=True)
+        self.assertTrue(any(stack.startswith('idle-thread;') for stack in counts))
+        line = profiler.format_collapsed({'a;b': 3}).strip()
+        self.assertEqual('a;b 3', line)
+
+    def test_separators_in_labels_are_replaced(self):
+        LOG.info("test spaces and ';' in tags and thread names do not split the collapsed stacks")
+
+        def serve():
+            with profiler.tagged('Predict', 'my model;v2'):
+                burn_cpu(self.stop)
+
+        threading.Thread(target=serve, daemon=True).start()
+        threading.Thread(target=self.stop.wait, name='idle thread;1', daemon=True).start()
+        counts = profiler.record(0.1, all_threads=True)
+        self.assertTrue(any(stack.startswith('Predict;my_model_v2;') for stack in counts))
+        self.assertTrue(any(stack.startswith('idle_thread_1;') for stack in counts))
+        for line in profiler.format_collapsed(counts).splitlines():
+            self.assertEqual(2, len(line.split(' ')))
+
+    def test_continuous_profiler(self):
+        LOG.info("test the continuous profiler keeps rolling windows and bounds its overhead")
+        self.start_request_thread()
+        continuous = profiler.ContinuousProfiler(overhead=0.01, min_interval_seconds=0.001, window_seconds=0.05,
+                                                 windows=3)
+        continuous.start()
+        time.sleep(0.3)
+        continuous.stop()
+        continuous.join(5)
+        self.assertTrue(any('burn_cpu' in stack for stack in continuous.aggregate()))
+        self.assertEqual(3, len(continuous._windows))
+        self.assertGreater(continuous.interval_seconds, 0.001)
+
+    def test_profile_endpoint(self):
+        LOG.info("test a profile is recorded on request over the metrics port")
+        self.start_request_thread()
+        metrics.add_endpoint(profiler.PROFILE_PATH, profiler._profile_endpoint)
+        server = metrics.start_http_server(0, host='127.0.0.1')
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:{}{}'.format(server.server_address[1], profiler.PROFILE_PATH)
+        with urllib.request.urlopen(url + '?seconds=0.1', timeout=5) as response:
+            self.assertIn('Predict;iris;', response.read().decode('utf-8'))
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            urllib.request.urlopen(url + '?seconds=1000', timeout=5)
+        self.assertEqual(400, raised.exception.code)
+        for interval in ('0', '-1', '2'):
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                urllib.request.urlopen(url + '?seconds=1&interval=' + interval, timeout=5)
+            self.assertEqual(400, raised.exception.code)
+
+    @unittest.skipUnless(hasattr(signal, 'SIGUSR2'), 'needs SIGUSR2')
+    def test_signal_writes_profile(self):
+        LOG.info("test SIGUSR2 writes a profile file without stopping the process")
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.start_request_thread()
+        previous = profiler.install_signal_handler(seconds=0.1, directory=directory)
+        self.addCleanup(signal.signal, signal.SIGUSR2, previous)
+        os.kill(os.getpid(), signal.SIGUSR2)
+        deadline = time.monotonic() + 5
+        while not self.profiles(directory) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        path, = self.profiles(directory)
+        with open(path) as profile:
+            self.assertIn('Predict;iris;', profile.read())
+
+    @staticmethod
+    def profiles(directory):
+        return [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.collapsed')]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import logging
+import sys
+import unittest
+from unittest import mock
+
+import grpc
+import numpy as np
+import pandas as pd
+
+from mlfmodelserver.response_codec import encode_regressions, regression_values
+from tensorflow_serving.apis import regression_pb2 as tensorflow__serving_dot_apis_dot_regression__pb2
+
+from fakes import FakeContext, LinearModel, authorized, regression_request, single_model_servicer
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+class TestRegress(unittest.TestCase):
+
+    def setUp(self):
+        self.servicer = single_model_servicer(LinearModel())
+
+    def test_regress_every_example(self):
+        LOG.info("test Regress calls the regression function once for all examples")
+        rows = [(float(index), index % 3) for index in range(500)]
+        with authorized(self.servicer):
+            response = self.servicer.Regress(regression_request(rows), FakeContext())
+        self.assertEqual(1, self.servicer.model.calls)
+        self.assertEqual([x * 2 + y for x, y in rows], [r.value for r in response.result.regressions])
+
+    def test_model_without_regression(self):
+        self.servicer.model = mock.Mock(spec=['model_name'], model_name='sum')
+        context = FakeContext()
+        with authorized(self.servicer):
+            self.assertRaises(Exception, self.servicer.Regress, regression_request([(1.0, 1)]), context)
+        self.assertEqual(grpc.StatusCode.UNIMPLEMENTED, context.code)
+
+    def test_unauthorized(self):
+        with authorized(self.servicer, False):
+            self.assertIsNone(self.servicer.Regress(regression_request([(1.0, 1)]), FakeContext()))
+        self.assertEqual(0, self.servicer.model.calls)
+
+    def test_encode_regressions(self):
+        for count in (0, 3, 1000):
+            values = np.random.rand(count).astype(np.float32)
+            result = tensorflow__serving_dot_apis_dot_regression__pb2.RegressionResult()
+            encode_regressions(values, result)
+            expected = tensorflow__serving_dot_apis_dot_regression__pb2.RegressionResult()
+            for value in values:
+                expected.regressions.add().value = value
+            self.assertEqual(expected, result)
+
+    def test_regression_values(self):
+        self.assertEqual([1.0, 2.0], list(regression_values(pd.Series([1, 2]))))
+        self.assertEqual([1.0, 2.0], list(regression_values(np.array([[1.0], [2.0]]))))
+        self.assertEqual([1.0, 2.0], list(regression_values(pd.DataFrame({'value': [1.0, 2.0]}))))
+        self.assertRaises(ValueError, regression_values, {'a': [1.0], 'b': [2.0]})
+        self.assertRaises(ValueError, regression_values, np.ones((2, 2)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import logging
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from mlfmodelserver.response_codec import ClassificationEncoder, score_matrix
+from tensorflow_serving.apis import classification_pb2 as tensorflow__serving_dot_apis_dot_classification__pb2
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+def reference_result(outputs, rows):
+    """ClassificationResult built a Class message at a time"""
+    result = tensorflow__serving_dot_apis_dot_classification__pb2.ClassificationResult()
+    for idx in range(rows):
+        classification = result.classifications.add()
+        for k, v in outputs.items():
+            class_data = classification.classes.add()
+            class_data.label = "Class-" + k
+            class_data.score = v[idx]
+    return result
+
+
+class TestResponseCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.scores = np.random.default_rng(7).random((50, 6)).astype(np.float32)
+        # labels of different lengths, one long enough for a two byte length prefix
+        self.outputs = {name: pd.Series(self.scores[:, index])
+                        for index, name in enumerate(['a', 'bb', 'setosa', 'virginica', 'x' * 200, 'zero'])}
+        self.outputs['zero'][:] = 0.0
+
+    def encode(self, encoder, outputs):
+        result = tensorflow__serving_dot_apis_dot_classification__pb2.ClassificationResult()
+        encoder.encode(*score_matrix(outputs), result)
+        return result
+
+    def test_matches_message_per_class(self):
+        LOG.info("test the bulk encoding equals a Class message per score")
+        result = self.encode(ClassificationEncoder(), self.outputs)
+        self.assertEqual(reference_result(self.outputs, 50), result)
+
+    def test_top_k(self):
+        LOG.info("test only the k best classes of each row are returned, best first")
+        result = self.encode(ClassificationEncoder(top_k=2), self.outputs)
+        names = list(self.outputs)
+        scores = np.column_stack([self.outputs[name] for name in names])
+        for row, classification in enumerate(result.classifications):
+            best = np.argsort(-scores[row], kind='stable')[:2]
+            self.assertEqual(["Class-" + names[index] for index in best], [c.label for c in classification.classes])
+            self.assertEqual([float(scores[row, index]) for index in best], [c.score for c in classification.classes])
+
+        self.assertEqual(reference_result(self.outputs, 50), self.encode(ClassificationEncoder(top_k=10), self.outputs))
+
+    def test_labels_cached(self):
+        encoder = ClassificationEncoder()
+        table = encoder.labels(('a', 'b'))
+        self.assertIs(table, encoder.labels(('a', 'b')))
+        self.assertEqual(('Class-a', 'Class-c'), encoder.labels(('a', 'c')).labels)
+
+    def test_score_matrix(self):
+        keys, scores = score_matrix(np.array([[0.1, 0.9], [0.8, 0.2]]))
+        self.assertEqual(('0', '1'), keys)
+        self.assertEqual(np.float32, scores.dtype)
+        keys, scores = score_matrix(pd.DataFrame({'no': [0.1, 0.8], 'yes': [0.9, 0.2]}))
+        self.assertEqual(('no', 'yes'), keys)
+        self.assertEqual((2, 2), scores.shape)
+
+    def test_invalid_scores(self):
+        result = tensorflow__serving_dot_apis_dot_classification__pb2.ClassificationResult()
+        self.assertRaises(ValueError, ClassificationEncoder().encode, ('a',), np.zeros((2, 2)), result)
+        self.assertRaises(ValueError, ClassificationEncoder, -1)
+        ClassificationEncoder().encode(('a',), np.zeros((0, 1)), result)
+        self.assertEqual(0, len(result.classifications))
+
+
+if __name__ == "__main__":
+    unittest.main()
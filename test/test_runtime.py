@@ -0,0 +1,54 @@
+import importlib.util
+import json
+import logging
+import os
+import subprocess
+import sys
+import unittest
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+# runs in a fresh interpreter, the test process has imported tensorflow already
+LITE_IMPORT = '''
+import json
+import sys
+import mlfmodelserver.grpc_server
+from mlfmodelserver import runtime
+
+placeholder = sys.modules.get('tensorflow')
+before = {
+    'deferred': getattr(placeholder, '__mlf_deferred__', False),
+    'runtime_modules': sorted(name for name in sys.modules if name.startswith('tensorflow.python')),
+}
+tf = runtime.tensorflow()
+after = {
+    'same_module': tf is placeholder,
+    'deferred': getattr(tf, '__mlf_deferred__', False),
+    'constant': float(tf.constant(2.0).numpy()),
+}
+print(json.dumps({'before': before, 'after': after}))
+'''
+
+
+@unittest.skipIf(importlib.util.find_spec('tensorflow') is None, 'needs tensorflow')
+class TestRuntime(unittest.TestCase):
+
+    def test_lite_runtime_defers_tensorflow(self):
+        LOG.info("test the lite runtime serves without initializing tensorflow and initializes it on demand")
+        env = dict(os.environ, MLF_LITE_RUNTIME='true')
+        output = subprocess.run([sys.executable, '-c', LITE_IMPORT], env=env, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, universal_newlines=True, timeout=300)
+        self.assertEqual(0, output.returncode, output.stderr)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        # only the tensorflow.core protos are loaded, into a package whose __init__ has not run
+        self.assertTrue(result['before']['deferred'])
+        self.assertEqual([], result['before']['runtime_modules'])
+        self.assertTrue(result['after']['same_module'])
+        self.assertFalse(result['after']['deferred'])
+        self.assertEqual(2.0, result['after']['constant'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import sys
+import threading
+import unittest
+from concurrent import futures
+from unittest import mock
+
+import grpc
+import numpy as np
+from grpc import aio
+
+from mlfmodelserver import grpc_server, stream_predict, tensor_codec
+from mlfmodelserver.aio_server import AioStreamingServicer
+from mlfmodelserver.stream_predict import StreamingServicer
+from mlfmodelserver.streaming import streaming_predict_pb2_grpc
+from mlfmodelserver.tensor_codec import encode_tensor
+from tensorflow_serving.apis import predict_pb2 as tensorflow__serving_dot_apis_dot_predict__pb2
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+class SumModel(object):
+    model_name = 'sum'
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def wrapper_predict_func(self, inputs):
+        self.calls += 1
+        self.release.wait(5)
+        if (inputs['X'] < 0).any():
+            raise ValueError('negative input')
+        return {'col': inputs['X'].sum(axis=1)}
+
+
+def predict_request(value, name='sum'):
+    request = tensorflow__serving_dot_apis_dot_predict__pb2.PredictRequest()
+    request.model_spec.name = name
+    encode_tensor(np.full((1, 3), value, dtype=np.float32), request.inputs['X'])
+    return request
+
+
+def predicted(response):
+    return float(tensor_codec.decode_tensor(response.response.outputs['col'])[0])
+
+
+class TestStreamPredict(unittest.TestCase):
+
+    def setUp(self):
+        self.servicer = grpc_server.Servicer()
+        self.servicer.model = SumModel()
+        self.validations = mock.patch.object(self.servicer, '_Validations', return_value=True)
+        self.validate = self.validations.start()
+        self.streaming = StreamingServicer(self.servicer, max_batch_size=16)
+
+    def tearDown(self):
+        self.validations.stop()
+
+    def serve(self):
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+        streaming_predict_pb2_grpc.add_StreamingPredictionServiceServicer_to_server(self.streaming, server)
+        port = server.add_insecure_port('127.0.0.1:0')
+        server.start()
+        self.addCleanup(server.stop, None)
+        channel = grpc.insecure_channel('127.0.0.1:{}'.format(port))
+        self.addCleanup(channel.close)
+        return streaming_predict_pb2_grpc.StreamingPredictionServiceStub(channel)
+
+    def test_responses_in_order_and_batched(self):
+        LOG.info("test a stream is authorized once, answered in order and batched")
+        stub = self.serve()
+        model = self.servicer.model
+        model.release.clear()
+        sent = threading.Event()
+
+        def requests():
+            for value in range(50):
+                yield predict_request(value)
+            sent.set()
+
+        responses = stub.StreamPredict(requests())
+        # the first call blocks until every request is queued, the rest are scored in batches
+        sent.wait(5)
+        model.release.set()
+        self.assertEqual([value * 3.0 for value in range(50)], [predicted(response) for response in responses])
+        self.assertEqual(1, self.validate.call_count)
+        self.assertLess(model.calls, 10)
+
+    def test_failing_request_does_not_end_stream(self):
+        stub = self.serve()
+        unknown = stream_predict.STREAM_REQUEST_COUNTER.value(model_name='', code='UNIMPLEMENTED')
+        responses = list(stub.StreamPredict(iter([predict_request(1), predict_request(-1), predict_request(2),
+                                                  predict_request(1, name='other')])))
+        self.assertEqual(3.0, predicted(responses[0]))
+        self.assertEqual(grpc.StatusCode.INTERNAL.value[0], responses[1].error_code)
+        self.assertIn('negative input', responses[1].error_message)
+        self.assertEqual(6.0, predicted(responses[2]))
+        self.assertEqual(grpc.StatusCode.UNIMPLEMENTED.value[0], responses[3].error_code)
+        self.assertEqual(unknown + 1, stream_predict.STREAM_REQUEST_COUNTER.value(model_name='', code='UNIMPLEMENTED'))
+        self.assertEqual(0, stream_predict.STREAM_REQUEST_COUNTER.value(model_name='other', code='UNIMPLEMENTED'))
+
+    def test_unauthorized_stream_aborted(self):
+        stub = self.serve()
+        self.validate.side_effect = grpc_server.SecurityError('denied')
+        with self.assertRaises(grpc.RpcError) as raised:
+            list(stub.StreamPredict(iter([predict_request(1)])))
+        self.assertEqual(grpc.StatusCode.UNAUTHENTICATED, raised.exception.code())
+        self.assertEqual(0, self.servicer.model.calls)
+
+    def test_aio_stream(self):
+        LOG.info("test StreamPredict on the asyncio server")
+        executor = futures.ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+
+        async def stream():
+            server = aio.server()
+            streaming_predict_pb2_grpc.add_StreamingPredictionServiceServicer_to_server(
+                AioStreamingServicer(self.streaming, executor), server)
+            port = server.add_insecure_port('127.0.0.1:0')
+            await server.start()
+            try:
+                async with aio.insecure_channel('127.0.0.1:{}'.format(port)) as channel:
+                    stub = streaming_predict_pb2_grpc.StreamingPredictionServiceStub(channel)
+                    call = stub.StreamPredict(iter([predict_request(value) for value in range(20)]))
+                    return [predicted(response) async for response in call]
+            finally:
+                await server.stop(None)
+
+        self.assertEqual([value * 3.0 for value in range(20)], asyncio.run(stream()))
+        self.assertEqual(1, self.validate.call_count)
+
+    def test_aio_reader_ends_with_cancelled_stream(self):
+        LOG.info("test the reader of an asyncio stream ends when the stream is cancelled with a full queue")
+        executor = futures.ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        streaming = StreamingServicer(self.servicer, max_batch_size=1, read_ahead=1)
+
+        async def requests():
+            for value in range(10):
+                yield predict_request(value)
+
+        async def cancel_after_first_response():
+            context = mock.Mock(time_remaining=lambda: None, invocation_metadata=lambda: ())
+            responses = AioStreamingServicer(streaming, executor).StreamPredict(requests(), context)
+            await responses.__anext__()
+            await asyncio.sleep(0.05)
+            await responses.aclose()
+            await asyncio.sleep(0.05)
+            return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+        self.assertEqual([], asyncio.run(cancel_after_first_response()))
+
+
+if __name__ == "__main__":
+    unittest.main()
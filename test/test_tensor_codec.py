@@ -0,0 +1,135 @@
+import logging
+import sys
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+# pylint: disable=E0611
+from tensorflow.python.framework import tensor_util
+
+from mlfmodelserver import tensor_codec
+from mlfmodelserver.tensor_codec import decode_tensor, encode_tensor, encode_outputs, TensorCodecError
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+NUMERIC_VALUES = [
+    np.arange(12, dtype=np.float32).reshape(3, 4),
+    np.arange(6, dtype=np.float64).reshape(2, 3),
+    np.arange(5, dtype=np.int32),
+    np.arange(5, dtype=np.int64),
+    np.arange(4, dtype=np.int16),
+    np.arange(4, dtype=np.int8),
+    np.arange(4, dtype=np.uint8),
+    np.arange(4, dtype=np.uint16),
+    np.arange(4, dtype=np.uint32),
+    np.arange(4, dtype=np.uint64),
+    np.arange(6, dtype=np.float16),
+    np.array([True, False, True]),
+    np.array([1 + 2j, 3 - 1j], dtype=np.complex64),
+    np.array([1 + 2j, 3 - 1j], dtype=np.complex128),
+]
+
+
+class TestTensorCodec(unittest.TestCase):
+
+    def assert_same_as_make_ndarray(self, tensor):
+        expected = tensor_util.MakeNdarray(tensor)
+        actual = decode_tensor(tensor, decode_strings=False)
+        self.assertEqual(expected.shape, actual.shape)
+        self.assertEqual(expected.dtype, actual.dtype)
+        np.testing.assert_array_equal(expected, actual)
+
+    def test_decode_tensor_content(self):
+        LOG.info("test decoding tensor_content for every numeric dtype")
+        for value in NUMERIC_VALUES:
+            self.assert_same_as_make_ndarray(tf.make_tensor_proto(value))
+
+    def test_decode_typed_values(self):
+        LOG.info("test decoding the typed *_val fields for every numeric dtype")
+        for value in NUMERIC_VALUES:
+            tensor = tf.make_tensor_proto(value.tolist(), dtype=tf.as_dtype(value.dtype), shape=value.shape)
+            self.assert_same_as_make_ndarray(tensor)
+
+    def test_decode_tensor_content_is_read_only_view(self):
+        tensor = tf.make_tensor_proto(np.ones((2, 784), dtype=np.float32))
+        decoded = decode_tensor(tensor)
+        self.assertFalse(decoded.flags.writeable)
+        self.assertEqual((2, 784), decoded.shape)
+
+    def test_decode_fills_shape_with_last_value(self):
+        self.assert_same_as_make_ndarray(tf.make_tensor_proto(1.0, shape=[2, 3]))
+        self.assert_same_as_make_ndarray(tf.make_tensor_proto([1.0, 2.0], shape=[2, 3]))
+
+    def test_decode_strings(self):
+        tensor = tf.make_tensor_proto([u'héllo', u'world'])
+        np.testing.assert_array_equal(np.array([u'héllo', u'world']), decode_tensor(tensor))
+        self.assert_same_as_make_ndarray(tensor)
+
+    def test_decode_non_utf8_strings_as_bytes(self):
+        tensor = tf.make_tensor_proto([b'\xff\xfe'])
+        self.assertEqual(b'\xff\xfe', decode_tensor(tensor)[0])
+
+    def test_decode_bfloat16(self):
+        tensor = tf.make_tensor_proto(np.array([1.0, 2.5], dtype=tf.bfloat16.as_numpy_dtype))
+        np.testing.assert_array_equal(np.array([1.0, 2.5], dtype=np.float32), decode_tensor(tensor))
+
+    def test_decode_too_many_values(self):
+        tensor = tf.make_tensor_proto([1.0, 2.0, 3.0])
+        tensor.tensor_shape.dim[0].size = 2
+        tensor.ClearField('tensor_content')
+        tensor.float_val.extend([1.0, 2.0, 3.0])
+        self.assertRaises(TensorCodecError, decode_tensor, tensor)
+
+    def assert_same_as_make_tensor_proto(self, values):
+        expected = tf.make_tensor_proto(values)
+        actual = encode_tensor(values, tf.make_tensor_proto(0))
+        self.assertEqual(expected.dtype, actual.dtype)
+        self.assertEqual(expected.tensor_shape, actual.tensor_shape)
+        np.testing.assert_array_equal(tensor_util.MakeNdarray(expected), tensor_util.MakeNdarray(actual))
+
+    def test_encode_numeric(self):
+        LOG.info("test encoding numeric outputs to tensor_content")
+        for value in NUMERIC_VALUES:
+            self.assert_same_as_make_tensor_proto(value)
+
+    def test_encode_pandas_and_python_values(self):
+        self.assert_same_as_make_tensor_proto(pd.Series([0.25, 0.75]))
+        self.assert_same_as_make_tensor_proto(pd.Series([1, 2, 3]))
+        self.assert_same_as_make_tensor_proto([1, 2, 3])
+        self.assert_same_as_make_tensor_proto([[1.5, 2.5]])
+        self.assert_same_as_make_tensor_proto([2 ** 40])
+        self.assert_same_as_make_tensor_proto(3.5)
+
+    def test_encode_strings(self):
+        tensor = encode_tensor(pd.Series([u'héllo', u'world']), tf.make_tensor_proto(0))
+        self.assertEqual([u'héllo'.encode('utf-8'), b'world'], list(tensor.string_val))
+        self.assertEqual(tf.string.as_datatype_enum, tensor.dtype)
+        self.assertEqual(2, tensor.tensor_shape.dim[0].size)
+
+    def test_encode_outputs_round_trip(self):
+        outputs = pd.DataFrame({'col': np.arange(100000, dtype=np.float64)})
+        tensor_map = {'col': tf.make_tensor_proto(0)}
+        encode_outputs(outputs, tensor_map)
+        np.testing.assert_array_equal(outputs['col'].values, decode_tensor(tensor_map['col']))
+
+    def test_data_type(self):
+        LOG.info("test DataType of numpy dtypes and their names, string kinds as DT_STRING")
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            for dtype in ('string', 'bytes', 'str', np.dtype('S3'), np.dtype('U3'), np.dtype(object), object):
+                self.assertEqual(tensor_codec.DT_STRING, tensor_codec.data_type(dtype))
+            for dtype in ('float32', np.float32, np.dtype('float32'), np.dtype('>f4')):
+                self.assertEqual(tensor_codec.DT_FLOAT, tensor_codec.data_type(dtype))
+            self.assertRaises(TensorCodecError, tensor_codec.data_type, np.dtype('datetime64[D]'))
+
+    def test_encode_unsupported_dtype(self):
+        self.assertRaises(TensorCodecError, encode_tensor, np.array(['2018-01-01'], dtype='datetime64[D]'),
+                          tf.make_tensor_proto(0))
+
+
+if __name__ == "__main__":
+    unittest.main()
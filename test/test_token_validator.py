@@ -0,0 +1,69 @@
+import collections
+import logging
+import os
+import sys
+import unittest
+from unittest import mock
+
+from mlpkitsecurity import SecurityError
+from mlfmodelserver import token_validator
+from mlfmodelserver.token_validator import TokenValidator, VerifiedTokenCache
+from TestTokenValidator import public_key, public_key_2, token_expired_in_2085
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+Metadatum = collections.namedtuple('Metadatum', ['key', 'value'])
+
+
+def validate(access_token):
+    return TokenValidator(None, [Metadatum('authorization', access_token)]).validate_token()
+
+
+class TestTokenValidator(unittest.TestCase):
+
+    def setUp(self):
+        token_validator.VERIFIED_TOKENS.clear()
+        self.env = mock.patch.dict(os.environ, {'JWT_VALIDATION_KEY': public_key.strip(),
+                                                'SCOPES_REQUIRED': 'mlptestclient'})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+
+    def test_verified_token_is_cached(self):
+        LOG.info("test repeated tokens are not verified again")
+        self.assertEqual((True, token_expired_in_2085), validate(token_expired_in_2085))
+        with mock.patch.object(token_validator.JWTTokenManager, '_offline_validate') as offline_validate:
+            hits = token_validator.TOKEN_CACHE_HIT_COUNTER.value()
+            self.assertEqual((True, token_expired_in_2085), validate(token_expired_in_2085))
+            offline_validate.assert_not_called()
+            self.assertEqual(hits + 1, token_validator.TOKEN_CACHE_HIT_COUNTER.value())
+
+    def test_cached_token_checks_required_scope(self):
+        validate(token_expired_in_2085)
+        os.environ['SCOPES_REQUIRED'] = 'other-scope'
+        self.assertRaises(SecurityError, validate, token_expired_in_2085)
+
+    def test_key_change_invalidates_cache(self):
+        validate(token_expired_in_2085)
+        self.assertEqual(1, len(token_validator.VERIFIED_TOKENS))
+        os.environ['JWT_VALIDATION_KEY'] = public_key_2.strip()
+        self.assertRaises(Exception, validate, token_expired_in_2085)
+        self.assertEqual(0, len(token_validator.VERIFIED_TOKENS))
+
+    def test_cache_expiry_and_size_limit(self):
+        cache = VerifiedTokenCache(max_entries=2)
+        for token in ('a', 'b', 'c'):
+            cache.put(token, b'key', {'exp': 2000, 'zid': 'uaa', 'scope': ['read']})
+        self.assertEqual(2, len(cache))
+        with mock.patch.object(token_validator.time, 'time', return_value=1000):
+            self.assertIsNone(cache.get('a', b'key'))
+            self.assertEqual('uaa', cache.get('c', b'key').zone_id)
+        with mock.patch.object(token_validator.time, 'time', return_value=2000):
+            self.assertIsNone(cache.get('c', b'key'))
+
+
+if __name__ == "__main__":
+    unittest.main()
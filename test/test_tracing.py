@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from mlfmodelserver import admission, tracing
+
+from fakes import FakeContext, authorized, predict_request, single_model_servicer
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.INFO)
+LOG.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT_ID = '00f067aa0ba902b7'
+
+
+class SlowModel(object):
+    model_name = 'slow'
+
+    def wrapper_predict_func(self, inputs):
+        with tracing.span('feature_lookup', rows=2):
+            time.sleep(0.05)
+        return {'col': inputs['X'].sum(axis=1)}
+
+
+class ListExporter(object):
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = ListExporter()
+        self.servicer = single_model_servicer(SlowModel())
+        self.servicer.tracer = tracing.Tracer(self.exporter, sample_ratio=0)
+
+    def test_traceparent(self):
+        self.assertEqual((int(TRACE_ID, 16), int(PARENT_ID, 16), True),
+                         tracing.parse_traceparent('00-{}-{}-01'.format(TRACE_ID, PARENT_ID)))
+        self.assertFalse(tracing.parse_traceparent('00-{}-{}-00'.format(TRACE_ID, PARENT_ID))[2])
+        for invalid in ('00-{}-{}'.format(TRACE_ID, PARENT_ID), '00-{}-{}-01'.format('0' * 32, PARENT_ID),
+                        'ff-{}-{}-01'.format(TRACE_ID, PARENT_ID), '00-{}-{}-zz'.format(TRACE_ID, PARENT_ID)):
+            self.assertIsNone(tracing.parse_traceparent(invalid), invalid)
+
+    def test_predict_stages_joined_to_incoming_trace(self):
+        LOG.info("test a sampled caller's trace gets the stage spans of Predict and the spans of the model")
+        context = FakeContext((('traceparent', '00-{}-{}-01'.format(TRACE_ID, PARENT_ID)),))
+        executor = admission.AdmissionExecutor(admission.AdmissionController(max_workers=1))
+        self.addCleanup(executor.shutdown)
+        with authorized(self.servicer):
+            executor.submit(self.servicer.Predict, predict_request('slow'), context).result()
+
+        spans = {span.name: span for span in self.exporter.spans}
+        rpc_span = spans['tensorflow.serving.PredictionService/Predict']
+        self.assertEqual(int(TRACE_ID, 16), rpc_span.trace_id)
+        self.assertEqual(int(PARENT_ID, 16), rpc_span.parent_id)
+        self.assertEqual(['queue_wait', 'auth', 'decode', 'model', 'encode'],
+                         [span.name for span in rpc_span.children])
+        self.assertEqual(rpc_span.start_ns, spans['queue_wait'].start_ns)
+        self.assertEqual(spans['model'].span_id, spans['feature_lookup'].parent_id)
+        self.assertEqual({'rows': 2}, spans['feature_lookup'].attributes)
+        self.assertGreaterEqual(spans['model'].duration_ms(), 50)
+        self.assertEqual(0, rpc_span.attributes['rpc.grpc.status_code'])
+        self.assertEqual(tracing.STATUS_UNSET, rpc_span.status)
+
+    def test_unsampled_requests_not_exported(self):
+        with authorized(self.servicer):
+            self.servicer.Predict(predict_request('slow'), FakeContext())
+            self.servicer.Predict(predict_request('slow'), FakeContext(
+                (('traceparent', '00-{}-{}-00'.format(TRACE_ID, PARENT_ID)),)))
+        self.assertEqual([], self.exporter.spans)
+
+    def test_failed_request_span(self):
+        self.servicer.tracer.sample_ratio = 1
+        request = predict_request('other')
+        with authorized(self.servicer):
+            self.assertRaises(Exception, self.servicer.Predict, request, FakeContext())
+        rpc_span = self.exporter.spans[-1]
+        self.assertEqual(['auth'], [span.name for span in rpc_span.children])
+        self.assertEqual(tracing.STATUS_ERROR, rpc_span.status)
+        self.assertEqual(12, rpc_span.attributes['rpc.grpc.status_code'])
+
+    def test_file_export(self):
+        LOG.info("test sampled spans are written in batches of OTLP/JSON lines")
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'traces.jsonl')
+        exporter = tracing.BatchExporter(tracing.FileWriter(path), max_batch_size=2, schedule_delay_seconds=10)
+        tracer = tracing.Tracer(exporter)
+        for _ in range(3):
+            with tracer.start_rpc('Predict') as rpc_span:
+                rpc_span.set_attribute('model_name', 'slow')
+        exporter.shutdown()
+
+        with open(path) as traces:
+            lines = [json.loads(line) for line in traces]
+        self.assertEqual([2, 1], [len(line['resourceSpans'][0]['scopeSpans'][0]['spans']) for line in lines])
+        span = lines[0]['resourceSpans'][0]['scopeSpans'][0]['spans'][0]
+        self.assertEqual(tracing.SPAN_KIND_SERVER, span['kind'])
+        self.assertEqual([{'key': 'model_name', 'value': {'stringValue': 'slow'}}], span['attributes'])
+        self.assertLessEqual(int(span['startTimeUnixNano']), int(span['endTimeUnixNano']))
+        self.assertLess(abs(int(span['endTimeUnixNano']) / 1e9 - time.time()), 60)
+
+    def test_otlp_export(self):
+        LOG.info("test batches are posted to an OTLP/HTTP collector")
+        received = []
+
+        class Collector(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received.append((self.path, self.headers['Content-Type'],
+                                 json.loads(self.rfile.read(int(self.headers['Content-Length'])))))
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        collector = HTTPServer(('127.0.0.1', 0), Collector)
+        threading.Thread(target=collector.serve_forever, daemon=True).start()
+        self.addCleanup(collector.server_close)
+        self.addCleanup(collector.shutdown)
+
+        endpoint = 'http://127.0.0.1:{}/v1/traces'.format(collector.server_address[1])
+        exporter = tracing.BatchExporter(tracing.OtlpHttpWriter(endpoint, 'test-service'), schedule_delay_seconds=0.01)
+        with tracing.Tracer(exporter).start_rpc('Regress'):
+            pass
+        exporter.shutdown()
+
+        (path, content_type, body), = received
+        self.assertEqual(('/v1/traces', 'application/json'), (path, content_type))
+        resource_spans = body['resourceSpans'][0]
+        self.assertEqual({'stringValue': 'test-service'}, resource_spans['resource']['attributes'][0]['value'])
+        self.assertEqual('Regress', resource_spans['scopeSpans'][0]['spans'][0]['name'])
+
+
+if __name__ == "__main__":
+    unittest.main()